@@ -0,0 +1,13 @@
+'''
+Load-test benchmark for the subscription servers.
+
+Builds a throwaway HYSTERIA_DIR with a synthetic user base, a self-signed
+certificate and matching config.json/.configs.env, starts one of the
+subscription servers against it on 127.0.0.1, drives it with keep-alive HTTPS
+clients and reports latency percentiles, throughput, and the server's CPU time
+and memory. Nothing leaves localhost, so runs on different commits of the same
+machine are comparable:
+
+    cd /etc/hysteria/core
+    python3 -m benchmark --users 1000,10000,100000 --concurrency 64 --output before.json
+'''
@@ -0,0 +1,152 @@
+'''
+python3 -m benchmark [options]: runs one scenario per --users value and prints
+(or writes with --output) latency percentiles, throughput, server CPU and RSS.
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+
+import click
+
+from . import fixtures, load, server
+
+DEFAULT_PATHS = {
+    'subscription': ('/sub/{username}?format=singbox', '/sub/{username}?format=base64'),
+    'singbox': ('/sub/singbox/{username}/4',),
+    'normalsub': ('/sub/normal/{username}',),
+}
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(result: dict, duration: float, cpu: float, peak_rss: int) -> dict:
+    latencies = sorted(result['latencies'])
+    count = len(latencies)
+    if count >= 2:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0
+    return {
+        'requests': count,
+        'errors': sum(result['errors'].values()),
+        'error_types': dict(result['errors']),
+        'statuses': {str(status): n for status, n in sorted(result['statuses'].items())},
+        'requests_per_second': round(count / duration, 1),
+        'megabytes_per_second': round(result['bytes'] / duration / 1e6, 2),
+        'latency_ms': {
+            'p50': round(p50 * 1000, 2),
+            'p95': round(p95 * 1000, 2),
+            'p99': round(p99 * 1000, 2),
+            'max': round(latencies[-1] * 1000, 2) if latencies else 0,
+        },
+        'server_cpu_seconds': round(cpu, 2),
+        'server_cpu_percent': round(cpu / duration * 100, 1),
+        'server_peak_rss_mb': round(peak_rss / 2 ** 20, 1),
+    }
+
+
+def run_scenario(options: dict, users: int, root: str) -> dict:
+    prefix = os.path.join(root, f'users-{users}')
+    click.echo(f"Preparing {users} users ({options['storage']}) in {prefix}...", err=True)
+    files = fixtures.make_prefix(prefix, users, options['storage'])
+    templates = options['paths'] or DEFAULT_PATHS[options['server']]
+    # A bounded sample keeps the client's random.choice cheap; the server still sees spread-out users
+    usernames = files['usernames'][:: max(1, users // 5000)]
+    paths = [template.format(username=username) for username in usernames for template in templates]
+    headers = {'Accept-Encoding': options['accept_encoding']}
+
+    with server.ServerProcess(options['server'], prefix, files['certfile'], files['keyfile'], options['workers']) as proc:
+        click.echo(f"Running {options['server']} on {proc.base_url} for {options['warmup']}s + {options['duration']}s...", err=True)
+        started = {}
+        timer = threading.Timer(options['warmup'], lambda: started.update(cpu=proc.usage()[0], at=time.perf_counter()))
+        timer.start()
+        proc.start_sampling()
+        result = load.run(
+            proc.base_url, paths, options['concurrency'], options['duration'], options['warmup'],
+            headers, options['revalidate'], options['clients'],
+        )
+        cpu = proc.usage()[0] - started.get('cpu', 0)
+        elapsed = time.perf_counter() - started.get('at', time.perf_counter() - options['duration'])
+        peak_rss = proc.stop_sampling()
+        timer.cancel()
+
+    return {'users': users, **summarize(result, elapsed, cpu, peak_rss)}
+
+
+def print_table(scenarios: list[dict]):
+    header = f"{'users':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7} {'cpu %':>7} {'rss MB':>7}"
+    click.echo(header)
+    click.echo('-' * len(header))
+    for s in scenarios:
+        latency = s['latency_ms']
+        click.echo(
+            f"{s['users']:>8} {s['requests_per_second']:>9} {latency['p50']:>8} {latency['p95']:>8} "
+            f"{latency['p99']:>8} {latency['max']:>8} {s['errors']:>7} {s['server_cpu_percent']:>7} {s['server_peak_rss_mb']:>7}"
+        )
+        non_ok = {status: n for status, n in s['statuses'].items() if status not in ('200', '304')}
+        if non_ok or s['error_types']:
+            click.echo(f"{'':>8} statuses: {s['statuses']} errors: {s['error_types']}")
+
+
+@click.command()
+@click.option('--users', '-u', default='1000,10000,100000', help='Comma-separated user counts, one scenario each')
+@click.option('--server', '-s', type=click.Choice(list(server.SERVERS)), default='subscription', help='Server to start')
+@click.option('--path', '-p', 'paths', multiple=True, help='Request path template with {username}, can be repeated')
+@click.option('--concurrency', '-c', default=64, help='Keep-alive connections')
+@click.option('--clients', default=1, help='Client processes sharing the connections')
+@click.option('--duration', '-d', default=15.0, help='Measured seconds per scenario')
+@click.option('--warmup', '-w', default=3.0, help='Seconds of load before measuring')
+@click.option('--workers', default=1, help='SUB_WORKERS for the server')
+@click.option('--storage', type=click.Choice(['json', 'sqlite']), default='json', help='User storage engine')
+@click.option('--accept-encoding', default='identity', help='Accept-Encoding header to send, e.g. gzip or br')
+@click.option('--revalidate', is_flag=True, help='Send If-None-Match with the last ETag of each path')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the results as JSON')
+@click.option('--keep', is_flag=True, help='Keep the generated prefix')
+def main(**options):
+    users = [int(n) for n in options['users'].split(',') if n.strip()]
+    root = tempfile.mkdtemp(prefix='hysteria-bench-')
+    scenarios = []
+    try:
+        for count in users:
+            scenarios.append(run_scenario(options, count, root))
+    except RuntimeError as e:
+        click.echo(f"Error: {e}", err=True)
+        sys.exit(1)
+    finally:
+        if options['keep']:
+            click.echo(f"Kept {root}", err=True)
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print_table(scenarios)
+    if options['output']:
+        report = {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'options': {key: value for key, value in options.items() if key not in ('output', 'keep')},
+            'scenarios': scenarios,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+        click.echo(f"Results written to {options['output']}", err=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+'''Synthetic HYSTERIA_DIR prefix: users, config.json, .configs.env and a self-signed certificate.'''
+import os
+import sys
+import json
+import random
+import subprocess
+from datetime import date
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import storage
+
+CORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+GB = 1024 ** 3
+
+
+def make_certificate(prefix: str) -> tuple[str, str, str]:
+    '''Returns (certfile, keyfile, pinSHA256) of a new self-signed localhost certificate.'''
+    certfile = os.path.join(prefix, 'ca.crt')
+    keyfile = os.path.join(prefix, 'ca.key')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '2',
+         '-subj', '/CN=localhost', '-keyout', keyfile, '-out', certfile],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    fingerprint = subprocess.check_output(
+        ['openssl', 'x509', '-noout', '-fingerprint', '-sha256', '-in', certfile]
+    ).decode().strip()
+    return certfile, keyfile, fingerprint.split('=', 1)[1]
+
+
+def make_users(count: int, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    today = date.today().isoformat()
+    users = {}
+    for i in range(count):
+        max_download_bytes = rng.randint(10, 200) * GB
+        users[f'user{i:06d}'] = storage.with_expiry({
+            'password': '%032x' % rng.getrandbits(128),
+            'max_download_bytes': max_download_bytes,
+            'expiration_days': rng.choice((30, 60, 90)),
+            'account_creation_date': today,
+            'blocked': False,
+            'upload_bytes': rng.randint(0, max_download_bytes // 10),
+            'download_bytes': rng.randint(0, max_download_bytes // 2),
+            'status': 'Offline',
+        })
+    return users
+
+
+def make_prefix(prefix: str, users: int, engine: str = 'json', seed: int = 1) -> dict:
+    '''Fills prefix as an install would and returns the files the server needs.'''
+    os.makedirs(prefix, exist_ok=True)
+    certfile, keyfile, pin = make_certificate(prefix)
+    rng = random.Random(seed)
+
+    config = {
+        'listen': ':8443',
+        'tls': {'cert': certfile, 'key': keyfile, 'pinSHA256': pin},
+        'obfs': {'type': 'salamander', 'salamander': {'password': '%032x' % rng.getrandbits(128)}},
+        'trafficStats': {'listen': '127.0.0.1:25413', 'secret': '%032x' % rng.getrandbits(128)},
+    }
+    with open(os.path.join(prefix, 'config.json'), 'w') as f:
+        json.dump(config, f, indent=2)
+    with open(os.path.join(prefix, '.configs.env'), 'w') as f:
+        f.write('SNI=bench.local\nIP4=127.0.0.1\nIP6=::1\nUSER_STORAGE=json\n')
+
+    user_set = make_users(users, seed)
+    with open(os.path.join(prefix, 'users.json'), 'w') as f:
+        json.dump(user_set, f)
+
+    if engine != 'json':
+        # Through the CLI, so the paths module is loaded with this prefix
+        subprocess.run(
+            [sys.executable, os.path.join(CORE_DIR, 'cli.py'), 'migrate-users', '--to', engine],
+            check=True, stdout=subprocess.DEVNULL, env={**os.environ, 'HYSTERIA_DIR': prefix},
+        )
+    return {'certfile': certfile, 'keyfile': keyfile, 'usernames': list(user_set)}
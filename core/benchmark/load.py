@@ -0,0 +1,84 @@
+'''Keep-alive HTTPS load generator.'''
+import time
+import random
+import asyncio
+import multiprocessing
+from collections import Counter
+
+import aiohttp
+
+
+async def _run(base_url: str, paths: list[str], concurrency: int, duration: float, warmup: float, headers: dict, revalidate: bool, seed: int) -> dict:
+    rng = random.Random(seed)
+    latencies = []
+    statuses = Counter()
+    errors = Counter()
+    received = 0
+    etags = {}
+
+    connector = aiohttp.TCPConnector(limit=concurrency, ssl=False)
+    timeout = aiohttp.ClientTimeout(total=30)
+    # Bodies are counted as sent; decompressing them would only load the client
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, auto_decompress=False) as session:
+        start = time.perf_counter()
+        measure_from = start + warmup
+        stop_at = measure_from + duration
+
+        async def client():
+            nonlocal received
+            while True:
+                now = time.perf_counter()
+                if now >= stop_at:
+                    return
+                path = rng.choice(paths)
+                request_headers = dict(headers)
+                if revalidate and path in etags:
+                    request_headers['If-None-Match'] = etags[path]
+                try:
+                    async with session.get(base_url + path, headers=request_headers) as response:
+                        body = await response.read()
+                        if revalidate and 'ETag' in response.headers:
+                            etags[path] = response.headers['ETag']
+                        status = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if now >= measure_from:
+                        errors[type(e).__name__] += 1
+                    continue
+                if now >= measure_from:
+                    latencies.append(time.perf_counter() - now)
+                    statuses[status] += 1
+                    received += len(body)
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    return {'latencies': latencies, 'statuses': statuses, 'errors': errors, 'bytes': received}
+
+
+def _run_process(args: tuple) -> dict:
+    return asyncio.run(_run(*args))
+
+
+def run(base_url: str, paths: list[str], concurrency: int, duration: float, warmup: float = 0,
+        headers: dict | None = None, revalidate: bool = False, clients: int = 1) -> dict:
+    '''
+    Sends GET requests for random paths from `concurrency` connections for
+    warmup + duration seconds; only the requests started after the warmup are
+    counted. clients > 1 splits the connections across processes, for when one
+    client process cannot saturate the server.
+    '''
+    headers = headers or {}
+    if clients <= 1:
+        return _run_process((base_url, paths, concurrency, duration, warmup, headers, revalidate, 0))
+
+    shares = [concurrency // clients + (i < concurrency % clients) for i in range(clients)]
+    jobs = [(base_url, paths, share, duration, warmup, headers, revalidate, i) for i, share in enumerate(shares) if share]
+    with multiprocessing.Pool(len(jobs)) as pool:
+        results = pool.map(_run_process, jobs)
+
+    merged = {'latencies': [], 'statuses': Counter(), 'errors': Counter(), 'bytes': 0}
+    for result in results:
+        merged['latencies'].extend(result['latencies'])
+        merged['statuses'].update(result['statuses'])
+        merged['errors'].update(result['errors'])
+        merged['bytes'] += result['bytes']
+    return merged
@@ -0,0 +1,131 @@
+'''Runs a subscription server against a benchmark prefix and samples its CPU time and memory.'''
+import os
+import sys
+import time
+import socket
+import threading
+import subprocess
+
+SCRIPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+SERVERS = {
+    'subscription': os.path.join(SCRIPT_DIR, 'subscription', 'server.py'),
+    'singbox': os.path.join(SCRIPT_DIR, 'singbox', 'singbox.py'),
+    'normalsub': os.path.join(SCRIPT_DIR, 'normalsub', 'normalsub.py'),
+}
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+START_TIMEOUT = 30
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_tree(pid: int) -> list[int]:
+    '''pid and all of its descendants, from /proc.'''
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                # The command name may contain spaces; fields resume after the last ')'
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        parents.setdefault(int(fields[1]), []).append(int(entry))
+
+    tree = [pid]
+    for parent in tree:
+        tree.extend(parents.get(parent, []))
+    return tree
+
+
+def usage(pid: int) -> tuple[float, int]:
+    '''(CPU seconds, RSS bytes) of a process tree.'''
+    cpu = 0.0
+    rss = 0
+    for member in process_tree(pid):
+        try:
+            with open(f'/proc/{member}/stat', 'r') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        # utime, stime and rss are fields 14, 15 and 24 of stat(5)
+        cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        rss += int(fields[21]) * PAGE_SIZE
+    return cpu, rss
+
+
+class ServerProcess:
+    def __init__(self, server: str, prefix: str, certfile: str, keyfile: str, workers: int = 1, env: dict | None = None):
+        self.script = SERVERS[server]
+        self.port = free_port()
+        self.log_path = os.path.join(prefix, 'server.log')
+        self.env = {
+            **os.environ,
+            'HYSTERIA_DIR': prefix,
+            'HYSTERIA_PORT': str(self.port),
+            'HYSTERIA_CERTFILE': certfile,
+            'HYSTERIA_KEYFILE': keyfile,
+            'SUB_HOST': '127.0.0.1',
+            'SUB_WORKERS': str(workers),
+            # The load comes from one address, so the per-client limit is lifted
+            'RATE_LIMIT': str(10 ** 9),
+            **(env or {}),
+        }
+        self.process = None
+        self.peak_rss = 0
+        self._sampling = threading.Event()
+
+    def __enter__(self):
+        self.log = open(self.log_path, 'w')
+        self.process = subprocess.Popen(
+            [sys.executable, self.script], env=self.env, cwd=os.path.dirname(self.script),
+            stdout=self.log, stderr=subprocess.STDOUT,
+        )
+        deadline = time.monotonic() + START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'Server exited with status {self.process.returncode}, see {self.log_path}')
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.5).close()
+                return self
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError(f'Server did not start listening on port {self.port} in {START_TIMEOUT}s')
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+    @property
+    def base_url(self) -> str:
+        return f'https://127.0.0.1:{self.port}'
+
+    def usage(self) -> tuple[float, int]:
+        return usage(self.process.pid)
+
+    def start_sampling(self, interval: float = 0.5):
+        '''Records the peak RSS of the server until stop_sampling().'''
+        self._sampling.clear()
+        self.peak_rss = self.usage()[1]
+
+        def sample():
+            while not self._sampling.wait(interval):
+                self.peak_rss = max(self.peak_rss, self.usage()[1])
+
+        self._sampler = threading.Thread(target=sample, daemon=True)
+        self._sampler.start()
+
+    def stop_sampling(self) -> int:
+        self._sampling.set()
+        self._sampler.join()
+        return self.peak_rss
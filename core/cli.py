@@ -3,12 +3,18 @@
 from datetime import datetime
 import os
 import io
+import re
+import json
 import click
+import shutil
 import subprocess
 from enum import Enum
 
+import paths
 import traffic
 import validator
+import storage
+import uris
 
 
 SCRIPT_DIR = '/etc/hysteria/core/scripts'
@@ -24,14 +30,11 @@ class Command(Enum):
     CHANGE_PORT_HYSTERIA2 = os.path.join(SCRIPT_DIR, 'hysteria2', 'change_port.sh')
     CHANGE_SNI_HYSTERIA2 = os.path.join(SCRIPT_DIR, 'hysteria2', 'change_sni.sh')
     GET_USER = os.path.join(SCRIPT_DIR, 'hysteria2', 'get_user.sh')
-    ADD_USER = os.path.join(SCRIPT_DIR, 'hysteria2', 'add_user.sh')
-    EDIT_USER = os.path.join(SCRIPT_DIR, 'hysteria2', 'edit_user.sh')
-    RESET_USER = os.path.join(SCRIPT_DIR, 'hysteria2', 'reset_user.sh')
-    REMOVE_USER = os.path.join(SCRIPT_DIR, 'hysteria2', 'remove_user.sh')
-    SHOW_USER_URI = os.path.join(SCRIPT_DIR, 'hysteria2', 'show_user_uri.sh')
     IP_ADD = os.path.join(SCRIPT_DIR, 'hysteria2', 'ip.sh')
     MANAGE_OBFS = os.path.join(SCRIPT_DIR, 'hysteria2', 'manage_obfs.sh')
+    AUTH_MODE = os.path.join(SCRIPT_DIR, 'auth', 'auth_mode.sh')
     TRAFFIC_STATUS = 'traffic.py'  # won't be call directly (it's a python module)
+    TRAFFIC_COLLECTOR = os.path.join(SCRIPT_DIR, 'traffic', 'collector.sh')
     UPDATE_GEO = os.path.join(SCRIPT_DIR, 'hysteria2', 'update_geo.py') 
     LIST_USERS = os.path.join(SCRIPT_DIR, 'hysteria2', 'list_users.sh')
     SERVER_INFO = os.path.join(SCRIPT_DIR, 'hysteria2', 'server_info.sh')
@@ -39,6 +42,7 @@ class Command(Enum):
     INSTALL_TELEGRAMBOT = os.path.join(SCRIPT_DIR, 'telegrambot', 'runbot.sh')
     INSTALL_SINGBOX = os.path.join(SCRIPT_DIR, 'singbox', 'singbox_shell.sh')
     INSTALL_NORMALSUB = os.path.join(SCRIPT_DIR, 'normalsub', 'normalsub.sh')
+    INSTALL_SUBSCRIPTION = os.path.join(SCRIPT_DIR, 'subscription', 'subscription.sh')
     INSTALL_TCP_BRUTAL = os.path.join(SCRIPT_DIR, 'tcp-brutal', 'install.sh')
     INSTALL_WARP = os.path.join(SCRIPT_DIR, 'warp', 'install.sh')
     UNINSTALL_WARP = os.path.join(SCRIPT_DIR, 'warp', 'uninstall.sh')
@@ -69,6 +73,15 @@ def generate_password() -> str:
     '''
     return subprocess.check_output(['pwgen', '-s', '32', '1'], shell=False).decode().strip()
 
+
+def sqlite_storage() -> bool:
+    '''
+    With the sqlite engine the read-only user commands are handled in-process
+    instead of by the jq based scripts, which only understand users.json.
+    Writes always go through the store, which holds users.json.lock.
+    '''
+    return storage.get_engine() == 'sqlite'
+
 # endregion
 
 
@@ -117,6 +130,13 @@ def change_hysteria2_sni(sni: str):
 @cli.command('get-user')
 @click.option('--username', '-u', required=True, help='Username for the user to get', type=str)
 def get_user(username: str):
+    if sqlite_storage():
+        record = storage.get_store().get(username)
+        if record is None:
+            print(f"User '{username}' not found.")
+            exit(1)
+        print(json.dumps(record, indent=2))
+        return
     cmd = ['bash', Command.GET_USER.value, '-u', str(username)]
     run_cmd(cmd)
 
@@ -135,11 +155,26 @@ def add_user(username: str, traffic_limit: int, expiration_days: int, password:
             exit(1)
     if not creation_date:
         creation_date = datetime.now().strftime('%Y-%m-%d')
+    if not re.match(r'^[a-zA-Z0-9]+$', username):
+        print('Error: Username can only contain letters and numbers.')
+        exit(1)
     try:
-        run_cmd(['bash', Command.ADD_USER.value, username, str(traffic_limit), str(expiration_days), password, creation_date])
-    except subprocess.CalledProcessError as e:
-        click.echo(f"{e.output.decode()}", err=True)
+        datetime.strptime(creation_date, '%Y-%m-%d')
+    except ValueError:
+        print('Invalid date. Please provide a valid date in YYYY-MM-DD format.')
+        exit(1)
+    try:
+        storage.get_store().add(username.lower(), {
+            'password': password,
+            'max_download_bytes': traffic_limit * 1073741824,
+            'expiration_days': expiration_days,
+            'account_creation_date': creation_date,
+            'blocked': False,
+        })
+    except ValueError:
+        print('User already exists.')
         exit(1)
+    print(f'User {username} added successfully.')
 
 @cli.command('edit-user')
 @click.option('--username', '-u', required=True, help='Username for the user to edit', type=str)
@@ -181,30 +216,52 @@ def edit_user(username: str, new_username: str, new_traffic_limit: int, new_expi
     else:
         creation_date = ""
 
-    # Prepare arguments for the command
-    command_args = [
-        'bash',
-        Command.EDIT_USER.value,
-        username,
-        new_username or '',
-        str(new_traffic_limit) if new_traffic_limit is not None else '',
-        str(new_expiration_days) if new_expiration_days is not None else '',
-        password,
-        creation_date,
-        'true' if blocked else 'false'
-    ]
-
-    run_cmd(command_args)
+    if new_username and not re.match(r'^[a-zA-Z0-9]+$', new_username):
+        print('Error: Username can only contain letters and numbers.')
+        exit(1)
+    changes = {'blocked': blocked}
+    if password:
+        changes['password'] = password
+    if new_traffic_limit is not None:
+        changes['max_download_bytes'] = new_traffic_limit * 1073741824
+    if new_expiration_days is not None:
+        changes['expiration_days'] = new_expiration_days
+    if creation_date:
+        changes['account_creation_date'] = creation_date
+    try:
+        storage.get_store().update(username, changes, new_username=new_username)
+    except KeyError:
+        print(f"Error: User '{username}' not found.")
+        exit(1)
+    except ValueError:
+        print(f"Error: User '{new_username}' already exists.")
+        exit(1)
+    print(f"User '{username}' updated successfully.")
+    run_cmd(['bash', Command.RESTART_HYSTERIA2.value])
 
 @ cli.command('reset-user')
 @ click.option('--username', '-u', required=True, help='Username for the user to Reset', type=str)
 def reset_user(username: str):
-    run_cmd(['bash', Command.RESET_USER.value, username])
+    try:
+        storage.get_store().update(username, {
+            'upload_bytes': 0,
+            'download_bytes': 0,
+            'status': 'Offline',
+            'account_creation_date': datetime.now().strftime('%Y-%m-%d'),
+            'blocked': False,
+        })
+    except KeyError:
+        print(f"Error: User '{username}' not found.")
+        return
+    print(f"User '{username}' has been reset successfully.")
 
 @ cli.command('remove-user')
 @ click.option('--username', '-u', required=True, help='Username for the user to remove', type=str)
 def remove_user(username: str):
-    run_cmd(['bash', Command.REMOVE_USER.value, username])
+    if storage.get_store().remove(username):
+        print(f'User {username} removed successfully.')
+    else:
+        print(f'Error: User {username} not found.')
 
 @cli.command('show-user-uri')
 @click.option('--username', '-u', required=True, help='Username for the user to show the URI', type=str)
@@ -213,31 +270,94 @@ def remove_user(username: str):
 @click.option('--all', '-a', is_flag=True, help='Show both IPv4 and IPv6 URIs and generate QR codes for both if requested')
 @click.option('--singbox', '-s', is_flag=True, help='Generate Singbox sublink if Singbox service is active')
 @click.option('--normalsub', '-n', is_flag=True, help='Generate Normal sublink if normalsub service is active')
-def show_user_uri(username: str, qrcode: bool, ipv: int, all: bool, singbox: bool, normalsub: bool):
-    command_args = ['bash', Command.SHOW_USER_URI.value, '-u', username]
-    if qrcode:
-        command_args.append('-qr')
-    if all:
-        command_args.append('-a')
-    else:
-        command_args.extend(['-ip', str(ipv)])
-    if singbox:
-        command_args.append('-s')
-    if normalsub:
-        command_args.append('-n')
+@click.option('--subscription', '-sub', is_flag=True, help='Generate unified sublink if subscription service is active')
+def show_user_uri(username: str, qrcode: bool, ipv: int, all: bool, singbox: bool, normalsub: bool, subscription: bool):
+    if not os.path.exists(paths.USERS_FILE) and not os.path.exists(paths.USERS_DB):
+        print(f'\033[0;31mError:\033[0m Config file {paths.USERS_FILE} not found.')
+        return
+    if not uris.service_active('hysteria-server.service'):
+        print('\033[0;31mError:\033[0m Hysteria2 is not active.')
+        return
+    if ipv not in (4, 6):
+        print('Invalid IP version. Use 4 for IPv4 or 6 for IPv6.')
+        exit(1)
+
+    user_uris = uris.user_uris(username)
+    if user_uris is None:
+        print('Invalid username. Please try again.')
+        return
+
+    versions = (4, 6) if all else (ipv,)
+    for version in versions:
+        print(f'\nIPv{version}:\n{user_uris[version]}\n')
 
-    run_cmd(command_args)
+    if qrcode:
+        cols = shutil.get_terminal_size().columns
+        for version in versions:
+            print(f'\nIPv{version} QR Code:\n')
+            for line in uris.qr_terminal(user_uris[version]).splitlines():
+                print(line.center(cols).rstrip())
+
+    if singbox and (sublink := uris.singbox_sublink(username, ipv)):
+        print(f'\nSingbox Sublink:\n{sublink}\n')
+    if normalsub and (sublink := uris.normalsub_sublink(username)):
+        print(f'\nNormal-SUB Sublink:\n{sublink}\n')
+    if subscription and (sublink := uris.subscription_sublink(username)):
+        print(f'\nSubscription Sublink:\n{sublink}\n')
 
 @ cli.command('traffic-status')
 def traffic_status():
     traffic.traffic_status()
 
 
+@cli.command('traffic-collector')
+@click.option('--action', '-a', required=True, help='Action to perform: start or stop', type=click.Choice(['start', 'stop'], case_sensitive=False))
+@click.option('--interval', '-i', required=False, default=10, help='Seconds between two collections (1-60)', type=click.IntRange(1, 60))
+def traffic_collector(action: str, interval: int):
+    """Run traffic collection as a resident service instead of the per-minute cron job."""
+    if action == 'start':
+        run_cmd(['bash', Command.TRAFFIC_COLLECTOR.value, 'start', str(interval)])
+    else:
+        run_cmd(['bash', Command.TRAFFIC_COLLECTOR.value, 'stop'])
+
+
 @ cli.command('list-users')
 def list_users():
+    if sqlite_storage():
+        print(json.dumps(storage.get_store().load(), indent=4))
+        return
     run_cmd(['bash', Command.LIST_USERS.value])
 
 
+@cli.command('migrate-users')
+@click.option('--to', 'target', required=True, help='Storage engine to move the users to', type=click.Choice(storage.ENGINES, case_sensitive=False))
+def migrate_users(target: str):
+    """
+    Moves all users between users.json and the SQLite database and makes the target the active engine.
+    """
+    target = target.lower()
+    try:
+        count = storage.migrate(target)
+    except (ValueError, json.JSONDecodeError) as e:
+        print(f'Error: {e}')
+        exit(1)
+    print(f'Migrated {count} users to {target} storage.')
+
+
+@cli.command('export-users')
+@click.option('--output', '-o', required=False, help='File to write (default: print to stdout)', type=str)
+def export_users(output: str):
+    """
+    Exports all users in the users.json format, whatever the active engine.
+    """
+    users = storage.get_store().load()
+    if output:
+        storage.export_json(users, output)
+        print(f'Exported {len(users)} users to {output}.')
+    else:
+        print(json.dumps(users, indent=4))
+
+
 @cli.command('server-info')
 def server_info():
     output = run_cmd(['bash', Command.SERVER_INFO.value])
@@ -268,6 +388,12 @@ def manage_obfs(remove, generate):
     else:
         click.echo("Error: Please specify either --remove or --generate.")
 
+@cli.command('auth-mode')
+@click.option('--mode', '-m', required=True, help='Authentication backend: command (user.sh) or http (hysteria-auth service)', type=click.Choice(['command', 'http'], case_sensitive=False))
+def auth_mode(mode: str):
+    """Switch how Hysteria2 authenticates users."""
+    run_cmd(['bash', Command.AUTH_MODE.value, mode.lower()])
+
 @cli.command('ip-address')
 @click.option('--edit', is_flag=True, help="Edit IP addresses manually.")
 @click.option('-4', '--ipv4', type=str, help="Specify the new IPv4 address.")
@@ -401,6 +527,20 @@ def normalsub(action: str, domain: str, port: int):
     elif action == 'stop':
         run_cmd(['bash', Command.INSTALL_NORMALSUB.value, 'stop'])
 
+@cli.command('subscription')
+@click.option('--action', '-a', required=True, help='Action to perform: start or stop', type=click.Choice(['start', 'stop'], case_sensitive=False))
+@click.option('--domain', '-d', required=False, help='Domain name for SSL', type=str)
+@click.option('--port', '-p', required=False, help='Port number for the subscription service', type=int)
+def subscription(action: str, domain: str, port: int):
+    """Serve every sublink format (sing-box, URI list, base64, Clash) from one service."""
+    if action == 'start':
+        if not domain or not port:
+            click.echo("Error: Both --domain and --port are required for the start action.")
+            return
+        run_cmd(['bash', Command.INSTALL_SUBSCRIPTION.value, 'start', domain, str(port)])
+    elif action == 'stop':
+        run_cmd(['bash', Command.INSTALL_SUBSCRIPTION.value, 'stop'])
+
 # endregion
 
 
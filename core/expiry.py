@@ -0,0 +1,153 @@
+'''
+Expiry scheduler.
+
+Keeps a min-heap of (expires_at, username) for every active account and sleeps
+until the earliest deadline, so an account is blocked and kicked at its real
+expiry instead of at the next minute of the kick.sh cron job. Each due event
+costs one heap pop.
+
+The heap is built once from the store. After that only the accounts whose
+expiry may have changed are pushed again: with SQLite they come from the
+expiry_events feed that triggers fill on add, edit and reset, so the traffic
+counter flushes cost nothing. users.json has no such feed, so when the file
+changes the deadlines are compared with the previous ones and only the changed
+accounts are pushed. Entries are validated lazily when they come due: if the
+user was removed, blocked, or got a new deadline since, the entry is dropped.
+'''
+import time
+import heapq
+import threading
+
+import storage
+
+# Upper bound on a single sleep, so accounts added or edited with an earlier
+# deadline than the current heap head are picked up without a full scan loop
+RECHECK_INTERVAL = 30
+
+
+def enforced_expiry(record: dict) -> int | None:
+    '''Deadline of an account kick.sh would block on expiry, or None.'''
+    if record.get('blocked') is True:
+        return None
+    if not (record.get('max_download_bytes') or 0) > 0 or not (record.get('expiration_days') or 0) > 0:
+        return None
+    return storage.record_expiry(record)
+
+
+class ExpiryScheduler:
+    def __init__(self, store=None, kick=None):
+        self._store = store
+        # Called with the list of usernames that were just blocked
+        self.kick = kick
+        self.heap = []
+        self._engine = None
+        # Last expiry event applied (sqlite), file stamp (json)
+        self._cursor = 0
+        self._stamp = None
+        # username -> deadline of its newest heap entry
+        self._deadlines = {}
+        self.stats = {'rebuilds': 0, 'updates': 0, 'expired': 0, 'stale': 0}
+
+    @property
+    def store(self):
+        return self._store or storage.get_store()
+
+    def _push(self, username: str, expires_at: int | None):
+        if expires_at is None:
+            self._deadlines.pop(username, None)
+        elif self._deadlines.get(username) != expires_at:
+            self._deadlines[username] = expires_at
+            heapq.heappush(self.heap, (expires_at, username))
+            self.stats['updates'] += 1
+
+    def _rebuild(self, store):
+        if store.engine == 'sqlite':
+            # Events from here on are applied incrementally, older ones are covered by the load
+            self._cursor = store.expiry_cursor()
+            store.prune_expiry_events(self._cursor)
+        self._stamp = store.stamp()
+        users = store.load()
+        self._deadlines = {
+            username: expires_at
+            for username, record in users.items()
+            if (expires_at := enforced_expiry(record)) is not None
+        }
+        self.heap = [(expires_at, username) for username, expires_at in self._deadlines.items()]
+        heapq.heapify(self.heap)
+        self._engine = store.engine
+        self.stats['rebuilds'] += 1
+
+    def _sync(self):
+        store = self.store
+        if store.engine != self._engine:
+            self._rebuild(store)
+        elif store.engine == 'sqlite':
+            cursor, usernames = store.expiry_events(self._cursor)
+            if usernames:
+                for username in dict.fromkeys(usernames):
+                    record = store.get(username)
+                    self._push(username, enforced_expiry(record) if record else None)
+                store.prune_expiry_events(cursor)
+                self._cursor = cursor
+        else:
+            stamp = store.stamp()
+            if stamp == self._stamp:
+                return
+            users = store.load()
+            for username in self._deadlines.keys() - users.keys():
+                del self._deadlines[username]
+            for username, record in users.items():
+                self._push(username, enforced_expiry(record))
+            self._stamp = stamp
+
+    def next_deadline(self) -> int | None:
+        self._sync()
+        return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now: float) -> list[str]:
+        '''Removes and returns the users whose deadline has passed.'''
+        self._sync()
+        store = self.store
+        due = {}
+        while self.heap and self.heap[0][0] <= now:
+            expires_at, username = heapq.heappop(self.heap)
+            if store.engine == 'sqlite':
+                # Removals leave no expiry event, so the row itself is checked
+                record = store.get(username)
+                current = enforced_expiry(record) if record else None
+            else:
+                # Just compared with users.json by _sync()
+                current = self._deadlines.get(username)
+            # A deadline changed back and forth leaves two equal entries
+            if current != expires_at or username in due:
+                self.stats['stale'] += 1
+                continue
+            self._deadlines.pop(username, None)
+            due[username] = None
+        return list(due)
+
+    def run_once(self, now: float | None = None) -> list[str]:
+        due = self.pop_due(time.time() if now is None else now)
+        if not due:
+            return []
+        blocked = self.store.block(due)
+        self.stats['expired'] += len(blocked)
+        if blocked and self.kick:
+            self.kick(blocked)
+        return blocked
+
+    def run(self, stop_event: threading.Event):
+        while not stop_event.is_set():
+            try:
+                for username in self.run_once():
+                    print(f'Blocked expired user {username}', flush=True)
+            except Exception as e:
+                print(f'Error: expiry scheduler: {e}', flush=True)
+                # Users popped from the heap are restored by a rebuild
+                self._engine = None
+                stop_event.wait(RECHECK_INTERVAL)
+                continue
+
+            deadline = self.next_deadline()
+            timeout = RECHECK_INTERVAL if deadline is None else min(max(deadline - time.time(), 0), RECHECK_INTERVAL)
+            stop_event.wait(timeout)
@@ -0,0 +1,107 @@
+'''
+Bounded thread offload for aiohttp handlers.
+
+BoundedExecutor.run() executes a blocking function in a thread pool so the
+event loop keeps serving other clients, with three limits:
+
+- at most `concurrency` calls run at once (a semaphore in front of the pool);
+- at most `max_queue` calls wait for a slot; beyond that run() raises
+  Overloaded straight away, which the server turns into 503 + Retry-After;
+- every call has a deadline covering both the wait and the run; when it passes
+  run() raises asyncio.TimeoutError. A call already running in a thread cannot
+  be interrupted, so its slot is only released when it actually returns.
+
+Queue depth and wait times are kept in `stats()`.
+'''
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__('Server is overloaded.')
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    def __init__(self, concurrency: int, max_queue: int, timeout: float, retry_after: int = 5):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='offload')
+        self._semaphore = None
+        self.queued = 0
+        self.running = 0
+        self.counters = {'completed': 0, 'failed': 0, 'shed': 0, 'timeouts': 0, 'max_queued': 0}
+        self._wait_total = 0.0
+        self._wait_count = 0
+        self._wait_max = 0.0
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created on first use, inside the worker's event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def _record_wait(self, waited: float):
+        self._wait_total += waited
+        self._wait_count += 1
+        self._wait_max = max(self._wait_max, waited)
+
+    async def _acquire(self, timeout: float):
+        if not self.semaphore.locked():
+            # A slot is free: acquire() returns without suspending
+            await self.semaphore.acquire()
+            self._record_wait(0.0)
+            return
+
+        if self.queued >= self.max_queue:
+            self.counters['shed'] += 1
+            raise Overloaded(self.retry_after)
+
+        started = time.monotonic()
+        self.queued += 1
+        self.counters['max_queued'] = max(self.counters['max_queued'], self.queued)
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            raise
+        finally:
+            self.queued -= 1
+            self._record_wait(time.monotonic() - started)
+
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        await self._acquire(self.timeout)
+        self.running += 1
+
+        def release(_):
+            self.running -= 1
+            self.semaphore.release()
+
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(release, f))
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            raise
+        except Exception:
+            self.counters['failed'] += 1
+            raise
+        self.counters['completed'] += 1
+        return result
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            'queued': self.queued,
+            'running': self.running,
+            'wait_ms_avg': round(self._wait_total / self._wait_count * 1000, 3) if self._wait_count else 0,
+            'wait_ms_max': round(self._wait_max * 1000, 3),
+        }
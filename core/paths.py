@@ -0,0 +1,51 @@
+'''Python counterpart of scripts/path.sh.
+
+Every location is derived from HYSTERIA_DIR so services can be pointed at a
+different prefix (e.g. a scratch directory) without touching the code.
+'''
+import os
+
+HYSTERIA_DIR = os.getenv('HYSTERIA_DIR', '/etc/hysteria')
+CORE_DIR = os.path.join(HYSTERIA_DIR, 'core')
+SCRIPT_DIR = os.path.join(CORE_DIR, 'scripts')
+
+CLI_PATH = os.path.join(CORE_DIR, 'cli.py')
+USERS_FILE = os.path.join(HYSTERIA_DIR, 'users.json')
+USERS_DB = os.path.join(HYSTERIA_DIR, 'users.db')
+CONFIG_FILE = os.path.join(HYSTERIA_DIR, 'config.json')
+CONFIG_ENV = os.path.join(HYSTERIA_DIR, '.configs.env')
+AUTH_ENV = os.path.join(SCRIPT_DIR, 'auth', '.env')
+SINGBOX_ENV = os.path.join(SCRIPT_DIR, 'singbox', '.env')
+NORMALSUB_ENV = os.path.join(SCRIPT_DIR, 'normalsub', '.env')
+SUBSCRIPTION_ENV = os.path.join(SCRIPT_DIR, 'subscription', '.env')
+TRAFFIC_PENDING = os.path.join(SCRIPT_DIR, 'traffic', 'pending.json')
+
+TRAFFIC_API = 'http://127.0.0.1:25413'
+
+
+def read_env_file(path: str) -> dict:
+    '''Parses a KEY=value file such as .configs.env; missing files yield {}.'''
+    values = {}
+    try:
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#') or '=' not in line:
+                    continue
+                key, value = line.split('=', 1)
+                values[key.strip()] = value.strip()
+    except FileNotFoundError:
+        pass
+    return values
+
+
+def write_env_value(path: str, key: str, value: str):
+    '''Sets KEY=value in an env file, replacing an existing entry.'''
+    try:
+        with open(path, 'r') as f:
+            lines = [line for line in f.read().splitlines() if not line.startswith(f'{key}=')]
+    except FileNotFoundError:
+        lines = []
+    lines.append(f'{key}={value}')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
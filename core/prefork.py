@@ -0,0 +1,145 @@
+'''
+Pre-fork worker supervisor for the subscription servers.
+
+serve() forks `workers` copies of a server, each binding the same port with
+SO_REUSEPORT so the kernel spreads connections (and the TLS handshakes and
+rendering they cost) across cores. The supervisor only waits on its children:
+a worker that exits is forked again, with a growing delay if it keeps dying
+right after start. SIGTERM/SIGINT stop the workers; SIGHUP bumps the shared
+generation, which tells every worker to drop its caches.
+
+The supervisor can also replace all workers without downtime: when refresh()
+returns True (checked every second, and on SIGHUP), a new set of workers is
+forked, and the old ones get SIGTERM to finish their requests and exit. This
+is how workers pick up state the supervisor prepared before forking, such as
+a new TLS context.
+
+State shared between the workers lives in anonymous shared mappings created
+before the fork: SharedState here, and the buckets of rate_limit.SharedRateLimiter.
+'''
+import os
+import mmap
+import time
+import struct
+import signal
+import traceback
+
+# A worker that dies sooner than this after being forked is restarted with backoff
+MIN_UPTIME = 5
+MAX_BACKOFF = 30
+
+
+class SharedState:
+    '''Counters written by the supervisor and read by the workers.'''
+    FIELDS = struct.Struct('QQ')  # generation, restarts
+
+    def __init__(self):
+        self.mem = mmap.mmap(-1, self.FIELDS.size)
+        self.seen = 0
+
+    def _read(self):
+        return self.FIELDS.unpack_from(self.mem, 0)
+
+    def bump_generation(self):
+        generation, restarts = self._read()
+        self.FIELDS.pack_into(self.mem, 0, generation + 1, restarts)
+
+    def count_restart(self):
+        generation, restarts = self._read()
+        self.FIELDS.pack_into(self.mem, 0, generation, restarts + 1)
+
+    def changed(self) -> bool:
+        '''True once per generation bump, in each worker.'''
+        generation = self._read()[0]
+        if generation == self.seen:
+            return False
+        self.seen = generation
+        return True
+
+    def stats(self) -> dict:
+        generation, restarts = self._read()
+        return {'pid': os.getpid(), 'generation': generation, 'restarts': restarts}
+
+
+def _spawn(target) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+
+    # Worker: the supervisor's handlers must not run here
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    status = 0
+    try:
+        target()
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def serve(target, workers: int, state: SharedState, refresh=None):
+    '''
+    Runs target() in `workers` forked processes until SIGTERM/SIGINT.
+    refresh(forced) returns True when the workers should be replaced; forced is
+    True after a SIGHUP.
+    '''
+    children = {}  # pid -> start time, or None once the worker was told to exit
+    failures = 0
+    stopping = False
+    hangup = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reload(signum, frame):
+        nonlocal hangup
+        hangup = True
+        state.bump_generation()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, reload)
+
+    for _ in range(workers):
+        children[_spawn(target)] = time.monotonic()
+    print(f"Started {workers} workers: {', '.join(map(str, children))}", flush=True)
+
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            if refresh and not stopping and refresh(hangup):
+                retiring = [pid for pid, started in children.items() if started is not None]
+                for _ in range(workers):
+                    children[_spawn(target)] = time.monotonic()
+                for pid in retiring:
+                    children[pid] = None
+                    os.kill(pid, signal.SIGTERM)
+                print(f"Replaced workers {', '.join(map(str, retiring))}", flush=True)
+            hangup = False
+            time.sleep(1)
+            continue
+
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+
+        print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting.", flush=True)
+        failures = failures + 1 if time.monotonic() - started < MIN_UPTIME else 0
+        if failures:
+            time.sleep(min(2 ** failures, MAX_BACKOFF))
+        if stopping:
+            continue
+        state.count_restart()
+        children[_spawn(target)] = time.monotonic()
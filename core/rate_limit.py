@@ -0,0 +1,221 @@
+'''
+Token-bucket rate limiting for the subscription servers.
+
+Each (route, client address) pair owns a bucket holding up to `requests` tokens
+that refills at `requests / seconds` tokens per second, so a client can burst up
+to the limit and is then held to the average rate, with no window edges to game.
+
+Buckets live in an LRU capped at MAX_KEYS. A bucket idle for longer than its
+refill period is full again and is dropped, so memory stays bounded even under a
+scan from many addresses. X-Forwarded-For is only honoured when the direct peer
+is in TRUSTED_PROXIES (comma separated CIDRs); otherwise the header is ignored.
+
+Limits are set per aiohttp route name with RATE_LIMITS, e.g.
+RATE_LIMITS=singbox=100/60,normal=30/60; other routes use RATE_LIMIT requests
+per RATE_LIMIT_WINDOW seconds.
+'''
+import os
+import math
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import tempfile
+import ipaddress
+from collections import OrderedDict
+
+from aiohttp import web
+
+MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '10000'))
+# Default limit of a route: RATE_LIMIT requests per RATE_LIMIT_WINDOW seconds
+DEFAULT_LIMIT = (int(os.getenv('RATE_LIMIT', '100')), float(os.getenv('RATE_LIMIT_WINDOW', '60')))
+
+
+def parse_networks(value: str | None) -> list:
+    networks = []
+    for item in (value or '').split(','):
+        item = item.strip()
+        if item:
+            networks.append(ipaddress.ip_network(item, strict=False))
+    return networks
+
+
+def parse_limits(value: str | None) -> dict:
+    '''"route=requests/seconds,..." -> {route: (requests, seconds)}'''
+    limits = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        try:
+            route, limit = item.split('=', 1)
+            requests, seconds = limit.split('/', 1)
+            limits[route.strip()] = (int(requests), float(seconds))
+        except ValueError:
+            print(f"Error: Invalid rate limit '{item.strip()}', expected route=requests/seconds.")
+    return limits
+
+
+TRUSTED_PROXIES = parse_networks(os.getenv('TRUSTED_PROXIES'))
+# Headers a reverse proxy adds to the requests it relays
+FORWARDED_HEADERS = ('X-Forwarded-For', 'X-Real-IP', 'Forwarded')
+ROUTE_LIMITS = parse_limits(os.getenv('RATE_LIMITS'))
+
+
+def _trusted(address: str, networks: list) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def client_address(remote: str | None, forwarded_for: str | None, trusted_proxies: list) -> str:
+    '''
+    The address to rate limit: the peer itself, or, when the peer is a trusted
+    proxy, the right-most X-Forwarded-For hop that is not a trusted proxy.
+    '''
+    address = remote or ''
+    if not forwarded_for or not _trusted(address, trusted_proxies):
+        return address
+    for hop in reversed(forwarded_for.split(',')):
+        hop = hop.strip()
+        if not hop:
+            continue
+        address = hop
+        if not _trusted(hop, trusted_proxies):
+            break
+    return address
+
+
+def is_local_request(request: web.Request) -> bool:
+    '''
+    True for a request made on this host itself. Requests relayed by a reverse
+    proxy on this host also come from loopback, so they are told apart by the
+    forwarding headers such a proxy adds.
+    '''
+    if any(header in request.headers for header in FORWARDED_HEADERS):
+        return False
+    try:
+        return ipaddress.ip_address(request.remote or '').is_loopback
+    except ValueError:
+        return False
+
+
+class RateLimiter:
+    def __init__(self, limits: dict | None = None, default: tuple = DEFAULT_LIMIT, max_keys: int = MAX_KEYS):
+        # route name -> (requests, seconds)
+        self.limits = ROUTE_LIMITS if limits is None else limits
+        self.default = default
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()  # (route, address) -> [tokens, last_update, seconds]
+        self.counters = {'allowed': 0, 'rejected': 0, 'evicted': 0}
+
+    def limit(self, route: str) -> tuple:
+        return self.limits.get(route, self.default)
+
+    def acquire(self, route: str, address: str, now: float | None = None) -> float:
+        '''Takes a token. Returns 0 if allowed, otherwise the seconds until a token is available.'''
+        now = time.monotonic() if now is None else now
+        requests, seconds = self.limit(route)
+        rate = requests / seconds
+        key = (route, address)
+
+        bucket = self.buckets.get(key)
+        tokens = requests if bucket is None else min(requests, bucket[0] + (now - bucket[1]) * rate)
+
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+            self.counters['allowed'] += 1
+        else:
+            wait = (1 - tokens) / rate
+            self.counters['rejected'] += 1
+
+        self.buckets[key] = [tokens, now, seconds]
+        self.buckets.move_to_end(key)
+        self.prune(now)
+        return wait
+
+    def prune(self, now: float):
+        while self.buckets:
+            key, (_, last, seconds) = next(iter(self.buckets.items()))
+            if len(self.buckets) <= self.max_keys and now - last < seconds:
+                break
+            del self.buckets[key]
+            self.counters['evicted'] += 1
+
+    def stats(self) -> dict:
+        return {**self.counters, 'tracked': len(self.buckets)}
+
+
+class SharedRateLimiter(RateLimiter):
+    '''
+    RateLimiter whose buckets live in an anonymous shared mapping, so the workers
+    forked by prefork.serve() enforce one limit per client between them.
+
+    The table is direct mapped with max_keys slots, so its size is fixed: a new
+    client takes over its slot, and a still active bucket it replaces counts as
+    evicted. Slots are updated under a POSIX record lock, which the kernel
+    releases if a worker dies holding it.
+    '''
+    COUNTERS = struct.Struct('QQQ')  # allowed, rejected, evicted
+    SLOT = struct.Struct('Qddd')  # key hash, tokens, last_update, seconds
+
+    def __init__(self, limits: dict | None = None, default: tuple = DEFAULT_LIMIT, max_keys: int = MAX_KEYS):
+        super().__init__(limits, default, max_keys)
+        self.mem = mmap.mmap(-1, self.COUNTERS.size + self.SLOT.size * max_keys)
+        self.lock_file = tempfile.TemporaryFile()
+
+    def _count(self, allowed: int = 0, rejected: int = 0, evicted: int = 0):
+        counts = self.COUNTERS.unpack_from(self.mem, 0)
+        self.COUNTERS.pack_into(self.mem, 0, counts[0] + allowed, counts[1] + rejected, counts[2] + evicted)
+
+    def acquire(self, route: str, address: str, now: float | None = None) -> float:
+        # CLOCK_MONOTONIC is system wide, so timestamps compare across workers
+        now = time.monotonic() if now is None else now
+        requests, seconds = self.limit(route)
+        rate = requests / seconds
+        digest = hashlib.blake2b(f'{route}\0{address}'.encode(), digest_size=8).digest()
+        key = int.from_bytes(digest, 'little') or 1
+        offset = self.COUNTERS.size + (key % self.max_keys) * self.SLOT.size
+
+        fcntl.lockf(self.lock_file, fcntl.LOCK_EX)
+        try:
+            slot_key, tokens, last, period = self.SLOT.unpack_from(self.mem, offset)
+            evicted = int(slot_key not in (0, key) and now - last < period)
+            tokens = min(requests, tokens + (now - last) * rate) if slot_key == key else requests
+
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+                self._count(allowed=1, evicted=evicted)
+            else:
+                wait = (1 - tokens) / rate
+                self._count(rejected=1, evicted=evicted)
+            self.SLOT.pack_into(self.mem, offset, key, tokens, now, seconds)
+        finally:
+            fcntl.lockf(self.lock_file, fcntl.LOCK_UN)
+        return wait
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        allowed, rejected, evicted = self.COUNTERS.unpack_from(self.mem, 0)
+        tracked = 0
+        for slot_key, _, last, period in self.SLOT.iter_unpack(self.mem[self.COUNTERS.size:]):
+            if slot_key and now - last < period:
+                tracked += 1
+        return {'allowed': allowed, 'rejected': rejected, 'evicted': evicted, 'tracked': tracked}
+
+
+def rate_limit_middleware(limiter: RateLimiter, trusted_proxies: list = TRUSTED_PROXIES):
+    @web.middleware
+    async def middleware(request, handler):
+        route = request.match_info.route.name or 'default'
+        address = client_address(request.remote, request.headers.get('X-Forwarded-For'), trusted_proxies)
+        wait = limiter.acquire(route, address)
+        if wait:
+            return web.Response(status=429, text="Rate limit exceeded.", headers={'Retry-After': str(math.ceil(wait))})
+        return await handler(request)
+
+    return middleware
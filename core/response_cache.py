@@ -0,0 +1,113 @@
+'''
+Conditional GET support for the subscription servers.
+
+The ETag of a subscription is a hash of everything the body is rendered from
+(the user's password, the server parameters, SNI, fragment, template), so it is
+known before anything is rendered: a poll carrying a matching If-None-Match is
+answered with 304 straight away. Rendered bodies are kept in a bounded LRU keyed
+by the request; an entry is only served while its ETag still matches the
+current inputs, so a change to users.json/users.db, config.json or
+.configs.env that affects a user invalidates that user's entries.
+
+Compressed bodies (gzip, and brotli when the Brotli package is installed) are
+cached in the same LRU under the rendered body's key plus the coding, so a
+body is compressed once per change rather than once per request. Each coding
+gets its own ETag suffix, as a compressed representation must.
+'''
+import os
+import gzip
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_CONTROL = 'private, no-cache'
+MAX_ENTRIES = int(os.getenv('SUB_CACHE_ENTRIES', '2048'))
+# Bodies smaller than this are sent as they are
+MIN_COMPRESS_SIZE = 512
+# Preferred first when a client accepts several codings with the same q-value
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def make_etag(*inputs) -> str:
+    payload = json.dumps(inputs, sort_keys=True, separators=(',', ':'), default=str)
+    return '"' + hashlib.sha256(payload.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    '''Weak comparison, as required for If-None-Match.'''
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
+
+
+def encoding_etag(etag: str, encoding: str | None) -> str:
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+def negotiate_encoding(accept_encoding: str | None) -> str | None:
+    '''Best coding from ENCODINGS allowed by an Accept-Encoding header, or None for identity.'''
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+
+    best = None
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (encoding, q)
+    return best[0] if best else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=9)
+    # mtime=0 keeps the output, and so the cached entry, deterministic
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (etag, body)
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'not_modified': 0, 'evicted': 0}
+
+    def get(self, key, etag: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != etag:
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+
+    def put(self, key, etag: str, body):
+        with self.lock:
+            self.entries[key] = (etag, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evicted'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,76 @@
+#!/bin/bash
+source /etc/hysteria/core/scripts/path.sh
+source /etc/hysteria/core/scripts/utils.sh
+define_colors
+
+AUTH_PORT=28262
+
+create_service_file() {
+    cat <<EOL > /etc/systemd/system/hysteria-auth.service
+[Unit]
+Description=Hysteria2 HTTP Auth Service
+After=network.target
+Before=hysteria-server.service
+
+[Service]
+ExecStart=/bin/bash -c 'source /etc/hysteria/hysteria2_venv/bin/activate && /etc/hysteria/hysteria2_venv/bin/python /etc/hysteria/core/scripts/auth/auth_server.py'
+WorkingDirectory=/etc/hysteria/core/scripts/auth
+EnvironmentFile=/etc/hysteria/core/scripts/auth/.env
+Restart=always
+User=root
+Group=root
+
+[Install]
+WantedBy=multi-user.target
+EOL
+}
+
+use_http() {
+    cat <<EOL > "$AUTH_ENV"
+AUTH_HOST=127.0.0.1
+AUTH_PORT=$AUTH_PORT
+EOL
+
+    create_service_file
+    systemctl daemon-reload
+    systemctl enable hysteria-auth.service > /dev/null 2>&1
+    systemctl restart hysteria-auth.service > /dev/null 2>&1
+
+    if ! systemctl is-active --quiet hysteria-auth.service; then
+        echo -e "${red}Error:${NC} hysteria-auth.service failed to start. Auth mode was not changed."
+        exit 1
+    fi
+
+    jq --arg url "http://127.0.0.1:$AUTH_PORT/auth" \
+       '.auth = {type: "http", http: {url: $url, insecure: false}}' \
+       "$CONFIG_FILE" > "${CONFIG_FILE}.temp" && mv "${CONFIG_FILE}.temp" "$CONFIG_FILE"
+
+    python3 "$CLI_PATH" restart-hysteria2 > /dev/null 2>&1
+    echo -e "${green}Auth mode set to http.${NC} Hysteria2 now authenticates through hysteria-auth.service."
+}
+
+use_command() {
+    jq '.auth = {type: "command", command: "/etc/hysteria/core/scripts/hysteria2/user.sh"}' \
+       "$CONFIG_FILE" > "${CONFIG_FILE}.temp" && mv "${CONFIG_FILE}.temp" "$CONFIG_FILE"
+    chmod +x /etc/hysteria/core/scripts/hysteria2/user.sh
+
+    python3 "$CLI_PATH" restart-hysteria2 > /dev/null 2>&1
+
+    systemctl stop hysteria-auth.service > /dev/null 2>&1
+    systemctl disable hysteria-auth.service > /dev/null 2>&1
+    rm -f "$AUTH_ENV"
+    echo -e "${green}Auth mode set to command.${NC} Hysteria2 now authenticates through user.sh."
+}
+
+case "$1" in
+    http)
+        use_http
+        ;;
+    command)
+        use_command
+        ;;
+    *)
+        echo -e "${red}Usage: $0 {http|command} ${NC}"
+        exit 1
+        ;;
+esac
@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import time
+import asyncio
+from aiohttp import web, ClientSession, ClientTimeout
+from dotenv import load_dotenv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import paths
+from user_index import UserIndex
+from throttle import AuthThrottle
+
+load_dotenv()
+
+# Environment variables
+HOST = os.getenv('AUTH_HOST', '127.0.0.1')
+PORT = int(os.getenv('AUTH_PORT', '28262'))
+
+KICK_API_URL = f'{paths.TRAFFIC_API}/kick'
+
+index = UserIndex()
+throttle = AuthThrottle()
+
+# user.sh used to `sleep 20` on these; now they only feed the throttle
+FAILURES = ('unknown', 'blocked', 'password')
+
+
+def split_auth(auth: str) -> tuple[str, str]:
+    # user.sh splits on the first ':' only, the password may contain more
+    username, _, password = auth.partition(':')
+    return username, password
+
+
+def check_user(username: str, password: str, now: float) -> str:
+    '''
+    Mirrors the decisions of scripts/hysteria2/user.sh.
+    Returns one of: 'ok', 'unknown', 'blocked', 'password', 'expired', 'quota'.
+    '''
+    record = index.get(username)
+    if record is None:
+        return 'unknown'
+
+    if record.get('blocked') is True:
+        return 'blocked'
+
+    if record.get('password') != password:
+        return 'password'
+
+    expires_at = index.expires_at(username)
+    if expires_at is not None and now >= expires_at:
+        return 'expired'
+
+    download_bytes = record.get('download_bytes')
+    max_download_bytes = record.get('max_download_bytes')
+    if isinstance(download_bytes, int) and isinstance(max_download_bytes, int) and download_bytes >= max_download_bytes:
+        return 'quota'
+
+    return 'ok'
+
+
+def load_traffic_secret() -> str | None:
+    try:
+        with open(paths.CONFIG_FILE, 'r') as f:
+            return json.load(f).get('trafficStats', {}).get('secret')
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+async def kick_user(app, username: str):
+    secret = load_traffic_secret()
+    if not secret:
+        return
+    try:
+        async with app['client'].post(KICK_API_URL, json=[username], headers={'Authorization': secret}) as resp:
+            await resp.read()
+    except Exception as e:
+        print(f"Error: failed to kick {username}: {e}")
+
+
+async def handle_auth(request):
+    try:
+        payload = await request.json()
+        addr = str(payload.get('addr', ''))
+        username, password = split_auth(str(payload.get('auth', '')))
+    except (json.JSONDecodeError, AttributeError):
+        return web.json_response({'ok': False, 'id': ''}, status=400)
+
+    now = time.time()
+    if not throttle.allowed(addr, username, now):
+        return web.json_response({'ok': False, 'id': ''})
+
+    decision = check_user(username, password, now)
+
+    if decision == 'ok':
+        return web.json_response({'ok': True, 'id': username})
+
+    if decision in FAILURES:
+        throttle.record_failure(addr, username, now)
+
+    loop = asyncio.get_running_loop()
+    if decision == 'expired':
+        await loop.run_in_executor(None, index.store.block, [username])
+    elif decision == 'quota':
+        await kick_user(request.app, username)
+        await loop.run_in_executor(None, index.store.block, [username])
+
+    return web.json_response({'ok': False, 'id': ''})
+
+
+async def handle_stats(request):
+    return web.json_response({'throttle': throttle.stats()})
+
+
+async def on_startup(app):
+    app['client'] = ClientSession(timeout=ClientTimeout(total=5))
+    index.users()
+
+
+async def on_cleanup(app):
+    await app['client'].close()
+
+
+if __name__ == '__main__':
+    app = web.Application()
+    app.add_routes([
+        web.post('/auth', handle_auth),
+        web.get('/stats', handle_stats),
+    ])
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+    web.run_app(app, host=HOST, port=PORT, access_log=None)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+'''
+Brute-force throttle for the auth backends.
+
+Failed logins are counted per source address and per username. Counters decay
+exponentially (score halves every `half_life` seconds) and a key is rejected
+while its decayed score is at or above its limit. The table is an LRU capped at
+`max_entries` and entries idle for longer than `ttl` are dropped, so a scan from
+many addresses cannot grow memory without bound.
+
+auth_server.py uses AuthThrottle in-process. user.sh (command mode) cannot keep
+state between logins, so it appends each failure to SPOOL_FILE and starts
+`throttle.py drain` under `flock -n`, so a scan leaves one drainer running
+instead of a Python process per failed login. The drainer records the spooled
+failures until the spool stays empty, persists the table to STATE_FILE and
+writes one marker file per throttled key containing the unix time the ban
+ends, which user.sh checks with shell builtins only.
+
+The markers decide who may log in, so THROTTLE_DIR lives under /etc/hysteria
+rather than /tmp, and both sides refuse a directory they do not own.
+'''
+import os
+import re
+import sys
+import json
+import math
+import time
+import stat
+import fcntl
+from collections import OrderedDict
+
+THROTTLE_DIR = os.getenv('AUTH_THROTTLE_DIR', '/etc/hysteria/.auth-throttle')
+STATE_FILE = os.path.join(THROTTLE_DIR, 'state.json')
+LOCK_FILE = os.path.join(THROTTLE_DIR, 'state.lock')
+# Lines of "<unix time> <address or -> <username or ->" appended by user.sh
+SPOOL_FILE = os.path.join(THROTTLE_DIR, 'failures')
+
+ADDR_LIMIT = int(os.getenv('AUTH_THROTTLE_ADDR_LIMIT', '10'))
+USER_LIMIT = int(os.getenv('AUTH_THROTTLE_USER_LIMIT', '20'))
+HALF_LIFE = float(os.getenv('AUTH_THROTTLE_HALF_LIFE', '60'))
+MAX_ENTRIES = int(os.getenv('AUTH_THROTTLE_MAX_ENTRIES', '4096'))
+TTL = float(os.getenv('AUTH_THROTTLE_TTL', '900'))
+
+# Marker names end up in file paths and are matched by user.sh
+SAFE_KEY = re.compile(r'^(addr|user)_[A-Za-z0-9.:]+$')
+
+
+def addr_host(addr: str) -> str:
+    '''Strips the port from "1.2.3.4:5678" or "[::1]:5678".'''
+    host = addr.rsplit(':', 1)[0] if addr.count(':') == 1 or addr.startswith('[') else addr
+    return host.strip('[]')
+
+
+class AuthThrottle:
+    def __init__(self, addr_limit=ADDR_LIMIT, user_limit=USER_LIMIT, half_life=HALF_LIFE, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.addr_limit = addr_limit
+        self.user_limit = user_limit
+        self.half_life = half_life
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> [score, last_update]
+        self.counters = {'checks': 0, 'rejected': 0, 'failures': 0, 'evicted': 0}
+
+    def _keys(self, addr: str, username: str) -> list[tuple[str, int]]:
+        keys = []
+        if addr:
+            keys.append((f'addr_{addr_host(addr)}', self.addr_limit))
+        if username:
+            keys.append((f'user_{username}', self.user_limit))
+        return keys
+
+    def _score(self, key: str, now: float) -> float:
+        entry = self.entries.get(key)
+        if entry is None:
+            return 0.0
+        score, last = entry
+        return score * 0.5 ** (max(now - last, 0) / self.half_life)
+
+    def _limit(self, key: str) -> int:
+        return self.addr_limit if key.startswith('addr_') else self.user_limit
+
+    def banned_until(self, key: str, now: float) -> float:
+        '''Time at which the decayed score of `key` drops below its limit.'''
+        score = self._score(key, now)
+        limit = self._limit(key)
+        if score < limit:
+            return 0.0
+        return now + self.half_life * math.log2(score / limit)
+
+    def allowed(self, addr: str, username: str, now: float | None = None) -> bool:
+        now = time.time() if now is None else now
+        self.counters['checks'] += 1
+        for key, limit in self._keys(addr, username):
+            if self._score(key, now) >= limit:
+                self.counters['rejected'] += 1
+                return False
+        return True
+
+    def record_failure(self, addr: str, username: str, now: float | None = None):
+        now = time.time() if now is None else now
+        self.counters['failures'] += 1
+        for key, _ in self._keys(addr, username):
+            self.entries[key] = [self._score(key, now) + 1, now]
+            self.entries.move_to_end(key)
+        self.prune(now)
+
+    def prune(self, now: float):
+        while self.entries:
+            key, (_, last) = next(iter(self.entries.items()))
+            if len(self.entries) <= self.max_entries and now - last < self.ttl:
+                break
+            del self.entries[key]
+            self.counters['evicted'] += 1
+
+    def stats(self) -> dict:
+        now = time.time()
+        throttled = sum(1 for key in self.entries if self._score(key, now) >= self._limit(key))
+        return {**self.counters, 'tracked': len(self.entries), 'throttled': throttled}
+
+
+# region command mode
+
+def load_state() -> AuthThrottle:
+    throttle = AuthThrottle()
+    try:
+        with open(STATE_FILE, 'r') as f:
+            state = json.load(f)
+        throttle.entries = OrderedDict(state.get('entries', []))
+        throttle.counters.update(state.get('counters', {}))
+    except (OSError, json.JSONDecodeError, TypeError, ValueError):
+        pass
+    return throttle
+
+
+def save_state(throttle: AuthThrottle, now: float):
+    temp_file = f'{STATE_FILE}.temp'
+    with open(temp_file, 'w') as f:
+        json.dump({'entries': list(throttle.entries.items()), 'counters': throttle.counters}, f)
+    os.replace(temp_file, STATE_FILE)
+
+    live = set()
+    for key in throttle.entries:
+        until = throttle.banned_until(key, now)
+        if until and SAFE_KEY.match(key):
+            live.add(key)
+            with open(os.path.join(THROTTLE_DIR, key), 'w') as f:
+                f.write(f'{int(math.ceil(until))}\n')
+
+    for name in os.listdir(THROTTLE_DIR):
+        if SAFE_KEY.match(name) and name not in live:
+            os.remove(os.path.join(THROTTLE_DIR, name))
+
+
+def drain_spool(throttle: AuthThrottle) -> bool:
+    '''Records the spooled failures; False when the spool was empty.'''
+    batch = f'{SPOOL_FILE}.{os.getpid()}'
+    try:
+        os.rename(SPOOL_FILE, batch)
+    except FileNotFoundError:
+        return False
+    with open(batch, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) != 3 or not fields[0].isdigit():
+                continue
+            addr, username = (field if field != '-' else '' for field in fields[1:])
+            throttle.record_failure(addr, username, float(fields[0]))
+    os.remove(batch)
+    return True
+
+
+def trusted_dir() -> bool:
+    '''Creates THROTTLE_DIR, and checks nobody else could have planted markers in it.'''
+    os.makedirs(THROTTLE_DIR, mode=0o700, exist_ok=True)
+    st = os.lstat(THROTTLE_DIR)
+    return stat.S_ISDIR(st.st_mode) and st.st_uid == os.geteuid() and not st.st_mode & 0o022
+
+
+def main(argv: list[str]) -> int:
+    if len(argv) < 2 or argv[1] not in ('fail', 'drain', 'stats'):
+        print(f'Usage: {argv[0]} fail <addr> <username> | drain | stats')
+        return 1
+
+    if not trusted_dir():
+        print(f'Error: {THROTTLE_DIR} must be a directory owned by this user and writable by nobody else')
+        return 1
+    with open(LOCK_FILE, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        throttle = load_state()
+
+        if argv[1] == 'stats':
+            print(json.dumps(throttle.stats(), indent=4))
+            return 0
+
+        if argv[1] == 'drain':
+            # Failures spooled while a batch is recorded are picked up by the next round
+            while drain_spool(throttle):
+                save_state(throttle, time.time())
+            return 0
+
+        now = time.time()
+        addr = argv[2] if len(argv) > 2 else ''
+        username = argv[3] if len(argv) > 3 else ''
+        throttle.record_failure(addr, username, now)
+        save_state(throttle, now)
+    return 0
+
+# endregion
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -23,9 +23,19 @@ FILES_TO_BACKUP=(
     "/etc/hysteria/core/scripts/telegrambot/test_configs.json"
 )
 
+# Snapshot users.db through SQLite so the copy is consistent while services write to it
+if [ -f "/etc/hysteria/users.db" ]; then
+    SNAPSHOT_DIR=$(mktemp -d)
+    sqlite3 "/etc/hysteria/users.db" ".backup '$SNAPSHOT_DIR/users.db'"
+    FILES_TO_BACKUP+=("$SNAPSHOT_DIR/users.db")
+fi
+
 zip -j "$BACKUP_FILE" "${FILES_TO_BACKUP[@]}" >/dev/null
+status=$?
+
+[ -n "$SNAPSHOT_DIR" ] && rm -rf "$SNAPSHOT_DIR"
 
-if [ $? -eq 0 ]; then
+if [ $status -eq 0 ]; then
     echo "Backup successfully created"
 else
     echo "Backup failed!"
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+'''
+Quota and expiry enforcer, run every minute by kick.sh.
+
+The user set is loaded once and evaluated in a single pass. Every user to block
+is written in one store transaction (one atomic users.json replace or one
+SQLite commit) and all of them are disconnected with one POST to /kick. The
+per-user lines in kick.log are the same as the old shell loop wrote; each run
+ends with a summary line carrying the counts and the time taken.
+
+When hysteria-traffic.service runs, core/expiry.py already blocks accounts at
+their exact deadline and this pass only catches quota overruns (and expiries
+missed while the service was down).
+'''
+import os
+import sys
+import json
+import time
+import fcntl
+import shutil
+import sqlite3
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import paths
+import storage
+from traffic import TrafficClient, TrafficApiError
+
+LOCK_FILE = '/tmp/kick.lock'
+LOG_FILE = '/var/log/kick.log'
+BACKUP_FILE = f'{paths.USERS_FILE}.bak'
+
+
+def log_time() -> str:
+    # Same format as `$(date)` in the old kick.sh
+    return time.strftime('%a %b %e %H:%M:%S %Z %Y')
+
+
+def evaluate(users: dict, now: float) -> tuple[list[str], list[str]]:
+    '''Returns (usernames to block, kick.log lines for skipped users).'''
+    to_block = []
+    skipped = []
+    for username in sorted(users):
+        record = users[username]
+        if record.get('blocked') is True:
+            skipped.append(f'[INFO] Skipping {username} as they are already blocked.')
+            continue
+
+        creation_date = record.get('account_creation_date')
+        if not creation_date:
+            skipped.append(f'[INFO] Skipping {username} due to missing account creation date.')
+            continue
+
+        max_download_bytes = record.get('max_download_bytes') or 0
+        expiration_days = record.get('expiration_days') or 0
+        download_bytes = record.get('download_bytes') or 0
+        expires_at = storage.record_expiry(record)
+
+        if max_download_bytes > 0 and download_bytes >= 0 and expiration_days > 0 and expires_at is not None:
+            if download_bytes >= max_download_bytes or now >= expires_at:
+                to_block.append(username)
+        else:
+            skipped.append(f'[INFO] Skipping {username} due to invalid or missing data.')
+    return to_block, skipped
+
+
+def enforce(log) -> int:
+    started = time.monotonic()
+    store = storage.get_store()
+
+    try:
+        users = store.load()
+    except json.JSONDecodeError:
+        log('[ERROR] Invalid users.json. Restoring backup.')
+        if os.path.exists(BACKUP_FILE):
+            shutil.copy(BACKUP_FILE, paths.USERS_FILE)
+        return 1
+    if store.engine == 'json' and os.path.exists(paths.USERS_FILE):
+        shutil.copy(paths.USERS_FILE, BACKUP_FILE)
+
+    to_block, skipped = evaluate(users, time.time())
+    for line in skipped:
+        log(line)
+
+    blocked = []
+    if to_block:
+        try:
+            blocked = store.block(to_block)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            log(f'[ERROR] Failed to block {len(to_block)} users: {e}')
+            return 1
+
+    kicked = True
+    if blocked:
+        client = TrafficClient()
+        try:
+            client.kick(blocked)
+        except TrafficApiError as e:
+            kicked = False
+            log(f'[ERROR] Failed to kick {len(blocked)} blocked users: {e}')
+        finally:
+            client.close()
+        for username in blocked:
+            log(f'[INFO] Blocked and kicked user {username}.' if kicked else f'[INFO] Blocked user {username}.')
+
+    elapsed = (time.monotonic() - started) * 1000
+    already_blocked = sum(1 for record in users.values() if record.get('blocked') is True)
+    summary = (
+        f'Checked {len(users)} users in {elapsed:.1f} ms: blocked {len(blocked)}, '
+        f'already blocked {already_blocked}, skipped {len(skipped) - already_blocked}.'
+    )
+    log(f'[INFO] {summary}')
+    print(summary)
+    return 0 if kicked else 1
+
+
+def main() -> int:
+    with open(LOCK_FILE, 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # The previous run is still going
+            return 1
+
+        lines = []
+        try:
+            return enforce(lambda message: lines.append(f'{log_time()}: {message}\n'))
+        finally:
+            with open(LOG_FILE, 'a') as f:
+                f.writelines(lines)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -50,7 +50,13 @@ echo "👥 Online Users: $online_user_count"
 echo 
 echo "🚦Total Traffic: "
 
-if [ -f "$USERS_FILE" ]; then
+if grep -qs '^USER_STORAGE=sqlite' "$CONFIG_ENV"; then
+    IFS='|' read -r total_upload total_download <<< "$(sqlite3 -cmd ".timeout 5000" "$USERS_DB" "SELECT IFNULL(SUM(upload_bytes), 0), IFNULL(SUM(download_bytes), 0) FROM users")"
+
+    echo "🔼$(convert_bytes $total_upload) uploaded"
+
+    echo "🔽$(convert_bytes $total_download) downloaded"
+elif [ -f "$USERS_FILE" ]; then
     total_upload=0
     total_download=0
 
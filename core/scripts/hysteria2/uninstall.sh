@@ -31,6 +31,10 @@ echo "Removing cron jobs..."
 echo "Removing alias 'hys2' from .bashrc..."
 sed -i '/alias hys2=.*\/etc\/hysteria\/menu.sh/d' ~/.bashrc
 
+echo "Stop/Disabling Traffic Collector Service..."
+systemctl stop hysteria-traffic.service > /dev/null 2>&1
+systemctl disable hysteria-traffic.service > /dev/null 2>&1
+
 echo "Stop/Disabling Hysteria TelegramBOT Service..."
 systemctl stop hysteria-bot.service > /dev/null 2>&1
 systemctl disable hysteria-bot.service > /dev/null 2>&1
@@ -39,6 +43,13 @@ echo "Stop/Disabling Singbox SubLink Service..."
 systemctl stop singbox.service > /dev/null 2>&1
 systemctl disable singbox.service > /dev/null 2>&1
 
+echo "Stop/Disabling Subscription Service..."
+systemctl stop subscription.service > /dev/null 2>&1
+systemctl disable subscription.service > /dev/null 2>&1
+
+echo "Stop/Disabling Hysteria Auth Service..."
+systemctl stop hysteria-auth.service > /dev/null 2>&1
+systemctl disable hysteria-auth.service > /dev/null 2>&1
 
 echo "Hysteria2 uninstalled!"
 echo ""
@@ -8,28 +8,90 @@ source /etc/hysteria/core/scripts/path.sh
 
 IFS=':' read -r USERNAME PASSWORD <<< "$AUTH"
 
-STORED_PASSWORD=$(jq -r --arg user "$USERNAME" '.[$user].password' "$USERS_FILE")
-MAX_DOWNLOAD_BYTES=$(jq -r --arg user "$USERNAME" '.[$user].max_download_bytes' "$USERS_FILE")
-EXPIRATION_DAYS=$(jq -r --arg user "$USERNAME" '.[$user].expiration_days' "$USERS_FILE")
-ACCOUNT_CREATION_DATE=$(jq -r --arg user "$USERNAME" '.[$user].account_creation_date' "$USERS_FILE")
-BLOCKED=$(jq -r --arg user "$USERNAME" '.[$user].blocked' "$USERS_FILE")
-CURRENT_DOWNLOAD_BYTES=$(jq -r --arg user "$USERNAME" '.[$user].download_bytes' "$USERS_FILE")
+CLIENT_IP="${ADDR%:*}"
+CLIENT_IP="${CLIENT_IP#[}"
+CLIENT_IP="${CLIENT_IP%]}"
+printf -v NOW '%(%s)T' -1
 
-if [ "$BLOCKED" == "true" ]; then
-  sleep 20 
+# Marker files are written by throttle.py and hold the unix time the ban ends;
+# they are ignored unless the directory is ours, so nobody else can plant them
+throttled() {
+  local marker="$AUTH_THROTTLE_DIR/$1" until
+  [ -O "$AUTH_THROTTLE_DIR" ] && [ -f "$marker" ] || return 1
+  read -r until < "$marker"
+  [ "${until:-0}" -gt "$NOW" ]
+}
+
+# Spool the failure and reject right away. Only one drainer runs at a time:
+# while it does, flock -n returns at once instead of starting another python3
+reject() {
+  local addr="-" user="-"
+  [[ "$CLIENT_IP" =~ ^[0-9a-fA-F.:]+$ ]] && addr="$CLIENT_IP"
+  [[ "$USERNAME" =~ ^[a-zA-Z0-9]+$ ]] && user="$USERNAME"
+  if [ -O "$AUTH_THROTTLE_DIR" ] || mkdir -m 700 "$AUTH_THROTTLE_DIR" 2> /dev/null; then
+    echo "$NOW $addr $user" >> "$AUTH_THROTTLE_DIR/failures"
+    flock -n "$AUTH_THROTTLE_DIR/drain.lock" python3 "$AUTH_THROTTLE" drain > /dev/null 2>&1 &
+  fi
+  exit 1
+}
+
+if [[ "$CLIENT_IP" =~ ^[0-9a-fA-F.:]+$ ]] && throttled "addr_$CLIENT_IP"; then
   exit 1
 fi
+if [[ "$USERNAME" =~ ^[a-zA-Z0-9]+$ ]] && throttled "user_$USERNAME"; then
+  exit 1
+fi
+
+block_user() {
+  if [ "$USER_STORAGE" == "sqlite" ]; then
+    sqlite3 -cmd ".timeout 5000" "$USERS_DB" "UPDATE users SET blocked = 1 WHERE username = '$USERNAME'"
+  else
+    # Same lock as the Python store, so a concurrent traffic flush is not overwritten
+    (
+      flock 9
+      jq --arg user "$USERNAME" '.[$user].blocked = true' "$USERS_FILE" > "$USERS_FILE.$$.temp" && mv "$USERS_FILE.$$.temp" "$USERS_FILE"
+    ) 9> "$USERS_FILE.lock"
+  fi
+}
+
+USER_STORAGE=$(grep -s '^USER_STORAGE=' "$CONFIG_ENV" | cut -d'=' -f2)
+
+if [ "$USER_STORAGE" == "sqlite" ]; then
+  # Only letters and digits are valid usernames, which also keeps the query safe
+  if ! [[ "$USERNAME" =~ ^[a-zA-Z0-9]+$ ]]; then
+    reject
+  fi
+  ROW=$(sqlite3 -cmd ".timeout 5000" "$USERS_DB" "SELECT CASE blocked WHEN 1 THEN 'true' ELSE 'false' END, max_download_bytes, IFNULL(download_bytes, 'null'), IFNULL(expires_at, 'null'), password FROM users WHERE username = '$USERNAME'")
+  if [ -z "$ROW" ]; then
+    reject
+  fi
+  IFS='|' read -r BLOCKED MAX_DOWNLOAD_BYTES CURRENT_DOWNLOAD_BYTES EXPIRATION_DATE STORED_PASSWORD <<< "$ROW"
+else
+  # One jq call for the whole record; the password goes last as it may contain '|'
+  ROW=$(jq -r --arg user "$USERNAME" '.[$user] // empty |
+    ([.blocked, .max_download_bytes, .download_bytes, .expires_at, .account_creation_date, .expiration_days] | map(tostring))
+    + [.password // ""] | join("|")' "$USERS_FILE")
+  if [ -z "$ROW" ]; then
+    reject
+  fi
+  IFS='|' read -r BLOCKED MAX_DOWNLOAD_BYTES CURRENT_DOWNLOAD_BYTES EXPIRATION_DATE ACCOUNT_CREATION_DATE EXPIRATION_DAYS STORED_PASSWORD <<< "$ROW"
+fi
+
+if [ "$BLOCKED" == "true" ]; then
+  reject
+fi
 
 if [ "$STORED_PASSWORD" != "$PASSWORD" ]; then
-  sleep 20
-  exit 1
+  reject
 fi
 
-CURRENT_DATE=$(date +%s)
-EXPIRATION_DATE=$(date -d "$ACCOUNT_CREATION_DATE + $EXPIRATION_DAYS days" +%s)
+# Records written before expires_at existed still need date -d
+if [ "$EXPIRATION_DATE" == "null" ] && [ "$USER_STORAGE" != "sqlite" ]; then
+  EXPIRATION_DATE=$(date -d "$ACCOUNT_CREATION_DATE + $EXPIRATION_DAYS days" +%s)
+fi
 
-if [ "$CURRENT_DATE" -ge "$EXPIRATION_DATE" ]; then
-  jq --arg user "$USERNAME" '.[$user].blocked = true' "$USERS_FILE" > temp.json && mv temp.json "$USERS_FILE"
+if [ "$NOW" -ge "$EXPIRATION_DATE" ]; then
+  block_user
   exit 1
 fi
 
@@ -38,7 +100,7 @@ if [ "$CURRENT_DOWNLOAD_BYTES" -ge "$MAX_DOWNLOAD_BYTES" ]; then
   KICK_ENDPOINT="http://127.0.0.1:25413/kick"
   curl -s -H "Authorization: $SECRET" -X POST -d "[\"$USERNAME\"]" "$KICK_ENDPOINT"
 
-  jq --arg user "$USERNAME" '.[$user].blocked = true' "$USERS_FILE" > temp.json && mv temp.json "$USERS_FILE"
+  block_user
   exit 1
 fi
 
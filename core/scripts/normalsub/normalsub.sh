@@ -32,7 +32,8 @@ Description=normalsub Python Service
 After=network.target
 
 [Service]
-ExecStart=/bin/bash -c 'source /etc/hysteria/hysteria2_venv/bin/activate && /etc/hysteria/hysteria2_venv/bin/python /etc/hysteria/core/scripts/normalsub/normalsub.py'
+ExecStart=/bin/bash -c 'source /etc/hysteria/hysteria2_venv/bin/activate && exec /etc/hysteria/hysteria2_venv/bin/python /etc/hysteria/core/scripts/normalsub/normalsub.py'
+ExecReload=/bin/kill -HUP $MAINPID
 WorkingDirectory=/etc/hysteria/core/scripts/normalsub
 EnvironmentFile=/etc/hysteria/core/scripts/normalsub/.env
 Restart=always
@@ -1,11 +1,16 @@
 CLI_PATH="/etc/hysteria/core/cli.py"
 USERS_FILE="/etc/hysteria/users.json"
+USERS_DB="/etc/hysteria/users.db"
 TRAFFIC_FILE="/etc/hysteria/traffic_data.json"
 CONFIG_FILE="/etc/hysteria/config.json"
 CONFIG_ENV="/etc/hysteria/.configs.env"
 TELEGRAM_ENV="/etc/hysteria/core/scripts/telegrambot/.env"
 SINGBOX_ENV="/etc/hysteria/core/scripts/singbox/.env"
 NORMALSUB_ENV="/etc/hysteria/core/scripts/normalsub/.env"
+SUBSCRIPTION_ENV="/etc/hysteria/core/scripts/subscription/.env"
+AUTH_ENV="/etc/hysteria/core/scripts/auth/.env"
+AUTH_THROTTLE="/etc/hysteria/core/scripts/auth/throttle.py"
+AUTH_THROTTLE_DIR="/etc/hysteria/.auth-throttle"
 ONLINE_API_URL="http://127.0.0.1:25413/online"
 LOCALVERSION="/etc/hysteria/VERSION"
 LATESTVERSION="https://raw.githubusercontent.com/SeyedHashtag/Hysteria2/main/VERSION"
@@ -0,0 +1,25 @@
+'''
+Unified subscription server: sing-box JSON, URI list (plain or base64) and
+Clash-Meta YAML from one process, one user index and one response cache.
+/sub/singbox/... and /sub/normal/... are served too, so sublinks handed out by
+singbox.service and normalsub.service keep working when pointed here.
+'''
+import os
+import sys
+from dotenv import load_dotenv
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+# Before the core modules, which read their settings (SUB_*, RATE_LIMIT*, ...) on import
+load_dotenv()
+
+import subscription
+
+# Environment variables
+DOMAIN = os.getenv('HYSTERIA_DOMAIN')
+CERTFILE = os.getenv('HYSTERIA_CERTFILE')
+KEYFILE = os.getenv('HYSTERIA_KEYFILE')
+PORT = int(os.getenv('HYSTERIA_PORT', '3326'))
+
+if __name__ == '__main__':
+    subscription.run(subscription.ROUTES, PORT, CERTFILE, KEYFILE)
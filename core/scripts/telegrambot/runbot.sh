@@ -7,12 +7,10 @@ update_env_file() {
     local admin_user_ids=$2
     local env_file="/etc/hysteria/core/scripts/telegrambot/.env"
 
-    # Save existing Cryptomus credentials if they exist
-    local merchant_id=""
-    local api_key=""
+    # Save existing Cryptomus settings (credentials, webhook) if they exist
+    local cryptomus_settings=""
     if [ -f "$env_file" ]; then
-        merchant_id=$(grep CRYPTOMUS_MERCHANT_ID "$env_file" | cut -d '=' -f2)
-        api_key=$(grep CRYPTOMUS_API_KEY "$env_file" | cut -d '=' -f2)
+        cryptomus_settings=$(grep '^CRYPTOMUS_' "$env_file")
     fi
 
     # Create new .env file
@@ -21,12 +19,9 @@ API_TOKEN=$api_token
 ADMIN_USER_IDS=[$admin_user_ids]
 EOL
 
-    # Add back Cryptomus credentials if they existed
-    if [ ! -z "$merchant_id" ]; then
-        echo "CRYPTOMUS_MERCHANT_ID=$merchant_id" >> "$env_file"
-    fi
-    if [ ! -z "$api_key" ]; then
-        echo "CRYPTOMUS_API_KEY=$api_key" >> "$env_file"
+    # Add back Cryptomus settings if they existed
+    if [ ! -z "$cryptomus_settings" ]; then
+        echo "$cryptomus_settings" >> "$env_file"
     fi
 }
 
@@ -27,4 +27,12 @@ def send_welcome(message):
 register_handlers()
 
 if __name__ == '__main__':
+    # Finish the paid invoices whose config creation was interrupted by a restart
+    runtime.run_background(resume_payments)
+    # Resume the status checks of invoices that were pending before a restart
+    payment_scheduler.start()
+    # Cryptomus notifications finish paid invoices without waiting for a check
+    payment_webhook.start(payment_processor, handle_payment_notification)
+    # Finish the broadcasts that were interrupted by a restart
+    broadcast.resume_jobs()
     bot.polling(none_stop=True)
@@ -1,6 +1,3 @@
-import qrcode
-import io
-import json
 from telebot import types
 from utils.command import *
 from utils.common import create_main_markup  
@@ -29,24 +26,10 @@ def process_add_user_step1(message):
         bot.register_next_step_handler(message, process_add_user_step1)
         return
 
-    command = f"python3 {CLI_PATH} list-users"
-    result = run_cli_command(command)
-
-    try:
-        users = json.loads(result)
-        existing_users = {user.lower() for user in users.keys()}
-
-        if username.lower() in existing_users:
-            bot.reply_to(message, f"Username '{username}' already exists. Please choose a different username:", reply_markup=create_cancel_markup())
-            bot.register_next_step_handler(message, process_add_user_step1)
-            return
-    except json.JSONDecodeError:
-        if "No such file or directory" in result or result.strip() == "":
-            bot.reply_to(message, "User list file does not exist. Adding the first user.", reply_markup=create_cancel_markup())
-        else:
-            bot.reply_to(message, "Error retrieving user list. Please try again later.")
-            bot.send_message(message.chat.id, "Returning to main menu...", reply_markup=create_main_markup())
-            return
+    if users.find_user(username) is not None:
+        bot.reply_to(message, f"Username '{username}' already exists. Please choose a different username:", reply_markup=create_cancel_markup())
+        bot.register_next_step_handler(message, process_add_user_step1)
+        return
 
     msg = bot.reply_to(message, "Enter traffic limit (GB):", reply_markup=create_cancel_markup(back_step=process_add_user_step1))
     bot.register_next_step_handler(msg, process_add_user_step2, username)
@@ -79,25 +62,23 @@ def process_add_user_step3(message, username, traffic_limit):
 
     try:
         expiration_days = int(message.text.strip())
-        lower_username = username.lower()
-        command = f"python3 {CLI_PATH} add-user -u {username} -t {traffic_limit} -e {expiration_days}"
-        result = run_cli_command(command)
+    except ValueError:
+        bot.reply_to(message, "Invalid expiration days. Please enter a number:", reply_markup=create_cancel_markup(back_step=process_add_user_step2))
+        bot.register_next_step_handler(message, process_add_user_step3, username, traffic_limit)
+        return
 
-        bot.send_chat_action(message.chat.id, 'typing')
-        qr_command = f"python3 {CLI_PATH} show-user-uri -u {lower_username} -ip 4"
-        qr_result = run_cli_command(qr_command).replace("IPv4:\n", "").strip()
+    try:
+        user = users.add_user(username, traffic_limit, expiration_days)
+    except users.UserError as e:
+        bot.reply_to(message, str(e), reply_markup=create_main_markup())
+        return
 
-        if not qr_result:
-            bot.reply_to(message, "Failed to generate QR code.", reply_markup=create_main_markup())
-            return
+    bot.send_chat_action(message.chat.id, 'typing')
+    qr_result = get_user_uri(user.username)
 
-        qr_v4 = qrcode.make(qr_result)
-        bio_v4 = io.BytesIO()
-        qr_v4.save(bio_v4, 'PNG')
-        bio_v4.seek(0)
-        caption = f"{result}\n\n`{qr_result}`"
-        bot.send_photo(message.chat.id, photo=bio_v4, caption=caption, parse_mode="Markdown", reply_markup=create_main_markup())
+    if not qr_result:
+        bot.reply_to(message, "Failed to generate QR code.", reply_markup=create_main_markup())
+        return
 
-    except ValueError:
-        bot.reply_to(message, "Invalid expiration days. Please enter a number:", reply_markup=create_cancel_markup(back_step=process_add_user_step2))
-        bot.register_next_step_handler(message, process_add_user_step3, username, traffic_limit)
+    caption = f"User {username} added successfully.\n\n`{qr_result}`"
+    bot.send_photo(message.chat.id, photo=runtime.qr_png(qr_result), caption=caption, parse_mode="Markdown", reply_markup=create_main_markup())
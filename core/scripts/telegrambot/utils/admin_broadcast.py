@@ -1,7 +1,7 @@
 from telebot import types
 from utils.command import *
 from utils.common import create_main_markup
-import json
+from utils import broadcast
 
 def create_broadcast_markup():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
@@ -10,28 +10,9 @@ def create_broadcast_markup():
     return markup
 
 def get_user_ids(filter_type):
-    command = f"python3 {CLI_PATH} list-users"
-    result = run_cli_command(command)
-    
+    # Telegram IDs come from the config index of the user store, see users.config_owners()
     try:
-        users = json.loads(result)
-        user_ids = set()
-        
-        for username, details in users.items():
-            if username.startswith('id'):  # Skip if not a user config
-                continue
-                
-            # Extract telegram_id from username (format: {telegram_id}d{timestamp})
-            telegram_id = username.split('d')[0]
-            
-            if filter_type == 'all':
-                user_ids.add(telegram_id)
-            elif filter_type == 'active' and not details.get('blocked', False):
-                user_ids.add(telegram_id)
-            elif filter_type == 'expired' and details.get('blocked', True):
-                user_ids.add(telegram_id)
-                
-        return list(user_ids)
+        return users.config_owners(None if filter_type == 'all' else filter_type)
     except Exception as e:
         print(f"Error getting user IDs: {str(e)}")
         return []
@@ -96,36 +77,6 @@ def send_broadcast(message, target):
         )
         return
         
-    success_count = 0
-    fail_count = 0
-    
     status_msg = bot.reply_to(message, f"Broadcasting message to {len(user_ids)} users...")
-    
-    for user_id in user_ids:
-        try:
-            bot.send_message(int(user_id), broadcast_text)
-            success_count += 1
-        except Exception as e:
-            print(f"Failed to send broadcast to {user_id}: {str(e)}")
-            fail_count += 1
-            
-        # Update status every 10 users
-        if (success_count + fail_count) % 10 == 0:
-            try:
-                bot.edit_message_text(
-                    f"Broadcasting: {success_count + fail_count}/{len(user_ids)} completed...",
-                    chat_id=status_msg.chat.id,
-                    message_id=status_msg.message_id
-                )
-            except:
-                pass
-    
-    final_report = (
-        "📢 Broadcast Completed\n\n"
-        f"Target: {message.text}\n"
-        f"Total Users: {len(user_ids)}\n"
-        f"✅ Successful: {success_count}\n"
-        f"❌ Failed: {fail_count}"
-    )
-    
-    bot.reply_to(message, final_report, reply_markup=create_main_markup(is_admin=True)) 
+    # Sent from the broadcast thread so the admin's chat stays responsive meanwhile
+    broadcast.start(message.chat.id, status_msg.message_id, target, broadcast_text, user_ids)
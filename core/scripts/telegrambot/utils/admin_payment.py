@@ -1,6 +1,7 @@
 from telebot import types
 from utils.command import *
 from utils.common import create_main_markup
+from utils.client import payment_processor
 import os
 from dotenv import load_dotenv, set_key
 
@@ -9,6 +10,16 @@ def create_cancel_markup():
     markup.row(types.KeyboardButton("❌ Cancel"))
     return markup
 
+def format_gateway_stats(stats):
+    text = f"Gateway: {stats['breaker']}"
+    for path, counters in stats['calls'].items():
+        text += (
+            f"\n{path}: {counters['calls']} calls, {counters['errors']} errors, "
+            f"{counters['retries']} retries, {counters['rejected']} rejected, "
+            f"avg {counters['latency_avg'] * 1000:.0f} ms, max {counters['latency_max'] * 1000:.0f} ms"
+        )
+    return text
+
 @bot.message_handler(func=lambda message: is_admin(message.from_user.id) and message.text == '💳 Payment Settings')
 def payment_settings(message):
     # Show current status
@@ -17,7 +28,8 @@ def payment_settings(message):
     
     status_text = "Current Payment Settings:\n"
     status_text += f"Merchant ID: {'✅ Configured' if current_merchant_id else '❌ Not configured'}\n"
-    status_text += f"API Key: {'✅ Configured' if current_api_key else '❌ Not configured'}\n\n"
+    status_text += f"API Key: {'✅ Configured' if current_api_key else '❌ Not configured'}\n"
+    status_text += format_gateway_stats(payment_processor.stats()) + "\n\n"
     status_text += "Please enter your Cryptomus Merchant ID:"
     
     msg = bot.reply_to(
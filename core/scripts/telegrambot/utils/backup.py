@@ -1,7 +1,5 @@
 import telebot
 import subprocess
-import qrcode
-import io
 import json
 import os
 import shlex
@@ -15,7 +13,9 @@ from utils.command import *
 def backup_server(message):
     bot.reply_to(message, "Starting backup. This may take a few moments...")
     bot.send_chat_action(message.chat.id, 'typing')
-    
+    runtime.run_background(create_backup, message)
+
+def create_backup(message):
     backup_command = f"python3 {CLI_PATH} backup-hysteria"
     result = run_cli_command(backup_command)
 
@@ -0,0 +1,270 @@
+'''
+Broadcast jobs: one message sent to many chats, as fast as Telegram allows.
+
+All jobs share one token bucket at BROADCAST_RATE messages per second, under
+Telegram's limit of about 30 per second for a bot, leaving room for the
+replies to other users. Each job spreads its sends over BROADCAST_SENDERS
+threads. A 429 answer pauses the bucket for its retry_after, and the chat is
+queued again; server and network errors are retried a few times, at most
+once a second per chat.
+
+Jobs run one after another on their own thread, as they share the bucket
+anyway, so a long broadcast never holds the background pool that backups
+use.
+
+A job is kept in BROADCASTS_DIR as <id>.json (recipients, text, admin chat)
+and <id>.log, to which every finished chat is appended. resume_jobs() restarts
+the unfinished jobs after a restart with the chats missing from the log, so a
+chat receives the message at most once more if the bot stopped mid-send.
+'''
+import os
+import json
+import time
+import heapq
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from telebot.apihelper import ApiTelegramException
+
+from utils.command import bot
+from utils.common import create_main_markup
+
+BROADCASTS_DIR = '/etc/hysteria/core/scripts/telegrambot/broadcasts'
+BROADCAST_RATE = float(os.getenv('BOT_BROADCAST_RATE', '25'))
+BROADCAST_SENDERS = int(os.getenv('BOT_BROADCAST_SENDERS', '4'))
+MAX_ATTEMPTS = 3
+PER_CHAT_INTERVAL = 1
+PROGRESS_INTERVAL = 5
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self.updated:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    # Paused
+                    wait = self.updated - now
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        '''Holds every sender for `seconds`, as asked by a 429 answer.'''
+        with self._lock:
+            self.tokens = 0
+            self.updated = max(self.updated, time.monotonic() + seconds)
+
+
+bucket = TokenBucket(BROADCAST_RATE)
+_jobs = ThreadPoolExecutor(1, thread_name_prefix='bot-broadcast-job')
+
+
+class BroadcastJob:
+    def __init__(self, job_id: str, state: dict, finished: dict):
+        self.job_id = job_id
+        self.state = state
+        # chat id -> None when delivered, else the error
+        self.finished = finished
+        self.started = time.monotonic()
+        self.sent_before = len(finished)
+        self._lock = threading.Condition()
+        # Fresh chats in order, and (due time, chat id, attempt) to retry
+        self._queue = [chat_id for chat_id in state['chat_ids'] if chat_id not in finished][::-1]
+        self._retries = []
+        self._in_flight = 0
+        self._log = None
+
+    @classmethod
+    def create(cls, admin_chat_id: int, status_message_id: int, target: str, text: str, chat_ids) -> 'BroadcastJob':
+        job_id = f"{int(time.time())}_{status_message_id}"
+        state = {
+            'admin_chat_id': admin_chat_id,
+            'status_message_id': status_message_id,
+            'target': target,
+            'text': text,
+            # Deduplicated, in order
+            'chat_ids': list(dict.fromkeys(int(chat_id) for chat_id in chat_ids)),
+        }
+        os.makedirs(BROADCASTS_DIR, exist_ok=True)
+        temp_file = cls._path(job_id, 'json') + '.temp'
+        with open(temp_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_file, cls._path(job_id, 'json'))
+        return cls(job_id, state, {})
+
+    @classmethod
+    def load(cls, job_id: str) -> 'BroadcastJob':
+        with open(cls._path(job_id, 'json'), 'r') as f:
+            state = json.load(f)
+        finished = {}
+        if os.path.exists(cls._path(job_id, 'log')):
+            with open(cls._path(job_id, 'log'), 'r') as f:
+                for line in f:
+                    chat_id, _, error = line.rstrip('\n').partition(' ')
+                    # A line cut short by a crash is sent again
+                    if chat_id.lstrip('-').isdigit():
+                        finished[int(chat_id)] = error or None
+        return cls(job_id, state, finished)
+
+    @staticmethod
+    def _path(job_id: str, extension: str) -> str:
+        return os.path.join(BROADCASTS_DIR, f'{job_id}.{extension}')
+
+    @property
+    def total(self) -> int:
+        return len(self.state['chat_ids'])
+
+    @property
+    def failed(self) -> int:
+        return sum(error is not None for error in self.finished.values())
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return (len(self.finished) - self.sent_before) / elapsed if elapsed else 0.0
+
+    def run(self):
+        if self.finished:
+            self._edit_status(f"Broadcast resumed: {len(self.finished)}/{self.total} completed...")
+        self._log = open(self._path(self.job_id, 'log'), 'a')
+        try:
+            with ThreadPoolExecutor(BROADCAST_SENDERS, thread_name_prefix='bot-broadcast') as senders:
+                for _ in range(BROADCAST_SENDERS):
+                    senders.submit(self._sender)
+                self._report_progress()
+        finally:
+            self._log.close()
+        self._report_done()
+        os.remove(self._path(self.job_id, 'log'))
+        os.remove(self._path(self.job_id, 'json'))
+
+    def _report_progress(self):
+        while True:
+            with self._lock:
+                done = self._lock.wait_for(self._finished, PROGRESS_INTERVAL)
+            if done:
+                return
+            self._edit_status(f"Broadcasting: {len(self.finished)}/{self.total} completed ({self.rate():.1f} msg/s)...")
+
+    def _finished(self) -> bool:
+        return not self._queue and not self._retries and not self._in_flight
+
+    def _next(self):
+        '''Next (chat id, attempt) to send, or None when the job is done.'''
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                if self._retries and self._retries[0][0] <= now:
+                    _, chat_id, attempt = heapq.heappop(self._retries)
+                elif self._queue:
+                    chat_id, attempt = self._queue.pop(), 1
+                elif self._in_flight or self._retries:
+                    # Retries may still come from the chats being sent
+                    self._lock.wait(self._retries[0][0] - now if self._retries else None)
+                    continue
+                else:
+                    return None
+                self._in_flight += 1
+                return chat_id, attempt
+
+    def _sender(self):
+        while (item := self._next()) is not None:
+            chat_id, attempt = item
+            bucket.acquire()
+            retry_after, next_attempt, error = self._send(chat_id, attempt)
+            with self._lock:
+                self._in_flight -= 1
+                if retry_after is not None:
+                    heapq.heappush(self._retries, (time.monotonic() + retry_after, chat_id, next_attempt))
+                else:
+                    self.finished[chat_id] = error
+                    self._log.write(f"{chat_id} {error or ''}".rstrip() + '\n')
+                    self._log.flush()
+                self._lock.notify_all()
+
+    def _send(self, chat_id: int, attempt: int):
+        '''(seconds until a retry, its attempt, None), or (None, None, error or None when delivered)'''
+        try:
+            bot.send_message(chat_id, self.state['text'])
+            return None, None, None
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                retry_after = e.result_json.get('parameters', {}).get('retry_after', PER_CHAT_INTERVAL)
+                bucket.pause(retry_after)
+                # Flood waits do not count as attempts
+                return max(retry_after, PER_CHAT_INTERVAL), attempt, None
+            if e.error_code >= 500 and attempt < MAX_ATTEMPTS:
+                return PER_CHAT_INTERVAL * 2 ** (attempt - 1), attempt + 1, None
+            # Blocked the bot, chat not found, ...
+            return None, None, e.description
+        except requests.RequestException as e:
+            if attempt < MAX_ATTEMPTS:
+                return PER_CHAT_INTERVAL * 2 ** (attempt - 1), attempt + 1, None
+            return None, None, str(e)
+        except Exception as e:
+            return None, None, str(e)
+
+    def _edit_status(self, text: str):
+        bucket.acquire()
+        try:
+            bot.edit_message_text(text, chat_id=self.state['admin_chat_id'], message_id=self.state['status_message_id'])
+        except Exception:
+            pass
+
+    def _report_done(self):
+        elapsed = time.monotonic() - self.started
+        final_report = (
+            "📢 Broadcast Completed\n\n"
+            f"Target: {self.state['target']}\n"
+            f"Total Users: {self.total}\n"
+            f"✅ Successful: {self.total - self.failed}\n"
+            f"❌ Failed: {self.failed}\n"
+            f"⏱ {elapsed:.0f}s, {self.rate():.1f} msg/s"
+        )
+        bot.send_message(self.state['admin_chat_id'], final_report, reply_markup=create_main_markup(is_admin=True))
+
+
+def _run_job(job: BroadcastJob):
+    try:
+        job.run()
+    except Exception:
+        logger.exception('Broadcast %s failed', job.job_id)
+
+
+def start(admin_chat_id: int, status_message_id: int, target: str, text: str, chat_ids) -> BroadcastJob:
+    '''Saves a new job and queues it behind the running broadcasts.'''
+    job = BroadcastJob.create(admin_chat_id, status_message_id, target, text, chat_ids)
+    _jobs.submit(_run_job, job)
+    return job
+
+
+def resume_jobs():
+    '''Runs the jobs that were unfinished when the bot stopped; call once at startup.'''
+    if not os.path.isdir(BROADCASTS_DIR):
+        return
+    for name in sorted(os.listdir(BROADCASTS_DIR)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            job = BroadcastJob.load(name[:-len('.json')])
+        except (OSError, ValueError, KeyError):
+            logger.exception('Could not load broadcast %s', name)
+            continue
+        logger.info('Resuming broadcast %s at %d/%d', job.job_id, len(job.finished), job.total)
+        _jobs.submit(_run_job, job)
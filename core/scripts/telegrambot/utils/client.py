@@ -4,20 +4,29 @@ from utils.common import create_main_markup, create_purchase_markup, create_down
 from utils.payments import CryptomusPayment
 from utils.admin_plans import load_plans
 from datetime import datetime
-from utils.payment_records import add_payment_record, update_payment_status
-import threading
+from utils.payment_records import add_payment_record, update_payment_status, claim_payment, load_payments, processing_payments
+from utils.payment_scheduler import PaymentScheduler, CHECK_INTERVALS, RECONCILE_INTERVALS
+from utils import payment_webhook
 import time
+import logging
+import threading
 from utils.test_mode import load_test_mode
 from utils.test_config import has_used_test_config, mark_test_config_used
-import qrcode
-import io
 from utils.admin_support import get_support_text
 
 # Initialize payment processor
 payment_processor = CryptomusPayment()
 
-# Store payment sessions
-payment_sessions = {}
+logger = logging.getLogger(__name__)
+# Held while a config name is chosen and claimed, so two payments never get the same name
+_claim_lock = threading.Lock()
+
+def create_config(username, plan_gb, plan_days):
+    try:
+        users.add_user(username, plan_gb, plan_days)
+    except users.UserError as e:
+        return str(e)
+    return f"User {username} added successfully."
 
 @bot.message_handler(func=lambda message: message.text == '🎁 Test Config')
 def handle_test_config(message):
@@ -30,24 +39,18 @@ def handle_test_config(message):
         return
 
     # Create test config
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    username = f"{message.from_user.id}d{timestamp}"
+    username = users.config_username(message.from_user.id)
     
     # 1GB traffic limit and 30 days expiration
-    command = f"python3 {CLI_PATH} add-user -u {username} -t 1 -e 30"
-    result = run_cli_command(command)
+    result = create_config(username, 1, 30)
     
-    # Get IPv4 config and clean up the warning message
-    command = f"python3 {CLI_PATH} show-user-uri -u {username} -ip 4"
-    config_v4 = run_cli_command(command)
-    config_v4 = config_v4.replace("Warning: IP4 or IP6 is not set in configs.env. Fetching from ip.gs...\n", "")
-    config_v4 = config_v4.replace("IPv4:\n", "").strip()
+    config_v4 = get_user_uri(username)
+    if not config_v4:
+        bot.reply_to(message, result, reply_markup=create_main_markup(is_admin=False))
+        return
     
     # Create QR code
-    qr = qrcode.make(config_v4)
-    bio = io.BytesIO()
-    qr.save(bio, 'PNG')
-    bio.seek(0)
+    bio = runtime.qr_png(config_v4)
     
     caption = (
         f"📱 Config: {username}\n"
@@ -70,66 +73,44 @@ def handle_test_config(message):
 
 @bot.message_handler(func=lambda message: message.text == '📱 My Configs')
 def show_my_configs(message):
-    command = f"python3 {CLI_PATH} list-users"
-    result = run_cli_command(command)
+    found = False
     
-    try:
-        users = json.loads(result)
-        found = False
-        
-        for username, details in users.items():
-            # Check if config belongs to user and is not blocked
-            if username.startswith(f"{message.from_user.id}d") and not details.get('blocked', False):
-                found = True
-                
-                # Get IPv4 config and clean up the warning message
-                command = f"python3 {CLI_PATH} show-user-uri -u {username} -ip 4"
-                config_v4 = run_cli_command(command)
-                # Remove the warning message and clean up the text
-                config_v4 = config_v4.replace("Warning: IP4 or IP6 is not set in configs.env. Fetching from ip.gs...\n", "")
-                config_v4 = config_v4.replace("IPv4:\n", "").strip()
-                
-                # Create QR code
-                qr = qrcode.make(config_v4)
-                bio = io.BytesIO()
-                qr.save(bio, 'PNG')
-                bio.seek(0)
-                
-                # Format message with the exact style requested
-                caption = (
-                    f"📱 Config: {username}\n"
-                    f"📊 Traffic: {details.get('used_download_bytes', 0) / (1024**3):.2f}/{details.get('max_download_bytes', 0) / (1024**3):.2f} GB\n"
-                    f"📅 Days: {details.get('remaining_days', 0)}/{details.get('expiration_days', 0)}\n\n"
-                    f"📝 Config Text:\n"
-                    f"`{config_v4}`"
-                )
-                
-                bot.send_photo(
-                    message.chat.id,
-                    photo=bio,
-                    caption=caption,
-                    parse_mode="Markdown"
-                )
-        
-        if not found:
-            bot.reply_to(message, "You don't have any active configs. Use the Purchase Plan option to get started!")
+    for user in users.user_configs(message.from_user.id):
+        # Skip blocked configs
+        if not user.blocked:
+            found = True
+            username = user.username
+            
+            config_v4 = get_user_uri(username)
+            
+            # Format message with the exact style requested
+            caption = (
+                f"📱 Config: {username}\n"
+                f"📊 Traffic: {user.used_bytes / (1024**3):.2f}/{user.traffic_limit_gb:.2f} GB\n"
+                f"📅 Days: {user.remaining_days}/{user.expiration_days}\n\n"
+                f"📝 Config Text:\n"
+                f"`{config_v4}`"
+            )
             
-    except json.JSONDecodeError:
-        bot.reply_to(message, "Error retrieving configs. Please try again later.")
+            bot.send_photo(
+                message.chat.id,
+                photo=runtime.qr_png(config_v4),
+                caption=caption,
+                parse_mode="Markdown"
+            )
+    
+    if not found:
+        bot.reply_to(message, "You don't have any active configs. Use the Purchase Plan option to get started!")
 
 def send_new_config(chat_id, username, plan_gb, plan_days, result_text):
     try:
-        # Get IPv4 config and clean up the warning message
-        command = f"python3 {CLI_PATH} show-user-uri -u {username} -ip 4"
-        config_v4 = run_cli_command(command)
-        config_v4 = config_v4.replace("Warning: IP4 or IP6 is not set in configs.env. Fetching from ip.gs...\n", "")
-        config_v4 = config_v4.replace("IPv4:\n", "").strip()
+        config_v4 = get_user_uri(username)
+        if not config_v4:
+            bot.send_message(chat_id, f"Error generating config: user {username} not found.\n{result_text}")
+            return
         
         # Create QR code
-        qr = qrcode.make(config_v4)
-        bio = io.BytesIO()
-        qr.save(bio, 'PNG')
-        bio.seek(0)
+        bio = runtime.qr_png(config_v4)
         
         caption = (
             f"📱 Config: {username}\n"
@@ -149,101 +130,145 @@ def send_new_config(chat_id, username, plan_gb, plan_days, result_text):
     except Exception as e:
         bot.send_message(chat_id, f"Error generating config: {str(e)}")
 
-def check_payment_status(payment_id, chat_id, plan_gb):
-    while True:
-        status = payment_processor.check_payment_status(payment_id)
-        
-        # First check if there's an error in the response
-        if "error" in status:
-            bot.send_message(
-                chat_id,
-                f"❌ Error checking payment status: {status['error']}\nPlease contact support."
-            )
-            del payment_sessions[payment_id]
-            break
+def check_payment_status(payment_id, record):
+    """Checks a payment once; returns True when it reached a final state."""
+    status = payment_processor.check_payment_status(payment_id)
+    
+    # Errors and malformed responses are retried on the next check, until the invoice expires
+    if "error" in status:
+        logger.warning('Error checking payment %s: %s', payment_id, status['error'])
+        return False
 
-        # Check if we have a valid result
-        if not status or 'result' not in status:
-            bot.send_message(
-                chat_id,
-                "❌ Invalid payment status response. Please contact support."
-            )
-            del payment_sessions[payment_id]
-            break
+    if not status or 'result' not in status:
+        logger.warning('Invalid status response for payment %s', payment_id)
+        return False
 
-        result = status['result']
-        payment_status = result.get('status', '')
-        
-        try:
-            amount_paid = float(result.get('amount_paid_usd', 0))
-            amount_required = float(result.get('amount_usd', 0))
-        except (ValueError, TypeError):
-            amount_paid = 0
-            amount_required = 0
+    return process_payment_result(payment_id, record, status['result'])
+
+def handle_payment_notification(payment_id, result):
+    """Called by the payment webhook with a verified notification."""
+    record = load_payments().get(payment_id)
+    if not record or record.get('status') != 'pending':
+        return
+    process_payment_result(payment_id, record, result)
+
+def process_payment_result(payment_id, record, result):
+    """Acts on the invoice state from a status check or a webhook; returns True when it is final."""
+    chat_id = record['user_id']
+    plan_gb = record['plan_gb']
+    payment_status = result.get('status', '')
+    
+    try:
+        amount_paid = float(result.get('amount_paid_usd', 0))
+        amount_required = float(result.get('amount_usd', 0))
+    except (ValueError, TypeError):
+        amount_paid = 0
+        amount_required = 0
 
-        # Check payment status
-        if payment_status == 'paid':
-            if amount_paid < amount_required:
-                # Underpaid
+    # Check payment status
+    if payment_status in ('paid', 'paid_over'):
+        if amount_paid < amount_required:
+            # Underpaid; claimed so the webhook and the reconciler only tell the user once
+            if claim_payment(payment_id, 'underpaid'):
                 bot.send_message(
                     chat_id,
                     f"⚠️ Payment underpaid (${amount_paid:.2f} of ${amount_required:.2f})\n"
                     "Please contact support."
                 )
-                update_payment_status(payment_id, 'underpaid')
-                del payment_sessions[payment_id]
-                break
-            elif amount_paid > amount_required:
-                # Overpaid but process anyway
-                plans = load_plans()
-                plan_days = plans[str(plan_gb)]['days']
-                
-                timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-                username = f"{chat_id}d{timestamp}"
-                
-                command = f"python3 {CLI_PATH} add-user -u {username} -t {plan_gb} -e {plan_days}"
-                result = run_cli_command(command)
-                
-                update_payment_status(payment_id, 'completed_overpaid')
-                send_new_config(chat_id, username, plan_gb, plan_days, result)
-                
-                bot.send_message(
-                    chat_id,
-                    f"⚠️ Note: Payment was overpaid (${amount_paid:.2f} of ${amount_required:.2f})\n"
-                    "Please contact support for a refund."
-                )
-                
-                del payment_sessions[payment_id]
-                break
-            else:
-                # Exact payment
-                plans = load_plans()
-                plan_days = plans[str(plan_gb)]['days']
-                
-                timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-                username = f"{chat_id}d{timestamp}"
-                
-                command = f"python3 {CLI_PATH} add-user -u {username} -t {plan_gb} -e {plan_days}"
-                result = run_cli_command(command)
-                
-                update_payment_status(payment_id, 'completed')
-                send_new_config(chat_id, username, plan_gb, plan_days, result)
-                
-                del payment_sessions[payment_id]
-                break
-            
-        elif payment_status == 'expired':
-            # Payment expired
-            bot.send_message(
-                chat_id,
-                "❌ Payment session expired. Please try again."
+            return True
+
+        plan = load_plans().get(str(plan_gb))
+        # The config name is stored before the config is created, so provisioning can be finished after a crash
+        with _claim_lock:
+            taken = {other.get('username') for other in load_payments().values()}
+            claimed = claim_payment(
+                payment_id,
+                username=users.config_username(chat_id, taken),
+                plan_days=plan['days'] if plan else None,
+                paid_status='completed_overpaid' if amount_paid > amount_required else 'completed',
+                amount_paid_usd=amount_paid,
+                amount_required_usd=amount_required
             )
-            update_payment_status(payment_id, 'expired')
-            del payment_sessions[payment_id]
-            break
-            
-        # If still pending, wait and check again
-        time.sleep(30)
+        # Otherwise already finished by the webhook or the reconciler
+        if claimed:
+            provision_payment(payment_id, load_payments()[payment_id])
+        return True
+        
+    elif payment_status in ('expired', 'cancel'):
+        expire_payment(payment_id, record)
+        return True
+        
+    # Still pending, checked again later
+    return False
+
+def provision_payment(payment_id, record):
+    """Creates the config of a claimed payment; safe to run again for the same record."""
+    chat_id = record['user_id']
+    plan_gb = record['plan_gb']
+    plan_days = record['plan_days']
+    username = record['username']
+    try:
+        if plan_days is None:
+            raise users.UserError(f"Plan {plan_gb}GB no longer exists")
+        if users.get_user(username) is None:
+            users.add_user(username, plan_gb, plan_days)
+        update_payment_status(payment_id, record['paid_status'])
+    except Exception as e:
+        logger.exception('Creating config %s for payment %s failed', username, payment_id)
+        update_payment_status(payment_id, 'failed')
+        notify_payment_failure(payment_id, record, str(e))
+        return
+
+    send_new_config(chat_id, username, plan_gb, plan_days, f"User {username} added successfully.")
+    if record['paid_status'] == 'completed_overpaid':
+        bot.send_message(
+            chat_id,
+            f"⚠️ Note: Payment was overpaid (${record['amount_paid_usd']:.2f} of ${record['amount_required_usd']:.2f})\n"
+            "Please contact support for a refund."
+        )
+
+def notify_payment_failure(payment_id, record, error):
+    messages = [(
+        record['user_id'],
+        "❌ Your payment was received, but your config could not be created.\n"
+        f"Please contact support with payment ID {payment_id}."
+    )]
+    messages += [(
+        admin_id,
+        f"⚠️ Payment {payment_id} of user {record['user_id']} is paid but its config "
+        f"{record.get('username', '')} could not be created: {error}"
+    ) for admin_id in ADMIN_USER_IDS]
+    for chat_id, text in messages:
+        try:
+            bot.send_message(chat_id, text)
+        except Exception:
+            logger.exception('Could not notify %s about payment %s', chat_id, payment_id)
+
+def resume_payments():
+    """Finishes the payments whose provisioning was interrupted by a restart; call once at startup."""
+    for payment_id, record in processing_payments().items():
+        if 'username' in record:
+            logger.info('Resuming provisioning of payment %s', payment_id)
+            provision_payment(payment_id, record)
+        else:
+            # Claimed by an older version that did not record the config name
+            update_payment_status(payment_id, 'failed')
+            notify_payment_failure(payment_id, record, 'interrupted while processing')
+
+def expire_payment(payment_id, record):
+    if not claim_payment(payment_id, 'expired'):
+        return
+    bot.send_message(
+        record['user_id'],
+        "❌ Payment session expired. Please try again."
+    )
+
+# With the webhook, polling only reconciles invoices whose notification was lost
+payment_scheduler = PaymentScheduler(
+    check_payment_status,
+    expire_payment,
+    intervals=RECONCILE_INTERVALS if payment_processor.callback_url else CHECK_INTERVALS
+)
 
 @bot.message_handler(func=lambda message: message.text == '💰 Purchase Plan')
 def show_purchase_options(message):
@@ -288,11 +313,9 @@ def handle_purchase(call):
         
         # Create user config immediately
         plan_days = plans[str(plan_gb)]['days']
-        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        username = f"{call.message.chat.id}d{timestamp}"
+        username = users.config_username(call.message.chat.id)
         
-        command = f"python3 {CLI_PATH} add-user -u {username} -t {plan_gb} -e {plan_days}"
-        result = run_cli_command(command)
+        result = create_config(username, plan_gb, plan_days)
         
         # Update payment record
         update_payment_status(payment_id, 'completed')
@@ -343,12 +366,6 @@ def handle_purchase(call):
     payment_id = payment['result']['uuid']
     payment_url = payment['result']['url']
     
-    # Store payment session
-    payment_sessions[payment_id] = {
-        'chat_id': call.message.chat.id,
-        'plan_gb': plan_gb
-    }
-    
     # Record payment information
     payment_record = {
         'user_id': call.message.chat.id,
@@ -359,12 +376,7 @@ def handle_purchase(call):
         'payment_url': payment_url
     }
     add_payment_record(payment_id, payment_record)
-    
-    # Start payment checking thread
-    threading.Thread(
-        target=check_payment_status,
-        args=(payment_id, call.message.chat.id, plan_gb)
-    ).start()
+    payment_scheduler.add(payment_id)
 
     markup = types.InlineKeyboardMarkup()
     markup.add(types.InlineKeyboardButton("💳 Pay Now", url=payment_url))
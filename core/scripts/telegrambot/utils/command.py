@@ -2,17 +2,24 @@ import telebot
 import subprocess
 import json
 import os
+import sys
 import shlex
 from dotenv import load_dotenv
 from telebot import types
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+
+import uris
+import users
+from utils import runtime
+
 load_dotenv()
 
 API_TOKEN = os.getenv('API_TOKEN')
 ADMIN_USER_IDS = json.loads(os.getenv('ADMIN_USER_IDS'))
 CLI_PATH = '/etc/hysteria/core/cli.py'
 BACKUP_DIRECTORY = '/opt/hysbackup'
-bot = telebot.TeleBot(API_TOKEN)
+bot = runtime.OrderedTeleBot(API_TOKEN)
 
 def run_cli_command(command):
     try:
@@ -22,5 +29,9 @@ def run_cli_command(command):
     except subprocess.CalledProcessError as e:
         return f'Error: {e.output.decode("utf-8")}'
 
+def get_user_uri(username, ip_version=4):
+    user_uris = uris.user_uris(username)
+    return user_uris[ip_version] if user_uris else None
+
 def is_admin(user_id):
     return user_id in ADMIN_USER_IDS
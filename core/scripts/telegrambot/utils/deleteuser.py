@@ -20,6 +20,9 @@ def delete_user(message):
 
 def process_delete_user(message):
     username = message.text.strip().lower()
-    command = f"python3 {CLI_PATH} remove-user -u {username}"
-    result = run_cli_command(command)
-    bot.reply_to(message, result)
+    try:
+        users.remove_user(username)
+    except users.UserError as e:
+        bot.reply_to(message, str(e))
+        return
+    bot.reply_to(message, f"User {username} removed successfully.")
@@ -0,0 +1,109 @@
+'''
+Local stand-in for the Cryptomus API, for testing the bot's payment client.
+
+It serves /payment and /payment/info, checks their sign with
+CRYPTOMUS_API_KEY, and marks every invoice paid --pay-after seconds after it
+was created, posting a signed notification to its url_callback if it has one.
+--delay and --fail-rate make it slow or make it answer 503, to exercise the
+timeouts, retries and circuit breaker. Point the bot at it with
+CRYPTOMUS_BASE_URL=http://127.0.0.1:8099/v1:
+
+    python3 -m utils.fake_cryptomus --pay-after 20 --fail-rate 0.2
+'''
+import json
+import time
+import uuid
+import random
+import asyncio
+import base64
+from hashlib import md5
+
+import click
+import aiohttp
+from aiohttp import web
+
+from utils.payments import CryptomusPayment
+
+
+def create_app(pay_after: float, delay: float, fail_rate: float) -> web.Application:
+    gateway = CryptomusPayment()
+    invoices = {}
+
+    def valid_sign(request: web.Request, body: bytes) -> bool:
+        expected = md5(base64.b64encode(body) + gateway.payment_api_key.encode()).hexdigest()
+        return request.headers.get('merchant') == gateway.merchant_id and request.headers.get('sign') == expected
+
+    async def notify(invoice: dict):
+        data = {
+            'type': 'payment',
+            'uuid': invoice['uuid'],
+            'order_id': invoice['order_id'],
+            'amount': invoice['amount'],
+            'payment_amount_usd': invoice['amount_paid_usd'],
+            'currency': 'USD',
+            'status': invoice['status'],
+            'is_final': True,
+        }
+        data['sign'] = gateway.webhook_sign(data)
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(invoice['url_callback'], json=data, ssl=False) as response:
+                    print(f"Notified {invoice['uuid']}: {response.status}")
+        except aiohttp.ClientError as e:
+            print(f"Notifying {invoice['uuid']} failed: {e}")
+
+    async def pay_later(invoice: dict):
+        await asyncio.sleep(pay_after)
+        invoice.update(status='paid', amount_paid_usd=invoice['amount'])
+        if invoice.get('url_callback'):
+            await notify(invoice)
+
+    async def call(request: web.Request, handle) -> web.Response:
+        body = await request.read()
+        await asyncio.sleep(delay)
+        if random.random() < fail_rate:
+            return web.Response(status=503, text='Service temporarily unavailable')
+        if not valid_sign(request, body):
+            return web.json_response({'state': 1, 'message': 'Invalid sign'}, status=401)
+        return handle(json.loads(body))
+
+    def create_invoice(payload: dict) -> web.Response:
+        invoice = {
+            'uuid': str(uuid.uuid4()),
+            'order_id': payload['order_id'],
+            'amount': payload['amount'],
+            'amount_usd': payload['amount'],
+            'amount_paid_usd': '0.00',
+            'status': 'check',
+            'url_callback': payload.get('url_callback'),
+            'created_at': time.time(),
+        }
+        invoice['url'] = f"https://pay.example/{invoice['uuid']}"
+        invoices[invoice['uuid']] = invoice
+        asyncio.get_running_loop().create_task(pay_later(invoice))
+        return web.json_response({'state': 0, 'result': invoice})
+
+    def invoice_info(payload: dict) -> web.Response:
+        invoice = invoices.get(payload.get('uuid'))
+        if invoice is None:
+            return web.json_response({'state': 1, 'message': 'Payment not found'}, status=404)
+        return web.json_response({'state': 0, 'result': invoice})
+
+    app = web.Application()
+    app.router.add_post('/v1/payment', lambda request: call(request, create_invoice))
+    app.router.add_post('/v1/payment/info', lambda request: call(request, invoice_info))
+    return app
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', type=int, default=8099, show_default=True)
+@click.option('--pay-after', type=float, default=30, show_default=True, help='Seconds until an invoice is paid')
+@click.option('--delay', type=float, default=0, show_default=True, help='Seconds before every answer')
+@click.option('--fail-rate', type=float, default=0, show_default=True, help='Share of calls answered with 503')
+def main(host: str, port: int, pay_after: float, delay: float, fail_rate: float):
+    web.run_app(create_app(pay_after, delay, fail_rate), host=host, port=port)
+
+
+if __name__ == '__main__':
+    main()
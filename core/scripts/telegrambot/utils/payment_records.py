@@ -1,8 +1,13 @@
 import json
 import os
+import threading
 from datetime import datetime
 
 PAYMENTS_FILE = '/etc/hysteria/core/scripts/telegrambot/payments.json'
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Handlers and the payment scheduler update the file from different threads
+_lock = threading.RLock()
 
 def load_payments():
     try:
@@ -15,30 +20,58 @@ def load_payments():
 
 def save_payments(payments):
     os.makedirs(os.path.dirname(PAYMENTS_FILE), exist_ok=True)
-    with open(PAYMENTS_FILE, 'w') as f:
+    temp_file = f'{PAYMENTS_FILE}.temp'
+    with open(temp_file, 'w') as f:
         json.dump(payments, f, indent=4)
+    os.replace(temp_file, PAYMENTS_FILE)
+
+def pending_payments():
+    return {payment_id: record for payment_id, record in load_payments().items() if record.get('status') == 'pending'}
+
+def created_timestamp(record):
+    try:
+        return datetime.strptime(record['created_at'], TIME_FORMAT).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
 
 def add_payment_record(payment_id, data):
-    payments = load_payments()
-    data['created_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    data['updates'] = []  # Add history tracking
-    payments[payment_id] = data
-    save_payments(payments)
+    with _lock:
+        payments = load_payments()
+        data['created_at'] = datetime.now().strftime(TIME_FORMAT)
+        data['updates'] = []  # Add history tracking
+        payments[payment_id] = data
+        save_payments(payments)
 
 def update_payment_status(payment_id, status):
-    payments = load_payments()
-    if payment_id in payments:
-        current_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with _lock:
+        payments = load_payments()
+        if payment_id in payments:
+            current_time = datetime.now().strftime(TIME_FORMAT)
         
-        # Add update to history
-        update = {
-            'status': status,
-            'timestamp': current_time,
-            'previous_status': payments[payment_id].get('status', 'unknown')
-        }
+            # Add update to history
+            update = {
+                'status': status,
+                'timestamp': current_time,
+                'previous_status': payments[payment_id].get('status', 'unknown')
+            }
         
-        payments[payment_id]['status'] = status
-        payments[payment_id]['updated_at'] = current_time
-        payments[payment_id]['updates'].append(update)
+            payments[payment_id]['status'] = status
+            payments[payment_id]['updated_at'] = current_time
+            payments[payment_id]['updates'].append(update)
         
-        save_payments(payments) 
+            save_payments(payments)
+
+def processing_payments():
+    return {payment_id: record for payment_id, record in load_payments().items() if record.get('status') == 'processing'}
+
+def claim_payment(payment_id, status='processing', **fields):
+    # Moves a pending payment to `status`, storing `fields` with it; only the caller that gets True
+    # may act on it, so a webhook and a status check arriving together do not both provision
+    with _lock:
+        payments = load_payments()
+        if payments.get(payment_id, {}).get('status') != 'pending':
+            return False
+        payments[payment_id].update(fields)
+        save_payments(payments)
+        update_payment_status(payment_id, status)
+        return True
@@ -0,0 +1,132 @@
+'''
+Status polling of pending Cryptomus invoices, from one task on the bot's background loop.
+
+Pending invoices are the records with status "pending" in the payment store,
+so they survive a restart: start() loads every one of them and checks it right
+away. Checks are spaced by the age of the invoice (CHECK_INTERVALS), since
+most invoices are paid in the first minutes or not at all, and are made in
+batches of at most BATCH_SIZE. An invoice still unpaid when its lifetime
+(INVOICE_LIFETIME, as sent to Cryptomus) is over gets one last check and is
+then handed to on_expired.
+
+When Cryptomus notifies the payment webhook (payment_webhook.py), invoices are
+finished by the notification and this only reconciles the ones whose
+notification got lost, at RECONCILE_INTERVALS.
+'''
+import os
+import time
+import heapq
+import asyncio
+import logging
+
+from utils import runtime
+from utils.payment_records import pending_payments, load_payments, created_timestamp
+
+INVOICE_LIFETIME = 3600
+BATCH_SIZE = int(os.getenv('PAYMENT_CHECK_BATCH', '10'))
+# (invoice age in seconds, seconds between checks until that age)
+CHECK_INTERVALS = ((300, 15), (900, 30), (1800, 60), (INVOICE_LIFETIME, 120))
+RECONCILE_INTERVALS = ((INVOICE_LIFETIME, 600),)
+
+logger = logging.getLogger(__name__)
+
+
+def check_interval(age: float, intervals=CHECK_INTERVALS) -> float:
+    for limit, interval in intervals:
+        if age < limit:
+            return interval
+    return intervals[-1][1]
+
+
+class PaymentScheduler:
+    def __init__(self, check, on_expired, batch_size: int = BATCH_SIZE, lifetime: int = INVOICE_LIFETIME, intervals=CHECK_INTERVALS):
+        '''
+        check(payment_id, record) polls one invoice and returns True once it
+        reached a final state; on_expired(payment_id, record) is called for an
+        invoice that did not before its lifetime ended. Both run in a thread.
+        '''
+        self.check = check
+        self.on_expired = on_expired
+        self.batch_size = batch_size
+        self.lifetime = lifetime
+        self.intervals = intervals
+        self._due = []  # heap of (due time, payment id)
+        self._scheduled = set()
+        self._wakeup = None
+        self._task = None
+        self.counters = {'checks': 0, 'finished': 0, 'expired': 0, 'errors': 0}
+
+    def start(self):
+        '''Resumes every pending payment of the store; call once at startup.'''
+        if self._task is None:
+            self._task = runtime.spawn(self._run())
+
+    def add(self, payment_id: str):
+        '''Schedules a new invoice for its first check; safe to call from any thread.'''
+        runtime.get_loop().call_soon_threadsafe(self._push, payment_id, time.time() + self.intervals[0][1])
+
+    def _push(self, payment_id: str, due: float):
+        if payment_id in self._scheduled:
+            return
+        self._scheduled.add(payment_id)
+        heapq.heappush(self._due, (due, payment_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        self._wakeup = asyncio.Event()
+        pending = await asyncio.to_thread(pending_payments)
+        now = time.time()
+        for payment_id in pending:
+            self._push(payment_id, now)
+        if pending:
+            logger.info('Resumed %d pending payments', len(pending))
+
+        while True:
+            now = time.time()
+            batch = []
+            while self._due and self._due[0][0] <= now and len(batch) < self.batch_size:
+                batch.append(heapq.heappop(self._due)[1])
+            if batch:
+                self._scheduled.difference_update(batch)
+                records = await asyncio.to_thread(load_payments)
+                await asyncio.gather(*(self._check(payment_id, records.get(payment_id)) for payment_id in batch))
+                continue
+
+            self._wakeup.clear()
+            timeout = self._due[0][0] - now if self._due else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, payment_id: str, record: dict | None):
+        # Finished meanwhile, e.g. by the test mode or an admin
+        if not record or record.get('status') != 'pending':
+            return
+
+        created = created_timestamp(record) or time.time()
+        self.counters['checks'] += 1
+        try:
+            finished = await asyncio.to_thread(self.check, payment_id, record)
+        except Exception:
+            self.counters['errors'] += 1
+            logger.exception('Checking payment %s failed', payment_id)
+            finished = False
+        if finished:
+            self.counters['finished'] += 1
+            return
+
+        age = time.time() - created
+        if age < self.lifetime:
+            self._push(payment_id, time.time() + min(check_interval(age, self.intervals), self.lifetime - age))
+            return
+
+        self.counters['expired'] += 1
+        try:
+            await asyncio.to_thread(self.on_expired, payment_id, record)
+        except Exception:
+            logger.exception('Expiring payment %s failed', payment_id)
+
+    def stats(self) -> dict:
+        return {'scheduled': len(self._due), **self.counters}
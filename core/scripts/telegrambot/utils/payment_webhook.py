@@ -0,0 +1,117 @@
+'''
+Receiver of Cryptomus payment notifications.
+
+Cryptomus posts the invoice state to the url_callback of the invoice as soon
+as it changes, so a paid invoice is provisioned right away instead of on the
+next status check. The endpoint runs on the bot's background loop; a
+notification is only acted on when its "sign" matches the merchant API key.
+CRYPTOMUS_CALLBACK_URL is the public URL Cryptomus is given (e.g. behind a
+reverse proxy); CRYPTOMUS_WEBHOOK_HOST/PORT is where this server listens.
+
+Run as a module it is a local stand-in for Cryptomus that posts a signed
+notification, for testing:
+
+    python3 -m utils.payment_webhook <payment id> --status paid --amount 5
+'''
+import os
+import ssl
+import json
+import asyncio
+import logging
+
+import click
+import requests
+from aiohttp import web
+
+from utils import runtime
+from utils.payments import CryptomusPayment
+
+WEBHOOK_PATH = '/cryptomus/webhook'
+HOST = os.getenv('CRYPTOMUS_WEBHOOK_HOST', '0.0.0.0')
+PORT = int(os.getenv('CRYPTOMUS_WEBHOOK_PORT', '8089'))
+CERTFILE = os.getenv('CRYPTOMUS_WEBHOOK_CERTFILE')
+KEYFILE = os.getenv('CRYPTOMUS_WEBHOOK_KEYFILE')
+MAX_BODY_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def notification_result(data: dict) -> dict:
+    '''The fields of a notification under the names of a /payment/info result.'''
+    return {
+        'status': data.get('status', ''),
+        'amount_usd': data.get('amount'),
+        'amount_paid_usd': data.get('payment_amount_usd'),
+    }
+
+
+def create_app(payment_processor: CryptomusPayment, on_payment) -> web.Application:
+    '''on_payment(payment_id, result) is called in a thread for every verified notification.'''
+
+    async def handle_notification(request: web.Request) -> web.Response:
+        try:
+            data = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return web.json_response({'error': 'Invalid JSON'}, status=400)
+        if not isinstance(data, dict) or not payment_processor.verify_webhook(data):
+            logger.warning('Rejected payment notification with an invalid sign from %s', request.remote)
+            return web.json_response({'error': 'Invalid sign'}, status=401)
+
+        # Payout notifications and the like are acknowledged and ignored
+        if data.get('type', 'payment') == 'payment' and data.get('uuid'):
+            # Answered after processing, so Cryptomus retries a notification we failed on
+            await asyncio.to_thread(on_payment, data['uuid'], notification_result(data))
+        return web.json_response({'state': 0})
+
+    app = web.Application(client_max_size=MAX_BODY_SIZE)
+    app.router.add_post(WEBHOOK_PATH, handle_notification)
+    return app
+
+
+async def serve(app: web.Application, host: str = HOST, port: int = PORT, certfile: str | None = CERTFILE, keyfile: str | None = KEYFILE):
+    ssl_context = None
+    if certfile and keyfile:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(certfile, keyfile)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port, ssl_context=ssl_context).start()
+    logger.info('Payment webhook listening on %s:%d%s', host, port, WEBHOOK_PATH)
+
+
+def start(payment_processor: CryptomusPayment, on_payment):
+    '''Starts the receiver on the background loop when CRYPTOMUS_CALLBACK_URL is set.'''
+    if not payment_processor.callback_url:
+        return None
+    return runtime.spawn(serve(create_app(payment_processor, on_payment)))
+
+
+# region local stand-in
+@click.command()
+@click.argument('payment_id')
+@click.option('--status', default='paid', show_default=True, help='Invoice status, e.g. paid, paid_over, cancel')
+@click.option('--amount', type=float, default=1.0, show_default=True, help='Invoice amount in USD')
+@click.option('--paid', type=float, help='Amount paid in USD [default: --amount]')
+@click.option('--url', default=f'http://127.0.0.1:{PORT}{WEBHOOK_PATH}', show_default=True)
+@click.option('--bad-sign', is_flag=True, help='Send a wrong sign, which must be rejected')
+def send_notification(payment_id: str, status: str, amount: float, paid: float | None, url: str, bad_sign: bool):
+    '''Posts a notification signed with CRYPTOMUS_API_KEY, the way Cryptomus does.'''
+    data = {
+        'type': 'payment',
+        'uuid': payment_id,
+        'order_id': payment_id,
+        'amount': f'{amount:.2f}',
+        'payment_amount_usd': f'{amount if paid is None else paid:.2f}',
+        'currency': 'USD',
+        'status': status,
+        'is_final': status not in ('process', 'check', 'confirm_check'),
+    }
+    data['sign'] = '0' * 32 if bad_sign else CryptomusPayment().webhook_sign(data)
+    response = requests.post(url, json=data, timeout=10, verify=False)
+    print(response.status_code, response.text)
+
+
+if __name__ == '__main__':
+    send_notification()
+
+# endregion
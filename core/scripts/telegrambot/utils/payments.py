@@ -1,30 +1,110 @@
 import base64
+import hmac
 import json
 import uuid
+import time
+import random
+import threading
 from hashlib import md5
 import requests
+from requests.adapters import HTTPAdapter
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+CONNECT_TIMEOUT = float(os.getenv('CRYPTOMUS_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.getenv('CRYPTOMUS_READ_TIMEOUT', '15'))
+# Attempts of a status check; creating an invoice is never repeated
+STATUS_ATTEMPTS = int(os.getenv('CRYPTOMUS_STATUS_ATTEMPTS', '3'))
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+# Consecutive failed calls after which calls fail fast for BREAKER_COOLDOWN seconds
+BREAKER_THRESHOLD = int(os.getenv('CRYPTOMUS_BREAKER_THRESHOLD', '5'))
+BREAKER_COOLDOWN = float(os.getenv('CRYPTOMUS_BREAKER_COOLDOWN', '60'))
+POOL_SIZE = 10
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def backoff_delay(attempt):
+    # Full jitter, so status checks failing together do not retry together
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            # Half open: let one call through to probe the gateway
+            self.opened_at = time.monotonic()
+            return True
+
+    def record(self, success):
+        with self._lock:
+            if success:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'open' if time.monotonic() - self.opened_at < self.cooldown else 'half-open'
+
+
 class CryptomusPayment:
     def __init__(self):
         self.merchant_id = os.getenv('CRYPTOMUS_MERCHANT_ID')
         self.payment_api_key = os.getenv('CRYPTOMUS_API_KEY')
-        self.base_url = "https://api.cryptomus.com/v1"
+        self.base_url = os.getenv('CRYPTOMUS_BASE_URL', "https://api.cryptomus.com/v1").rstrip('/')
+        self.timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+        # One keep-alive connection pool shared by every handler thread
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE))
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE))
+        self.breaker = CircuitBreaker()
+        self._stats_lock = threading.Lock()
+        self.counters = {}
+        # Public URL of the payment webhook; without it invoices are only polled
+        self.callback_url = os.getenv('CRYPTOMUS_CALLBACK_URL')
 
     def _check_credentials(self):
         if not self.merchant_id or not self.payment_api_key:
             return False
         return True
 
-    def _generate_sign(self, payload):
-        encoded_data = base64.b64encode(
-            json.dumps(payload).encode("utf-8")
-        ).decode("utf-8")
+    def _sign(self, encoded_json):
+        encoded_data = base64.b64encode(encoded_json.encode("utf-8")).decode("utf-8")
         return md5(f"{encoded_data}{self.payment_api_key}".encode("utf-8")).hexdigest()
 
+    def _generate_sign(self, payload):
+        return self._sign(json.dumps(payload))
+
+    def webhook_sign(self, data):
+        # Cryptomus signs callbacks over PHP's json_encode(JSON_UNESCAPED_UNICODE) of the body without "sign"
+        encoded_json = json.dumps(data, ensure_ascii=False, separators=(',', ':')).replace('/', '\\/')
+        return self._sign(encoded_json)
+
+    def verify_webhook(self, data):
+        if not self._check_credentials() or not isinstance(data.get('sign'), str):
+            return False
+        unsigned = {key: value for key, value in data.items() if key != 'sign'}
+        return hmac.compare_digest(data['sign'], self.webhook_sign(unsigned))
+
     def create_payment(self, amount, plan_gb):
         if not self._check_credentials():
             return {"error": "Payment credentials not configured"}
@@ -41,24 +121,10 @@ class CryptomusPayment:
                 "payment_id": payment_id
             })
         }
+        if self.callback_url:
+            payload["url_callback"] = self.callback_url
 
-        try:
-            headers = {
-                "merchant": self.merchant_id,
-                "sign": self._generate_sign(payload)
-            }
-
-            response = requests.post(
-                f"{self.base_url}/payment",
-                json=payload,
-                headers=headers
-            )
-
-            if response.status_code == 200:
-                return response.json()
-            return {"error": f"API Error: {response.text}"}
-        except Exception as e:
-            return {"error": f"Request Error: {str(e)}"}
+        return self._post("/payment", payload, attempts=1)
 
     def check_payment_status(self, payment_id):
         if not self._check_credentials():
@@ -68,20 +134,69 @@ class CryptomusPayment:
             "uuid": payment_id
         }
 
-        try:
-            headers = {
-                "merchant": self.merchant_id,
-                "sign": self._generate_sign(payload)
-            }
+        return self._post("/payment/info", payload, attempts=STATUS_ATTEMPTS)
 
-            response = requests.post(
-                f"{self.base_url}/payment/info",
-                json=payload,
-                headers=headers
-            )
+    def _post(self, path, payload, attempts):
+        headers = {
+            "merchant": self.merchant_id,
+            "sign": self._generate_sign(payload)
+        }
+        error = None
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                self._count(path, 'rejected')
+                return {"error": "Payment gateway unavailable, please try again later"}
+            if attempt:
+                self._count(path, 'retries')
+                time.sleep(backoff_delay(attempt))
 
+            started = time.monotonic()
+            try:
+                response = self.session.post(
+                    f"{self.base_url}{path}",
+                    json=payload,
+                    headers=headers,
+                    timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                self._record(path, started, False)
+                error = {"error": f"Request Error: {str(e)}"}
+                continue
+
+            # Client errors are answers of a working gateway and are not retried
+            retry = response.status_code in RETRY_STATUS_CODES
+            self._record(path, started, not retry)
             if response.status_code == 200:
-                return response.json()
-            return {"error": f"API Error: {response.text}"}
-        except Exception as e:
-            return {"error": f"Request Error: {str(e)}"} 
+                try:
+                    return response.json()
+                except ValueError:
+                    return {"error": f"API Error: invalid response {response.text[:200]}"}
+            error = {"error": f"API Error: {response.text}"}
+            if not retry:
+                break
+        return error
+
+    def _counters(self, path):
+        return self.counters.setdefault(path, {'calls': 0, 'errors': 0, 'retries': 0, 'rejected': 0, 'latency_total': 0.0, 'latency_max': 0.0})
+
+    def _count(self, path, counter):
+        with self._stats_lock:
+            self._counters(path)[counter] += 1
+
+    def _record(self, path, started, success):
+        latency = time.monotonic() - started
+        self.breaker.record(success)
+        with self._stats_lock:
+            counters = self._counters(path)
+            counters['calls'] += 1
+            counters['errors'] += not success
+            counters['latency_total'] += latency
+            counters['latency_max'] = max(counters['latency_max'], latency)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = {
+                path: {**counters, 'latency_avg': counters['latency_total'] / counters['calls'] if counters['calls'] else 0.0}
+                for path, counters in self.counters.items()
+            }
+        return {'breaker': self.breaker.state, 'calls': stats}
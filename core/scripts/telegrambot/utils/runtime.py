@@ -0,0 +1,202 @@
+'''
+Concurrency runtime of the bot.
+
+Updates are handled on a bounded thread pool (BOT_WORKERS) instead of
+telebot's shared worker queue. The updates of one chat run one at a time and
+in arrival order, so the steps of a conversation never overtake each other,
+while other chats keep being served by the remaining workers.
+
+Work that is not a reply to the update at hand goes elsewhere so it does not
+hold a handler worker:
+- run_background() for long jobs started by an admin (broadcasts, backups)
+- spawn() for coroutines on one asyncio loop in a background thread, used for
+  timers and polling (payment status) instead of a sleeping OS thread each;
+  their blocking calls go through asyncio.to_thread()
+- qr_png() renders QR codes in a small process pool, since qrcode is pure
+  Python and would hold the GIL against every other handler
+'''
+import io
+import os
+import sys
+import asyncio
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import telebot
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+
+import uris
+
+WORKERS = int(os.getenv('BOT_WORKERS', '8'))
+BACKGROUND_WORKERS = int(os.getenv('BOT_BACKGROUND_WORKERS', '2'))
+LOOP_EXECUTOR_WORKERS = int(os.getenv('BOT_LOOP_WORKERS', '4'))
+QR_WORKERS = int(os.getenv('BOT_QR_WORKERS', '2'))
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update):
+    '''Chat an update belongs to, or None when it has no ordering constraint.'''
+    chat = getattr(update, 'chat', None) or getattr(getattr(update, 'message', None), 'chat', None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, 'from_user', None)
+    return user.id if user is not None else None
+
+
+class ChatOrderedExecutor:
+    '''Thread pool on which the calls submitted with the same key run one at a time, in order.'''
+
+    def __init__(self, workers: int, on_error):
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix='bot-handler')
+        self.on_error = on_error
+        self._lock = threading.Lock()
+        # key -> calls waiting for the running call of that key
+        self._queues = {}
+
+    def submit(self, key, fn, *args, **kwargs):
+        if key is None:
+            self.pool.submit(self._call, fn, args, kwargs)
+            return
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append((fn, args, kwargs))
+                return
+            self._queues[key] = deque()
+        self.pool.submit(self._run, key, fn, args, kwargs)
+
+    def _call(self, fn, args, kwargs):
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            self.on_error(e)
+
+    def _run(self, key, fn, args, kwargs):
+        self._call(fn, args, kwargs)
+        with self._lock:
+            queue = self._queues[key]
+            if not queue:
+                del self._queues[key]
+                return
+            fn, args, kwargs = queue.popleft()
+        # Resubmitted rather than looped, so a busy chat cannot keep a worker to itself
+        self.pool.submit(self._run, key, fn, args, kwargs)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'busy_chats': len(self._queues), 'queued': sum(len(q) for q in self._queues.values())}
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class OrderedTeleBot(telebot.TeleBot):
+    '''TeleBot whose handlers run on a ChatOrderedExecutor.'''
+
+    def __init__(self, token: str, workers: int = WORKERS, **kwargs):
+        # Fork the QR workers while this process has no other threads yet
+        start_qr_pool()
+        # telebot's own pool is only kept for the threaded polling loop, which expects one
+        super().__init__(token, num_threads=1, **kwargs)
+        self.executor = ChatOrderedExecutor(workers, self._report_exception)
+
+    def _exec_task(self, task, *args, **kwargs):
+        self.executor.submit(chat_key(args[0]) if args else None, task, *args, **kwargs)
+
+    def _report_exception(self, exception: Exception):
+        if not self._handle_exception(exception):
+            logger.error('Handler raised an exception', exc_info=exception)
+
+    def stop_bot(self):
+        super().stop_bot()
+        self.executor.shutdown()
+
+
+# region background work
+_lock = threading.Lock()
+_background = None
+_loop = None
+
+
+def run_background(fn, *args, **kwargs):
+    '''Runs a long job outside the handler pool; exceptions are logged.'''
+    global _background
+    with _lock:
+        if _background is None:
+            _background = ThreadPoolExecutor(BACKGROUND_WORKERS, thread_name_prefix='bot-background')
+    future = _background.submit(fn, *args, **kwargs)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def _log_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error('Background task failed', exc_info=future.exception())
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop):
+    asyncio.set_event_loop(loop)
+    loop.set_default_executor(ThreadPoolExecutor(LOOP_EXECUTOR_WORKERS, thread_name_prefix='bot-loop-io'))
+    loop.run_forever()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    '''The background event loop, started on first use.'''
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_run_loop, args=(_loop,), name='bot-loop', daemon=True).start()
+    return _loop
+
+
+def spawn(coro):
+    '''Schedules a coroutine on the background loop; safe to call from any thread.'''
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    future.add_done_callback(_log_failure)
+    return future
+
+# endregion
+
+
+# region QR codes
+_qr_pool = None
+
+
+def _render_qr(data: str) -> bytes:
+    return uris.qr_png(data).getvalue()
+
+
+def start_qr_pool():
+    '''
+    Forks the QR worker processes. Called before any thread is started, as
+    forking a process with running threads can leave locks held in the child.
+    '''
+    global _qr_pool
+    if _qr_pool is not None or QR_WORKERS <= 0:
+        return
+    _qr_pool = ProcessPoolExecutor(QR_WORKERS, mp_context=multiprocessing.get_context('fork'))
+    # The fork start method launches every worker on the first submit
+    _qr_pool.submit(len, '').result()
+
+
+def qr_png(data: str) -> io.BytesIO:
+    '''uris.qr_png() rendered in the QR process pool, or in this thread without one.'''
+    global _qr_pool
+    pool = _qr_pool
+    if pool is not None:
+        try:
+            return io.BytesIO(pool.submit(_render_qr, data).result())
+        except BrokenProcessPool:
+            # Not re-forked now that threads are running; render in-process from here on
+            logger.error('QR worker pool stopped, rendering QR codes in-process')
+            _qr_pool = None
+    return uris.qr_png(data)
+
+# endregion
@@ -1,34 +1,41 @@
 from telebot import types
 from utils.command import *
 
+# Seconds Telegram may reuse an answer; results are personal as only admins may search
+INLINE_CACHE_SECONDS = 10
+
 
 @bot.inline_handler(lambda query: is_admin(query.from_user.id))
 def handle_inline_query(query):
-    command = f"python3 {CLI_PATH} list-users"
-    result = run_cli_command(command)
+    offset = int(query.offset) if query.offset.isdigit() else 0
     try:
-        users = json.loads(result)
-    except json.JSONDecodeError:
+        page, next_offset = users.search_users(query.query, offset)
+    except (OSError, ValueError):
         bot.answer_inline_query(query.id, results=[], switch_pm_text="Error retrieving users.", switch_pm_user_id=query.from_user.id)
         return
 
-    query_text = query.query.lower()
     results = []
-    for username, details in users.items():
-        if query_text in username.lower():
-            title = f"{username}"
-            description = f"Traffic Limit: {details['max_download_bytes'] / (1024 ** 3):.2f} GB, Expiration Days: {details['expiration_days']}"
-            results.append(types.InlineQueryResultArticle(
-                id=username,
-                title=title,
-                description=description,
-                input_message_content=types.InputTextMessageContent(
-                    message_text=f"Name: {username}\n"
-                                 f"Traffic limit: {details['max_download_bytes'] / (1024 ** 3):.2f} GB\n"
-                                 f"Days: {details['expiration_days']}\n"
-                                 f"Account Creation: {details['account_creation_date']}\n"
-                                 f"Blocked: {details['blocked']}"
-                )
-            ))
+    for user in page:
+        username = user.username
+        title = f"{username}"
+        description = f"Traffic Limit: {user.traffic_limit_gb:.2f} GB, Expiration Days: {user.expiration_days}"
+        results.append(types.InlineQueryResultArticle(
+            id=username,
+            title=title,
+            description=description,
+            input_message_content=types.InputTextMessageContent(
+                message_text=f"Name: {username}\n"
+                             f"Traffic limit: {user.traffic_limit_gb:.2f} GB\n"
+                             f"Days: {user.expiration_days}\n"
+                             f"Account Creation: {user.account_creation_date}\n"
+                             f"Blocked: {user.blocked}"
+            )
+        ))
 
-    bot.answer_inline_query(query.id, results, cache_time=0)
+    bot.answer_inline_query(
+        query.id,
+        results,
+        cache_time=INLINE_CACHE_SECONDS,
+        is_personal=True,
+        next_offset=str(next_offset) if next_offset is not None else ''
+    )
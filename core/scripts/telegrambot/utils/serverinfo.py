@@ -1,10 +1,20 @@
 from dotenv import load_dotenv
 from telebot import types
 from utils.command import *
+from traffic import format_bytes
 
 @bot.message_handler(func=lambda message: is_admin(message.from_user.id) and message.text == '📊 Server Info')
 def server_info(message):
-    command = f"python3 {CLI_PATH} server-info"
-    result = run_cli_command(command)
     bot.send_chat_action(message.chat.id, 'typing')
-    bot.reply_to(message, result)
+    info = users.server_info()
+    online = info.online_users if info.online_users is not None else 'N/A'
+    bot.reply_to(message, (
+        f"📈 CPU Usage: {info.cpu_percent}%\n"
+        f"📋 Total RAM: {info.total_ram_mb}MB\n"
+        f"💻 Used RAM: {info.used_ram_mb}MB\n"
+        f"👥 Online Users: {online}\n"
+        f"\n"
+        f"🚦Total Traffic: \n"
+        f"🔼{format_bytes(info.upload_bytes)} uploaded\n"
+        f"🔽{format_bytes(info.download_bytes)} downloaded"
+    ))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+'''
+Resident traffic collector (hysteria-traffic.service).
+
+Every COLLECT_INTERVAL seconds the per-user deltas are fetched and cleared from
+the trafficStats API over a keep-alive connection and merged into an in-memory
+table, which is written to the user store in one transaction every
+FLUSH_INTERVAL seconds.
+
+The service also runs the expiry scheduler (core/expiry.py) on a second
+thread, which blocks and kicks each account the moment it expires.
+
+Cycles run one after another on a single thread and hold the same lock as
+`cli.py traffic-status`, so two collections never overlap; a cycle that overruns
+its interval delays the next one instead of queueing a backlog. Deltas cleared
+from the API are journaled to pending.json until a flush succeeds, so neither a
+failed flush nor a restart loses traffic; a journal write that fails is retried
+on the next cycle. While the service runs, `traffic-status` leaves the
+collection and the journal to it.
+'''
+import os
+import sys
+import json
+import time
+import signal
+import sqlite3
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import storage
+from expiry import ExpiryScheduler
+from traffic import TrafficClient, TrafficApiError, PendingTraffic, collection_lock, collector_lock
+
+COLLECT_INTERVAL = float(os.getenv('COLLECT_INTERVAL', '10'))
+FLUSH_INTERVAL = float(os.getenv('FLUSH_INTERVAL', '30'))
+
+
+class TrafficCollector:
+    def __init__(self, client: TrafficClient | None = None):
+        self.client = client or TrafficClient()
+        self.pending = PendingTraffic()
+        self.last_flush = time.monotonic()
+        self.stop_event = threading.Event()
+        self.stats = {'cycles': 0, 'overruns': 0, 'flushes': 0, 'flush_failures': 0, 'journal_failures': 0, 'api_errors': 0}
+
+    def recover(self):
+        with collection_lock():
+            self.pending.load()
+        if self.pending.traffic:
+            print(f'Recovered unflushed traffic of {len(self.pending.traffic)} users', flush=True)
+
+    def journal_failed(self, e: OSError):
+        # The deltas stay in memory and the journal is written again next cycle
+        self.stats['journal_failures'] += 1
+        print(f'Error: Failed to write {self.pending.path}, retrying next cycle. Details: {e}', flush=True)
+
+    def save(self):
+        try:
+            self.pending.save()
+        except OSError as e:
+            self.journal_failed(e)
+
+    def collect(self):
+        try:
+            self.pending.collect(self.client)
+        except OSError as e:
+            self.journal_failed(e)
+
+    def flush(self) -> bool:
+        if not self.pending.traffic:
+            return True
+        users = len(self.pending.traffic)
+        try:
+            self.pending.flush(storage.get_store())
+        except (OSError, ValueError, sqlite3.Error) as e:
+            if self.pending.traffic:
+                self.stats['flush_failures'] += 1
+                print(f'Error: Failed to flush traffic of {users} users, keeping it for the next flush. Details: {e}', flush=True)
+                return False
+            # Stored, only clearing the journal failed
+            self.journal_failed(e)
+        self.stats['flushes'] += 1
+        return True
+
+    def cycle(self, force_flush: bool = False):
+        with collection_lock():
+            if not self.pending.saved:
+                self.save()
+            try:
+                self.collect()
+            except TrafficApiError as e:
+                self.stats['api_errors'] += 1
+                print(f'Error: {e}', flush=True)
+            if force_flush or time.monotonic() - self.last_flush >= FLUSH_INTERVAL:
+                if self.flush():
+                    self.last_flush = time.monotonic()
+        self.stats['cycles'] += 1
+
+    def run(self):
+        with collector_lock():
+            self._run()
+
+    def _run(self):
+        # Loaded under the collection lock, after a traffic-status run that started earlier has flushed it
+        self.recover()
+        expiry_client = TrafficClient()
+        scheduler = ExpiryScheduler(kick=expiry_client.kick)
+        expiry_thread = threading.Thread(target=scheduler.run, args=(self.stop_event,), daemon=True)
+        expiry_thread.start()
+
+        next_run = time.monotonic()
+        while not self.stop_event.is_set():
+            self.cycle()
+            next_run += COLLECT_INTERVAL
+            now = time.monotonic()
+            if next_run < now:
+                self.stats['overruns'] += 1
+                next_run = now
+            self.stop_event.wait(next_run - now)
+
+        # Final cycle so traffic since the last flush reaches the store before exit
+        self.cycle(force_flush=True)
+        self.client.close()
+        expiry_thread.join(timeout=5)
+        expiry_client.close()
+        print(f'Stopped: {json.dumps({**self.stats, **scheduler.stats})}', flush=True)
+
+    def stop(self, *_):
+        self.stop_event.set()
+
+
+if __name__ == '__main__':
+    collector = TrafficCollector()
+    signal.signal(signal.SIGTERM, collector.stop)
+    signal.signal(signal.SIGINT, collector.stop)
+    print(f'Collecting every {COLLECT_INTERVAL:g}s, flushing every {FLUSH_INTERVAL:g}s', flush=True)
+    collector.run()
@@ -0,0 +1,78 @@
+#!/bin/bash
+source /etc/hysteria/core/scripts/path.sh
+source /etc/hysteria/core/scripts/utils.sh
+define_colors
+
+COLLECTOR_ENV="/etc/hysteria/core/scripts/traffic/.env"
+TRAFFIC_CRON="*/1 * * * * /bin/bash -c 'source /etc/hysteria/hysteria2_venv/bin/activate && python3 /etc/hysteria/core/cli.py traffic-status' >/dev/null 2>&1"
+
+create_service_file() {
+    cat <<EOL > /etc/systemd/system/hysteria-traffic.service
+[Unit]
+Description=Hysteria2 Traffic Collector Service
+After=network.target hysteria-server.service
+
+[Service]
+ExecStart=/bin/bash -c 'source /etc/hysteria/hysteria2_venv/bin/activate && /etc/hysteria/hysteria2_venv/bin/python /etc/hysteria/core/scripts/traffic/collector.py'
+WorkingDirectory=/etc/hysteria/core/scripts/traffic
+EnvironmentFile=/etc/hysteria/core/scripts/traffic/.env
+Restart=always
+User=root
+Group=root
+
+[Install]
+WantedBy=multi-user.target
+EOL
+}
+
+start_service() {
+    local interval=$1
+
+    if ! [[ "$interval" =~ ^[0-9]+$ ]] || [ "$interval" -lt 1 ] || [ "$interval" -gt 60 ]; then
+        echo -e "${red}Error:${NC} Interval must be between 1 and 60 seconds."
+        exit 1
+    fi
+
+    cat <<EOL > "$COLLECTOR_ENV"
+COLLECT_INTERVAL=$interval
+FLUSH_INTERVAL=$(( interval > 30 ? interval : 30 ))
+EOL
+
+    create_service_file
+    systemctl daemon-reload
+    systemctl enable hysteria-traffic.service > /dev/null 2>&1
+    systemctl restart hysteria-traffic.service > /dev/null 2>&1
+
+    if systemctl is-active --quiet hysteria-traffic.service; then
+        (crontab -l 2>/dev/null | grep -v "python3 /etc/hysteria/core/cli.py traffic-status" | crontab -) > /dev/null 2>&1
+        echo -e "${green}Traffic collector started.${NC} Collecting every ${interval}s."
+    else
+        echo -e "${red}Error:${NC} hysteria-traffic.service failed to start. The traffic-status cron job was kept."
+        exit 1
+    fi
+}
+
+stop_service() {
+    systemctl stop hysteria-traffic.service > /dev/null 2>&1
+    systemctl disable hysteria-traffic.service > /dev/null 2>&1
+    rm -f "$COLLECTOR_ENV"
+
+    # Fall back to the per-minute cron job
+    if ! crontab -l 2>/dev/null | grep -q "python3 /etc/hysteria/core/cli.py traffic-status"; then
+        (crontab -l 2>/dev/null; echo "$TRAFFIC_CRON") | crontab -
+    fi
+    echo -e "${green}Traffic collector stopped.${NC} Traffic is collected by the per-minute cron job again."
+}
+
+case "$1" in
+    start)
+        start_service "${2:-10}"
+        ;;
+    stop)
+        stop_service
+        ;;
+    *)
+        echo -e "${red}Usage: $0 {start [interval]|stop} ${NC}"
+        exit 1
+        ;;
+esac
@@ -93,6 +93,7 @@ check_services() {
         ["hysteria-server.service"]="Hysteria2"
         ["normalsub.service"]="Normal Subscription"
         ["singbox.service"]="Singbox Subscription"
+        ["subscription.service"]="Unified Subscription"
         ["hysteria-bot.service"]="Hysteria Telegram Bot"
         ["wg-quick@wgcf.service"]="WireGuard (WARP)"
     )
@@ -0,0 +1,405 @@
+'''
+User storage engines.
+
+`json` is the historical users.json file. `sqlite` keeps the same records in
+users.db (WAL mode) with indexes on the lower-cased username, the expiry
+timestamp and the blocked flag, so single-user reads and writes do not depend
+on the size of the user base. Triggers count every change to the users table
+in meta.version, including the ones made by the shell scripts, which is the
+change marker stamp() returns. Inserts and changes to the fields that decide
+an account's expiry also append the username to expiry_events, the change
+feed of the expiry scheduler; traffic counter updates do not.
+
+The engine is selected with USER_STORAGE in .configs.env and both engines
+expose the same methods. Records are always returned in the users.json shape,
+which is what `cli.py list-users` prints regardless of the engine.
+'''
+import os
+import json
+import time
+import fcntl
+import sqlite3
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+import paths
+
+ENGINES = ('json', 'sqlite')
+
+# Order of the keys in a users.json record
+RECORD_FIELDS = (
+    'password', 'max_download_bytes', 'expiration_days', 'account_creation_date',
+    'expires_at', 'blocked', 'upload_bytes', 'download_bytes', 'status',
+)
+# Counters are absent from users.json until the user produces traffic, and
+# expires_at is missing from records written before it was introduced
+OPTIONAL_FIELDS = ('expires_at', 'upload_bytes', 'download_bytes', 'status')
+
+
+_engine_cache = (None, 'json')
+
+
+def get_engine() -> str:
+    global _engine_cache
+    try:
+        st = os.stat(paths.CONFIG_ENV)
+        stamp = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        stamp = None
+
+    if stamp != _engine_cache[0]:
+        engine = paths.read_env_file(paths.CONFIG_ENV).get('USER_STORAGE', 'json')
+        _engine_cache = (stamp, engine if engine in ENGINES else 'json')
+    return _engine_cache[1]
+
+
+def set_engine(engine: str):
+    paths.write_env_value(paths.CONFIG_ENV, 'USER_STORAGE', engine)
+
+
+def expiry_epoch(creation_date: str, expiration_days) -> int | None:
+    '''
+    Returns the unix time at which an account expires, matching
+    `date -d "$creation_date + $days days" +%s` (local midnight).
+    '''
+    try:
+        created = datetime.strptime(creation_date, '%Y-%m-%d')
+        days = int(expiration_days)
+    except (TypeError, ValueError):
+        return None
+    return int(time.mktime(created.timetuple())) + days * 86400
+
+
+def record_expiry(record: dict) -> int | None:
+    '''Precomputed expiry of a record, computed on the fly for older records.'''
+    expires_at = record.get('expires_at')
+    if isinstance(expires_at, int):
+        return expires_at
+    return expiry_epoch(record.get('account_creation_date'), record.get('expiration_days'))
+
+
+def with_expiry(record: dict) -> dict:
+    '''Refreshes the stored expires_at after the creation date or expiration days changed.'''
+    expires_at = expiry_epoch(record.get('account_creation_date'), record.get('expiration_days'))
+    if expires_at is None:
+        record.pop('expires_at', None)
+    else:
+        record['expires_at'] = expires_at
+    return record
+
+
+class JsonUserStore:
+    engine = 'json'
+
+    def __init__(self, path: str = paths.USERS_FILE):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+
+    def stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @contextmanager
+    def _transaction(self):
+        '''Read-modify-write under an exclusive lock, replacing the file atomically.'''
+        with open(self.lock_path, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            users = self.load()
+            yield users
+            temp_file = f'{self.path}.{os.getpid()}.temp'
+            with open(temp_file, 'w') as f:
+                json.dump(users, f, indent=4)
+            os.replace(temp_file, self.path)
+
+    def get(self, username: str) -> dict | None:
+        return self.load().get(username)
+
+    def find(self, username: str) -> tuple[str, dict] | None:
+        lower = username.lower()
+        for name, record in self.load().items():
+            if name.lower() == lower:
+                return name, record
+        return None
+
+    def add(self, username: str, record: dict):
+        with self._transaction() as users:
+            if any(name.lower() == username.lower() for name in users):
+                raise ValueError(f'User {username} already exists.')
+            users[username] = with_expiry(record)
+
+    def update(self, username: str, changes: dict, new_username: str | None = None):
+        with self._transaction() as users:
+            if username not in users:
+                raise KeyError(username)
+            if new_username and new_username != username and new_username in users:
+                raise ValueError(f'User {new_username} already exists.')
+            record = users.pop(username) if new_username and new_username != username else users[username]
+            record.update(changes)
+            users[new_username or username] = with_expiry(record)
+
+    def remove(self, username: str) -> bool:
+        with self._transaction() as users:
+            return users.pop(username, None) is not None
+
+    def add_traffic(self, traffic: dict, online: dict):
+        '''Adds {user: {"tx": n, "rx": n}} deltas and refreshes the online status.'''
+        with self._transaction() as users:
+            for user, info in traffic.items():
+                status = 'Online' if online.get(user, 0) == 1 else 'Offline'
+                if user in users:
+                    users[user]['upload_bytes'] = users[user].get('upload_bytes', 0) + info.get('tx', 0)
+                    users[user]['download_bytes'] = users[user].get('download_bytes', 0) + info.get('rx', 0)
+                    users[user]['status'] = status
+                else:
+                    users[user] = {
+                        'upload_bytes': info.get('tx', 0),
+                        'download_bytes': info.get('rx', 0),
+                        'status': status,
+                    }
+
+    def block(self, usernames) -> list[str]:
+        blocked = []
+        with self._transaction() as users:
+            for name in usernames:
+                if name in users and users[name].get('blocked') is not True:
+                    users[name]['blocked'] = True
+                    blocked.append(name)
+        return blocked
+
+
+class SqliteUserStore:
+    engine = 'sqlite'
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            username_lower TEXT NOT NULL,
+            password TEXT NOT NULL,
+            max_download_bytes INTEGER NOT NULL DEFAULT 0,
+            expiration_days INTEGER NOT NULL DEFAULT 0,
+            account_creation_date TEXT,
+            expires_at INTEGER,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            upload_bytes INTEGER,
+            download_bytes INTEGER,
+            status TEXT
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS users_username_lower ON users(username_lower);
+        CREATE INDEX IF NOT EXISTS users_expires_at ON users(expires_at);
+        CREATE INDEX IF NOT EXISTS users_blocked ON users(blocked);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta VALUES ('version', 0);
+        CREATE TRIGGER IF NOT EXISTS users_version_insert AFTER INSERT ON users
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+        CREATE TRIGGER IF NOT EXISTS users_version_update AFTER UPDATE ON users
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+        CREATE TRIGGER IF NOT EXISTS users_version_delete AFTER DELETE ON users
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END;
+        CREATE TABLE IF NOT EXISTS expiry_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL
+        );
+        CREATE TRIGGER IF NOT EXISTS users_expiry_insert AFTER INSERT ON users
+            BEGIN INSERT INTO expiry_events (username) VALUES (NEW.username); END;
+        CREATE TRIGGER IF NOT EXISTS users_expiry_update
+            AFTER UPDATE OF account_creation_date, expiration_days, expires_at, blocked, max_download_bytes ON users
+            BEGIN INSERT INTO expiry_events (username) VALUES (NEW.username); END;
+    '''
+    COLUMNS = ', '.join(RECORD_FIELDS)
+    ASSIGNMENTS = ', '.join(f'{column} = ?' for column in ('username', 'username_lower', *RECORD_FIELDS))
+
+    def __init__(self, path: str = paths.USERS_DB):
+        self.path = path
+        self._local = threading.local()
+        self._ensure_schema()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _ensure_schema(self):
+        self.conn.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    @staticmethod
+    def _record(row) -> dict:
+        record = dict(zip(RECORD_FIELDS, row))
+        record['blocked'] = bool(record['blocked'])
+        for field in OPTIONAL_FIELDS:
+            if record[field] is None:
+                del record[field]
+        return record
+
+    @staticmethod
+    def _row(username: str, record: dict) -> tuple:
+        return (
+            username,
+            username.lower(),
+            record.get('password', ''),
+            int(record.get('max_download_bytes') or 0),
+            int(record.get('expiration_days') or 0),
+            record.get('account_creation_date'),
+            expiry_epoch(record.get('account_creation_date'), record.get('expiration_days')),
+            1 if record.get('blocked') is True else 0,
+            record.get('upload_bytes'),
+            record.get('download_bytes'),
+            record.get('status'),
+        )
+
+    def stamp(self):
+        # Shared by every connection, unlike PRAGMA data_version and total_changes
+        return self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def expiry_cursor(self) -> int:
+        return self.conn.execute('SELECT IFNULL(MAX(id), 0) FROM expiry_events').fetchone()[0]
+
+    def expiry_events(self, after: int) -> tuple[int, list[str]]:
+        '''Users whose expiry may have changed since the event `after`, and the last event id.'''
+        rows = self.conn.execute('SELECT id, username FROM expiry_events WHERE id > ? ORDER BY id', (after,)).fetchall()
+        return (rows[-1][0] if rows else after), [username for _, username in rows]
+
+    def prune_expiry_events(self, upto: int):
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM expiry_events WHERE id <= ?', (upto,))
+
+    def load(self) -> dict:
+        rows = self.conn.execute(f'SELECT username, {self.COLUMNS} FROM users ORDER BY rowid')
+        return {row[0]: self._record(row[1:]) for row in rows}
+
+    def get(self, username: str) -> dict | None:
+        row = self.conn.execute(f'SELECT {self.COLUMNS} FROM users WHERE username = ?', (username,)).fetchone()
+        return self._record(row) if row else None
+
+    def find(self, username: str) -> tuple[str, dict] | None:
+        row = self.conn.execute(
+            f'SELECT username, {self.COLUMNS} FROM users WHERE username_lower = ?', (username.lower(),)
+        ).fetchone()
+        return (row[0], self._record(row[1:])) if row else None
+
+    def add(self, username: str, record: dict):
+        try:
+            with self._transaction() as conn:
+                conn.execute('INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', self._row(username, record))
+        except sqlite3.IntegrityError:
+            raise ValueError(f'User {username} already exists.')
+
+    def import_users(self, users: dict):
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (self._row(name, record) for name, record in users.items() if 'password' in record),
+            )
+
+    def update(self, username: str, changes: dict, new_username: str | None = None):
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(f'SELECT {self.COLUMNS} FROM users WHERE username = ?', (username,)).fetchone()
+                if row is None:
+                    raise KeyError(username)
+                record = self._record(row)
+                record.update(changes)
+                # In place, so the rowid and with it the order of load() survive edits and renames
+                conn.execute(
+                    f'UPDATE users SET {self.ASSIGNMENTS} WHERE username = ?',
+                    (*self._row(new_username or username, record), username),
+                )
+        except sqlite3.IntegrityError:
+            raise ValueError(f'User {new_username} already exists.')
+
+    def remove(self, username: str) -> bool:
+        with self._transaction() as conn:
+            return conn.execute('DELETE FROM users WHERE username = ?', (username,)).rowcount > 0
+
+    def add_traffic(self, traffic: dict, online: dict):
+        with self._transaction() as conn:
+            conn.executemany(
+                '''UPDATE users SET
+                       upload_bytes = IFNULL(upload_bytes, 0) + ?,
+                       download_bytes = IFNULL(download_bytes, 0) + ?,
+                       status = ?
+                   WHERE username = ?''',
+                (
+                    (info.get('tx', 0), info.get('rx', 0), 'Online' if online.get(user, 0) == 1 else 'Offline', user)
+                    for user, info in traffic.items()
+                ),
+            )
+
+    def block(self, usernames) -> list[str]:
+        blocked = []
+        with self._transaction() as conn:
+            for name in usernames:
+                if conn.execute('UPDATE users SET blocked = 1 WHERE username = ? AND blocked = 0', (name,)).rowcount:
+                    blocked.append(name)
+        return blocked
+
+
+_stores = {}
+
+
+def get_store(engine: str | None = None):
+    engine = engine or get_engine()
+    if engine not in _stores:
+        _stores[engine] = SqliteUserStore() if engine == 'sqlite' else JsonUserStore()
+    return _stores[engine]
+
+
+def migrate(target: str) -> int:
+    '''
+    Copies every user from the active engine into `target` and makes it the
+    active engine. Returns the number of migrated users.
+    '''
+    source = get_store()
+    if source.engine == target:
+        raise ValueError(f'User storage is already {target}.')
+
+    users = source.load()
+    if target == 'sqlite':
+        if os.path.exists(paths.USERS_DB):
+            os.replace(paths.USERS_DB, f'{paths.USERS_DB}.bak')
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(paths.USERS_DB + suffix):
+                    os.remove(paths.USERS_DB + suffix)
+        get_store('sqlite').import_users(users)
+    else:
+        export_json(users, paths.USERS_FILE)
+
+    set_engine(target)
+    return len(users)
+
+
+def export_json(users: dict, path: str):
+    temp_file = f'{path}.temp'
+    with open(temp_file, 'w') as f:
+        json.dump(users, f, indent=4)
+    os.replace(temp_file, path)
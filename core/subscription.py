@@ -0,0 +1,389 @@
+'''
+Subscription rendering and the aiohttp application behind the sublink servers.
+
+Every format is rendered from the same UserIndex (through uris) and stored in
+the same ResponseCache, so one process can serve all of them:
+
+    /sub/{username}                       format from ?format= or the User-Agent
+    /sub/singbox/{username}/{ip_version}  sing-box JSON (singbox.service route)
+    /sub/normal/{username}                hy2:// URI list (normalsub.service route)
+
+Formats are `singbox` (JSON), `uri` (plain hy2:// list), `base64` (the same
+list base64 encoded) and `clash` (Clash-Meta/mihomo YAML). Without ?format=,
+sing-box and Clash clients are recognised by their User-Agent and everything
+else gets the URI list. The unified route takes ?ip=4|6 for the sing-box server
+address and ?fragment= for its TLS server name, as /sub/singbox/ does.
+sing-box JSON is indented unless ?compact=1 is given (or SUB_COMPACT_JSON=1
+makes compact the default). Bodies are sent gzip or brotli compressed when the
+client accepts it.
+
+Every response carries Subscription-Userinfo (upload, download, total, expire)
+from the same UserIndex record, which the traffic collector keeps current, so
+clients can show the remaining quota and expiry. The ETag covers these values,
+while the cached body is keyed on the rendering inputs alone, so a traffic
+update changes the ETag without rendering the body again.
+
+singbox.py and normalsub.py serve their own route group; scripts/subscription
+serves all of them from one process. With SUB_WORKERS greater than 1, run()
+forks that many workers sharing the port, the rate limit buckets and a cache
+generation that SIGHUP bumps (see prefork.py). A generation bump also reloads
+the TLS certificate; see tls.py for session tickets and certificate reload.
+
+Handlers never block the event loop: the user lookup, server parameters and
+rendering run in render_pool, which caps concurrency, sheds load with 503 +
+Retry-After once SUB_MAX_QUEUE requests are waiting and gives every request a
+SUB_TIMEOUT deadline (see offload.py).
+'''
+import os
+import re
+import copy
+import json
+import base64
+import signal
+import asyncio
+
+from aiohttp import web
+
+import uris
+import storage
+import tls
+import prefork
+from offload import BoundedExecutor, Overloaded
+from rate_limit import RateLimiter, SharedRateLimiter, rate_limit_middleware, is_local_request
+from response_cache import (
+    ResponseCache, CACHE_CONTROL, ENCODINGS, MIN_COMPRESS_SIZE,
+    make_etag, etag_matches, encoding_etag, negotiate_encoding, compress,
+)
+
+TEMPLATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts', 'singbox', 'singbox.json')
+FORMATS = ('singbox', 'uri', 'base64', 'clash')
+CONTENT_TYPES = {
+    'singbox': 'application/json',
+    'uri': 'text/plain',
+    'base64': 'text/plain',
+    'clash': 'text/yaml',
+}
+# Same probe URL as the sing-box template
+URL_TEST = 'http://cp.cloudflare.com'
+WORKERS = int(os.getenv('SUB_WORKERS', '1'))
+# Address to listen on; all interfaces when unset
+HOST = os.getenv('SUB_HOST') or None
+# Lookups and rendering run in a thread pool: at most SUB_CONCURRENCY at once,
+# SUB_MAX_QUEUE waiting, each answered within SUB_TIMEOUT seconds or dropped
+CONCURRENCY = int(os.getenv('SUB_CONCURRENCY', '4'))
+MAX_QUEUE = int(os.getenv('SUB_MAX_QUEUE', '64'))
+TIMEOUT = float(os.getenv('SUB_TIMEOUT', '10'))
+RETRY_AFTER = 5
+COMPACT_JSON = os.getenv('SUB_COMPACT_JSON', '0')
+
+rate_limiter = RateLimiter()
+response_cache = ResponseCache()
+render_pool = BoundedExecutor(CONCURRENCY, MAX_QUEUE, TIMEOUT, RETRY_AFTER)
+# Set by run(): prefork.SharedState and tls.TlsManager
+shared_state = None
+tls_manager = None
+
+# (mtime_ns, size) of singbox.json and its parsed content
+template_cache = (None, None)
+
+
+def sanitize_input(value, pattern):
+    if not re.match(pattern, value):
+        raise ValueError(f"Invalid value: {value}")
+    return value
+
+
+def current_template():
+    """Returns (stamp, template) for singbox.json, which is parsed again only when the file changes.
+    The template is shared and must be copied before it is filled in."""
+    global template_cache
+    try:
+        st = os.stat(TEMPLATE_FILE)
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp != template_cache[0]:
+            with open(TEMPLATE_FILE, 'r') as f:
+                template_cache = (stamp, json.load(f))
+    except (IOError, json.JSONDecodeError):
+        raise RuntimeError("Failed to load template.")
+    return template_cache
+
+
+def clear_caches():
+    global template_cache
+    response_cache.clear()
+    template_cache = (None, None)
+    uris.clear_cache()
+
+
+# region renderers
+
+def generate_singbox_config(username, ip_version, fragment, password, params, template):
+    config = copy.deepcopy(template)
+    hysteria_tag = f"{username}-Hysteria2"
+    config['outbounds'][2]['tag'] = hysteria_tag
+    config['outbounds'][2]['server'] = params.ip4 if ip_version == '4' else params.ip6
+    config['outbounds'][2]['server_port'] = int(params.port)
+    config['outbounds'][2]['obfs']['password'] = params.obfs_password
+    config['outbounds'][2]['password'] = f"{username}:{password}"
+
+    config['outbounds'][2]['tls']['server_name'] = fragment if fragment else params.sni
+
+    config['outbounds'][0]['outbounds'] = ["auto", hysteria_tag]
+    config['outbounds'][1]['outbounds'] = [hysteria_tag]
+
+    return config
+
+
+def get_user_uri(username, password, params):
+    return '\n'.join(uris.build_uri(username, password, version, params) for version in (4, 6))
+
+
+def _yaml(value) -> str:
+    # JSON scalars and flow sequences are valid YAML, and quoting them this way is always safe
+    return json.dumps(value)
+
+
+def generate_clash_config(username, password, params):
+    proxies = []
+    names = []
+    for version, host in ((4, params.ip4), (6, params.ip6)):
+        if not host:
+            continue
+        name = f'{username}-IPv{version}'
+        names.append(name)
+        proxies += [
+            f'  - name: {_yaml(name)}',
+            '    type: hysteria2',
+            f'    server: {_yaml(host)}',
+            f'    port: {int(params.port)}',
+            f'    password: {_yaml(f"{username}:{password}")}',
+            f'    sni: {_yaml(params.sni)}',
+            '    skip-cert-verify: true',
+        ]
+        if params.sha256:
+            proxies.append(f'    fingerprint: {_yaml(params.sha256.replace(":", "").lower())}')
+        if params.obfs_password:
+            proxies += ['    obfs: salamander', f'    obfs-password: {_yaml(params.obfs_password)}']
+
+    lines = [
+        'mixed-port: 7890',
+        'allow-lan: false',
+        'mode: rule',
+        'log-level: warning',
+        '',
+        'proxies:',
+        *proxies,
+        '',
+        'proxy-groups:',
+        '  - name: Proxy',
+        '    type: select',
+        f'    proxies: {_yaml(["auto", *names, "DIRECT"])}',
+        '  - name: auto',
+        '    type: url-test',
+        f'    url: {_yaml(URL_TEST)}',
+        '    interval: 300',
+        f'    proxies: {_yaml(names)}',
+        '',
+        'rules:',
+        '  - MATCH,Proxy',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def render(fmt, username, ip_version, fragment, compact, password, params, template):
+    if fmt == 'singbox':
+        config = generate_singbox_config(username, ip_version, fragment, password, params, template)
+        if compact:
+            return json.dumps(config, separators=(',', ':'), sort_keys=True)
+        return json.dumps(config, indent=4, sort_keys=True)
+    if fmt == 'clash':
+        return generate_clash_config(username, password, params)
+    uri_output = get_user_uri(username, password, params)
+    if fmt == 'base64':
+        return base64.b64encode(uri_output.encode()).decode()
+    return uri_output
+
+# endregion
+
+
+def subscription_userinfo(record: dict) -> str:
+    '''Subscription-Userinfo value; total=0 and expire=0 mean unlimited.'''
+    expire = 0
+    if (record.get('expiration_days') or 0) > 0:
+        expire = storage.record_expiry(record) or 0
+    return (
+        f"upload={record.get('upload_bytes') or 0}; download={record.get('download_bytes') or 0}; "
+        f"total={record.get('max_download_bytes') or 0}; expire={expire}"
+    )
+
+
+def detect_format(user_agent: str) -> str:
+    user_agent = user_agent.lower()
+    if 'sing-box' in user_agent:
+        return 'singbox'
+    if any(client in user_agent for client in ('clash', 'mihomo', 'stash')):
+        return 'clash'
+    return 'uri'
+
+
+def respond(if_none_match, accept_encoding, fmt, username, ip_version='4', fragment='', compact=False):
+    '''Builds the response for a subscription. Blocking: called through render_pool.'''
+    record = uris.get_user(username)
+    if record is None:
+        return web.Response(status=404, text="Error: User not found.")
+    password = record.get('password')
+    params = uris.server_params()
+    stamp, template = current_template() if fmt == 'singbox' else (None, None)
+
+    body_etag = make_etag(fmt, username, ip_version, fragment, compact, password, params, stamp)
+    userinfo = subscription_userinfo(record)
+    etag = make_etag(body_etag, userinfo)
+    headers = {'Cache-Control': CACHE_CONTROL, 'Vary': 'Accept-Encoding', 'Subscription-Userinfo': userinfo}
+    if fmt == 'clash':
+        headers['Content-Disposition'] = f'attachment; filename="{username}.yaml"'
+    # The client may hold any coding of the current body
+    for encoding in (None, *ENCODINGS):
+        if etag_matches(if_none_match, encoding_etag(etag, encoding)):
+            response_cache.stats['not_modified'] += 1
+            return web.Response(status=304, headers={**headers, 'ETag': encoding_etag(etag, encoding)})
+
+    key = (fmt, username, ip_version, fragment, compact)
+    body = response_cache.get(key, body_etag)
+    if body is None:
+        body = render(fmt, username, ip_version, fragment, compact, password, params, template).encode()
+        response_cache.put(key, body_etag, body)
+
+    encoding = negotiate_encoding(accept_encoding) if len(body) >= MIN_COMPRESS_SIZE else None
+    if encoding:
+        compressed = response_cache.get((*key, encoding), body_etag)
+        if compressed is None:
+            compressed = compress(body, encoding)
+            response_cache.put((*key, encoding), body_etag, compressed)
+        body = compressed
+        headers['Content-Encoding'] = encoding
+    headers['ETag'] = encoding_etag(etag, encoding)
+    return web.Response(body=body, content_type=CONTENT_TYPES[fmt], charset='utf-8', headers=headers)
+
+
+def _handler(parse):
+    '''Wraps a request parser returning respond() arguments with the usual 400/500 handling.'''
+    async def handle(request):
+        try:
+            return await render_pool.run(respond, request.headers.get('If-None-Match'),
+                                         request.headers.get('Accept-Encoding'), *parse(request))
+        except ValueError as e:
+            return web.Response(status=400, text=f"Error: {str(e)}")
+        except Overloaded as e:
+            return web.Response(status=503, text="Error: Server is busy, try again later.",
+                                headers={'Retry-After': str(e.retry_after)})
+        except asyncio.TimeoutError:
+            print(f"Timed out: {request.path}")
+            return web.Response(status=503, text="Error: Request timed out.", headers={'Retry-After': str(RETRY_AFTER)})
+        except Exception as e:
+            print(f"Internal Server Error: {str(e)}")
+            return web.Response(status=500, text="Error: Internal server error.")
+    return handle
+
+
+def _username(request):
+    return sanitize_input(request.match_info.get('username', ''), r'^[a-zA-Z0-9_-]+$')
+
+
+def _compact(request):
+    return request.query.get('compact', COMPACT_JSON).lower() in ('1', 'true', 'yes')
+
+
+@_handler
+def handle_singbox(request):
+    username = _username(request)
+    ip_version = sanitize_input(request.match_info.get('ip_version', ''), r'^[46]$')
+    return 'singbox', username, ip_version, request.query.get('fragment', ''), _compact(request)
+
+
+@_handler
+def handle_normal(request):
+    return 'uri', _username(request)
+
+
+@_handler
+def handle_subscription(request):
+    username = _username(request)
+    fmt = request.query.get('format') or detect_format(request.headers.get('User-Agent', ''))
+    if fmt not in FORMATS:
+        raise ValueError(f"Invalid 'format' parameter. Must be one of: {', '.join(FORMATS)}.")
+    ip_version = sanitize_input(request.query.get('ip', '4'), r'^[46]$')
+    return fmt, username, ip_version, request.query.get('fragment', ''), fmt == 'singbox' and _compact(request)
+
+
+async def handle_stats(request):
+    if not is_local_request(request):
+        return await handle_404(request)
+    stats = {'rate_limit': rate_limiter.stats(), 'cache': response_cache.stats, 'executor': render_pool.stats()}
+    if shared_state:
+        stats['worker'] = shared_state.stats()
+    if tls_manager:
+        stats['tls'] = tls_manager.stats()
+    return web.json_response(stats)
+
+
+async def handle_404(request):
+    print(f"404 Not Found: {request.path}")
+    return web.Response(status=404, text="Not Found")
+
+
+ROUTES = {
+    'singbox': [web.get('/sub/singbox/{username}/{ip_version}', handle_singbox, name='singbox')],
+    'normal': [web.get('/sub/normal/{username}', handle_normal, name='normal')],
+    'subscription': [web.get('/sub/{username}', handle_subscription, name='subscription')],
+}
+
+
+def create_app(*groups) -> web.Application:
+    '''Application serving the given ROUTES groups (all of them by default).'''
+    app = web.Application(middlewares=[rate_limit_middleware(rate_limiter)])
+    for group in groups or ROUTES:
+        app.add_routes(ROUTES[group])
+    app.add_routes([web.get('/stats', handle_stats, name='stats')])
+    app.router.add_route('*', '/sub/{tail:.*}', handle_404, name='not_found')
+    return app
+
+
+def _on_tick():
+    if shared_state.changed():
+        clear_caches()
+        tls_manager.request_reload()
+
+
+def _serve(groups, port, worker=False):
+    '''Runs the server in this process. Workers keep the TLS context they were forked with.'''
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        await tls.serve(create_app(*groups), port, tls_manager, stop, on_tick=_on_tick, refresh=not worker, host=HOST)
+
+    asyncio.run(main())
+
+
+def _refresh_tls(forced: bool) -> bool:
+    if forced:
+        tls_manager.request_reload()
+    return tls_manager.refresh() is not None
+
+
+def run(groups, port, certfile, keyfile, workers=WORKERS):
+    '''Serves the given ROUTES groups, forking `workers` processes when it is more than 1.'''
+    global rate_limiter, shared_state, tls_manager
+    # Created before forking so that every worker maps the same memory
+    shared_state = prefork.SharedState()
+    tls_manager = tls.TlsManager(certfile, keyfile)
+    if workers <= 1:
+        signal.signal(signal.SIGHUP, lambda signum, frame: shared_state.bump_generation())
+        print(f"Serving on port {port}", flush=True)
+        _serve(groups, port)
+        return
+
+    rate_limiter = SharedRateLimiter()
+    tls_manager.create_context()
+    prefork.serve(lambda: _serve(groups, port, worker=True), workers, shared_state, refresh=_refresh_tls)
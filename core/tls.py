@@ -0,0 +1,150 @@
+'''
+TLS for the subscription servers: session resumption, ticket key rotation and
+certificate reload without a restart.
+
+OpenSSL issues session tickets by default, so a client polling again within
+the ticket lifetime resumes the session instead of doing a full handshake. The
+ticket keys are generated with each SSLContext and Python offers no way to
+replace them, so keys are rotated by building a fresh context every
+TICKET_ROTATION seconds. The certificate and key are loaded into a fresh context
+the same way, when their files change (checked every second) or on request
+(SIGHUP).
+
+A listening socket is bound to one context, so serve() swaps listeners rather
+than contexts: the new context gets its own SO_REUSEPORT listener on the same
+port, and the old listener closes once the new one accepts. Connections that
+are already open are left alone. A context that fails to load (e.g. a renewal
+writing the key after the certificate) is logged, and the current one is kept.
+
+With pre-forked workers the supervisor owns the TlsManager instead: workers
+inherit its context, so they share ticket keys and a client resumes whichever
+worker it reaches, and a new context is rolled out by replacing the workers
+(prefork.serve refresh).
+'''
+import os
+import ssl
+import time
+import asyncio
+
+from aiohttp import web
+
+TICKET_ROTATION = int(os.getenv('SUB_TICKET_ROTATION', '3600'))
+STATS_FIELDS = ('accept', 'accept_good', 'hits', 'misses', 'timeouts')
+
+
+def _stamp(path: str):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except (OSError, TypeError):
+        return None
+
+
+class TlsManager:
+    def __init__(self, certfile: str, keyfile: str, rotation: int = TICKET_ROTATION):
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.rotation = rotation
+        self.context = None
+        self.created = 0.0
+        self._stamp = None
+        self._reload_requested = False
+        # session_stats() of contexts that were replaced
+        self._retired = dict.fromkeys(STATS_FIELDS, 0)
+        self.counters = {'reloads': 0, 'rotations': 0, 'reload_errors': 0}
+
+    def _files_stamp(self):
+        return (_stamp(self.certfile), _stamp(self.keyfile))
+
+    def create_context(self) -> ssl.SSLContext:
+        stamp = self._files_stamp()
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(certfile=self.certfile, keyfile=self.keyfile)
+        ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+        ssl_context.set_ciphers('AES256+EECDH:AES256+EDH')
+        # Tickets are on by default; make sure nothing turned them off
+        ssl_context.options &= ~ssl.OP_NO_TICKET
+
+        if self.context is not None:
+            retired = self.context.session_stats()
+            for field in STATS_FIELDS:
+                self._retired[field] += retired[field]
+        self.context = ssl_context
+        self.created = time.monotonic()
+        self._stamp = stamp
+        return ssl_context
+
+    def request_reload(self):
+        '''Safe to call from a signal handler: the reload happens on the next check.'''
+        self._reload_requested = True
+
+    def pending(self) -> str | None:
+        '''Why the context should be replaced now, or None.'''
+        if self._reload_requested:
+            return 'reloads'
+        if self._files_stamp() != self._stamp:
+            return 'reloads'
+        if self.rotation > 0 and time.monotonic() - self.created >= self.rotation:
+            return 'rotations'
+        return None
+
+    def refresh(self) -> ssl.SSLContext | None:
+        '''Builds the next context if one is due, else returns None.'''
+        reason = self.pending()
+        if reason is None:
+            return None
+        self._reload_requested = False
+        try:
+            ssl_context = self.create_context()
+        except (OSError, ssl.SSLError) as e:
+            self.counters['reload_errors'] += 1
+            # Retry once the files change again (or on the next rotation)
+            self._stamp = self._files_stamp()
+            self.created = time.monotonic()
+            print(f"Error: Failed to load TLS certificate, keeping the current one: {e}", flush=True)
+            return None
+        self.counters[reason] += 1
+        return ssl_context
+
+    def stats(self) -> dict:
+        current = self.context.session_stats() if self.context else dict.fromkeys(STATS_FIELDS, 0)
+        totals = {field: self._retired[field] + current[field] for field in STATS_FIELDS}
+        handshakes = totals['accept_good']
+        return {
+            'handshakes': handshakes,
+            'resumed': totals['hits'],
+            'resumption_ratio': round(totals['hits'] / handshakes, 4) if handshakes else 0,
+            'failed_handshakes': totals['accept'] - handshakes,
+            **self.counters,
+        }
+
+
+async def serve(app: web.Application, port: int, tls: TlsManager, stop: asyncio.Event, on_tick=None, refresh=True, host=None):
+    '''
+    Serves app on port until stop is set, replacing the listener whenever tls
+    has a new context (unless refresh is False). on_tick, if given, is called
+    once a second.
+    '''
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port, ssl_context=tls.context or tls.create_context(), reuse_port=True)
+    await site.start()
+    try:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), 1)
+                break
+            except asyncio.TimeoutError:
+                pass
+            if on_tick:
+                on_tick()
+
+            ssl_context = tls.refresh() if refresh else None
+            if ssl_context is None:
+                continue
+            new_site = web.TCPSite(runner, host=host, port=port, ssl_context=ssl_context, reuse_port=True)
+            await new_site.start()
+            await site.stop()
+            site = new_site
+    finally:
+        await runner.cleanup()
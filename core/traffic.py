@@ -1,82 +1,225 @@
 #!/usr/bin/env python3
-import subprocess
-import json
 import os
+import json
+import fcntl
+import sqlite3
+import http.client
+from contextlib import contextmanager
+from urllib.parse import urlsplit
 
-# Define static variables for paths and URLs
-CONFIG_FILE = '/etc/hysteria/config.json'
-USERS_FILE = '/etc/hysteria/users.json'
-TRAFFIC_API_URL = 'http://127.0.0.1:25413/traffic?clear=1'
-ONLINE_API_URL = 'http://127.0.0.1:25413/online'
+import paths
+import storage
 
-def traffic_status():
-    green = '\033[0;32m'
-    cyan = '\033[0;36m'
-    NC = '\033[0m'
+# Held for a whole collection cycle (fetch + store) by both `cli.py traffic-status`
+# and the resident collector, so two cycles never interleave
+LOCK_FILE = os.path.join(paths.HYSTERIA_DIR, '.traffic.lock')
+# Held by the resident collector for as long as it runs, as the journal is its own meanwhile
+COLLECTOR_LOCK_FILE = os.path.join(paths.HYSTERIA_DIR, '.traffic-collector.lock')
 
-    try:
-        secret = subprocess.check_output(['jq', '-r', '.trafficStats.secret', CONFIG_FILE]).decode().strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error: Failed to read secret from {CONFIG_FILE}. Details: {e}")
-        return
 
-    if not secret:
-        print("Error: Secret not found in config.json")
-        return
+class TrafficApiError(Exception):
+    pass
 
-    try:
-        response = subprocess.check_output(['curl', '-s', '-H', f'Authorization: {secret}', TRAFFIC_API_URL]).decode().strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error: Failed to fetch traffic data. Details: {e}")
-        return
 
-    if not response or response == "{}":
-        print("No traffic data available.")
-        return
+@contextmanager
+def collection_lock():
+    with open(LOCK_FILE, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
 
-    try:
-        online_response = subprocess.check_output(['curl', '-s', '-H', f'Authorization: {secret}', ONLINE_API_URL]).decode().strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error: Failed to fetch online status data. Details: {e}")
-        return
 
-    if not online_response:
-        print("No online data available.")
-        return
+@contextmanager
+def collector_lock():
+    with open(COLLECTOR_LOCK_FILE, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
 
-    response_dict = json.loads(response)
-    online_dict = json.loads(online_response)
 
-    # Load the current users.json data
-    users_data = {}
-    if os.path.exists(USERS_FILE):
+def collector_running() -> bool:
+    with open(COLLECTOR_LOCK_FILE, 'w') as lock:
         try:
-            with open(USERS_FILE, 'r') as users_file:
-                users_data = json.load(users_file)
-        except json.JSONDecodeError:
-            print("Error: Failed to parse existing users data JSON file.")
-            return
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+    return False
+
+
+class TrafficClient:
+    '''
+    Client for the trafficStats API of hysteria-server over one keep-alive
+    connection. The secret is re-read from config.json only when it changes.
+    '''
+
+    def __init__(self, base_url: str = paths.TRAFFIC_API, timeout: float = 5):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port
+        self.timeout = timeout
+        self._conn = None
+        self._secret = ''
+        self._secret_stamp = None
+
+    def secret(self) -> str:
+        try:
+            st = os.stat(paths.CONFIG_FILE)
+        except FileNotFoundError:
+            raise TrafficApiError(f'{paths.CONFIG_FILE} not found')
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp != self._secret_stamp:
+            try:
+                with open(paths.CONFIG_FILE, 'r') as f:
+                    self._secret = json.load(f).get('trafficStats', {}).get('secret', '')
+            except (OSError, json.JSONDecodeError) as e:
+                raise TrafficApiError(f'Failed to read secret from {paths.CONFIG_FILE}. Details: {e}')
+            self._secret_stamp = stamp
+        if not self._secret:
+            raise TrafficApiError('Secret not found in config.json')
+        return self._secret
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def request(self, method: str, path: str, body=None):
+        headers = {'Authorization': self.secret()}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        while True:
+            reused = self._conn is not None
+            if not reused:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request(method, path, body=body, headers=headers)
+                response = self._conn.getresponse()
+                data = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                self.close()
+                # The server closed an idle keep-alive connection before reading the
+                # request, so it was not processed and can be sent again. Any other
+                # failure is not retried: /traffic?clear=1 may already have cleared.
+                if reused and isinstance(e, (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)):
+                    continue
+                raise TrafficApiError(f'{method} {path} failed. Details: {e}')
+            break
+
+        if response.status != 200:
+            raise TrafficApiError(f'{method} {path} returned HTTP {response.status}')
+        if not data:
+            return None
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError as e:
+            raise TrafficApiError(f'{method} {path} returned invalid JSON. Details: {e}')
 
-    # Update users.json with traffic data
-    for user, traffic_info in response_dict.items():
-        tx_bytes = traffic_info.get('tx', 0)
-        rx_bytes = traffic_info.get('rx', 0)
-        online_status = online_dict.get(user, 0)
+    def traffic(self, clear: bool = True) -> dict:
+        return self.request('GET', '/traffic?clear=1' if clear else '/traffic') or {}
 
-        if user in users_data:
-            users_data[user]["upload_bytes"] = users_data[user].get("upload_bytes", 0) + tx_bytes
-            users_data[user]["download_bytes"] = users_data[user].get("download_bytes", 0) + rx_bytes
-            users_data[user]["status"] = "Online" if online_status == 1 else "Offline"
+    def online(self) -> dict:
+        return self.request('GET', '/online') or {}
+
+    def kick(self, usernames: list[str]):
+        self.request('POST', '/kick', usernames)
+
+
+class PendingTraffic:
+    '''
+    Deltas cleared from the API but not yet in the user store. They are
+    journaled to PENDING_FILE before anything else can fail, so neither a
+    failed flush nor a restart loses them. Every method keeps the in-memory
+    state right even when it raises; a journal write that failed is retried by
+    the next save().
+    '''
+
+    def __init__(self, path: str = paths.TRAFFIC_PENDING):
+        self.path = path
+        self.traffic = {}  # username -> {'tx': bytes, 'rx': bytes}
+        self.online = {}
+        self.saved = True
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        self.merge(state.get('traffic', {}))
+        self.online = state.get('online', {})
+
+    def save(self):
+        self.saved = False
+        if not self.traffic:
+            if os.path.exists(self.path):
+                os.remove(self.path)
         else:
-            users_data[user] = {
-                "upload_bytes": tx_bytes,
-                "download_bytes": rx_bytes,
-                "status": "Online" if online_status == 1 else "Offline"
-            }
-
-    # Save the updated data back to users.json
-    with open(USERS_FILE, 'w') as users_file:
-        json.dump(users_data, users_file, indent=4)
+            temp_file = f'{self.path}.temp'
+            with open(temp_file, 'w') as f:
+                json.dump({'traffic': self.traffic, 'online': self.online}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.path)
+        self.saved = True
+
+    def merge(self, traffic: dict):
+        for user, info in traffic.items():
+            entry = self.traffic.setdefault(user, {'tx': 0, 'rx': 0})
+            entry['tx'] += info.get('tx', 0)
+            entry['rx'] += info.get('rx', 0)
+
+    def collect(self, client: TrafficClient):
+        # Asked first, as nothing may fail between clearing the counters and journaling them
+        online = client.online()
+        traffic = client.traffic(clear=True)
+        self.online = online
+        if traffic:
+            self.merge(traffic)
+            self.save()
+
+    def flush(self, store):
+        if self.traffic:
+            store.add_traffic(self.traffic, self.online)
+            self.traffic = {}
+            self.save()
+
+
+def traffic_status():
+    green = '\033[0;32m'
+    cyan = '\033[0;36m'
+    NC = '\033[0m'
+
+    client = TrafficClient()
+    store = storage.get_store()
+    try:
+        with collection_lock():
+            # The resident collector owns the journal and flushes on its own
+            if not collector_running():
+                pending = PendingTraffic()
+                pending.load()
+                try:
+                    pending.collect(client)
+                except OSError as e:
+                    # Not journaled, so it has to reach the store right away
+                    print(f"Warning: Failed to write {pending.path}. Details: {e}")
+                pending.flush(store)
+    except TrafficApiError as e:
+        print(f"Error: {e}")
+        return
+    except json.JSONDecodeError:
+        print("Error: Failed to parse existing users data JSON file.")
+        return
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error: Failed to store traffic. Details: {e}")
+        return
+    finally:
+        client.close()
+
+    try:
+        users_data = store.load()
+    except json.JSONDecodeError:
+        print("Error: Failed to parse existing users data JSON file.")
+        return
 
     display_traffic_data(users_data, green, cyan, NC)
 
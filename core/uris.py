@@ -0,0 +1,199 @@
+'''
+hy2:// URI, sublink and QR builder.
+
+The server side of a URI (port, pinSHA256 and obfs password from config.json;
+SNI, IP4 and IP6 from .configs.env) is parsed once and cached until one of the
+files changes (mtime/size), so building a URI is a dict lookup plus string
+formatting. cli.py show-user-uri, the subscription servers and the Telegram
+bot all import this module instead of running show_user_uri.sh.
+'''
+import os
+import io
+import json
+import time
+import threading
+import subprocess
+from typing import NamedTuple
+
+import paths
+from user_index import UserIndex
+
+DEFAULT_SNI = 'bts.com'
+SERVICE_STATUS_TTL = 10
+
+
+class ServerParams(NamedTuple):
+    port: str
+    sha256: str
+    obfs_password: str
+    sni: str
+    ip4: str
+    ip6: str
+
+
+def _stamp(path: str):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        return None
+
+
+def _lookup_ip(version: int) -> str:
+    '''Same fallback as load_hysteria2_ips: ask ip.gs when .configs.env has no address.'''
+    try:
+        return subprocess.check_output(['curl', '-s', f'-{version}', 'ip.gs'], timeout=10).decode().strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+_lock = threading.Lock()
+_params_cache = (None, None)
+_index = None
+_service_cache = {}
+
+
+def server_params() -> ServerParams:
+    global _params_cache
+    stamp = (_stamp(paths.CONFIG_FILE), _stamp(paths.CONFIG_ENV))
+    if stamp == _params_cache[0]:
+        return _params_cache[1]
+
+    with _lock:
+        if stamp == _params_cache[0]:
+            return _params_cache[1]
+
+        with open(paths.CONFIG_FILE, 'r') as f:
+            config = json.load(f)
+        env = paths.read_env_file(paths.CONFIG_ENV)
+
+        ip4 = env.get('IP4', '')
+        ip6 = env.get('IP6', '')
+        if not ip4 or not ip6:
+            ip4 = ip4 or _lookup_ip(4)
+            ip6 = ip6 or _lookup_ip(6)
+
+        params = ServerParams(
+            port=config.get('listen', '').rsplit(':', 1)[-1],
+            sha256=config.get('tls', {}).get('pinSHA256', ''),
+            obfs_password=(config.get('obfs') or {}).get('salamander', {}).get('password', ''),
+            sni=env.get('SNI', DEFAULT_SNI),
+            ip4=ip4,
+            ip6=ip6,
+        )
+        _params_cache = (stamp, params)
+        return params
+
+
+def clear_cache():
+    '''Forgets the cached server parameters, user index and service states.'''
+    global _params_cache, _index
+    with _lock:
+        _params_cache = (None, None)
+    _index = None
+    _service_cache.clear()
+
+
+def build_uri(username: str, password: str, ip_version: int, params: ServerParams | None = None) -> str:
+    params = params or server_params()
+    if ip_version == 4:
+        host = params.ip4
+    elif ip_version == 6:
+        host = f'[{params.ip6}]'
+    else:
+        raise ValueError('Invalid IP version. Use 4 for IPv4 or 6 for IPv6.')
+
+    query = f'pinSHA256={params.sha256}&insecure=1&sni={params.sni}'
+    if params.obfs_password:
+        query = f'obfs=salamander&obfs-password={params.obfs_password}&{query}'
+    return f'hy2://{username}%3A{password}@{host}:{params.port}?{query}#{username}-IPv{ip_version}'
+
+
+def user_index() -> UserIndex:
+    '''The UserIndex shared by the callers of this module.'''
+    global _index
+    if _index is None:
+        _index = UserIndex()
+    return _index
+
+
+def get_user(username: str) -> dict | None:
+    return user_index().get(username)
+
+
+def get_password(username: str) -> str | None:
+    record = get_user(username)
+    return record.get('password') if record else None
+
+
+def user_uris(username: str) -> dict | None:
+    '''Returns {4: uri, 6: uri} for a user, or None if the user does not exist.'''
+    password = get_password(username)
+    if password is None:
+        return None
+    params = server_params()
+    return {version: build_uri(username, password, version, params) for version in (4, 6)}
+
+
+def service_active(service: str) -> bool:
+    '''`systemctl is-active`, remembered for a few seconds.'''
+    now = time.monotonic()
+    cached = _service_cache.get(service)
+    if cached and now - cached[0] < SERVICE_STATUS_TTL:
+        return cached[1]
+    active = subprocess.run(['systemctl', 'is-active', '--quiet', service], stderr=subprocess.DEVNULL).returncode == 0
+    _service_cache[service] = (now, active)
+    return active
+
+
+def _sublink_base(env_file: str) -> str | None:
+    env = paths.read_env_file(env_file)
+    domain = env.get('HYSTERIA_DOMAIN')
+    port = env.get('HYSTERIA_PORT')
+    if not domain or not port:
+        return None
+    return f'https://{domain}:{port}'
+
+
+def _service_base(service: str, env_file: str, check_service: bool) -> str | None:
+    if check_service and not service_active(service):
+        return None
+    return _sublink_base(env_file)
+
+
+def subscription_sublink(username: str, fmt: str | None = None, check_service: bool = True) -> str | None:
+    base = _service_base('subscription.service', paths.SUBSCRIPTION_ENV, check_service)
+    if not base:
+        return None
+    query = f'?format={fmt}' if fmt else ''
+    return f'{base}/sub/{username}{query}#{username}'
+
+
+# The unified subscription service also serves the singbox and normalsub routes,
+# so it stands in for either service when that one is not running
+
+def singbox_sublink(username: str, ip_version: int = 4, check_service: bool = True) -> str | None:
+    base = (_service_base('singbox.service', paths.SINGBOX_ENV, check_service)
+            or _service_base('subscription.service', paths.SUBSCRIPTION_ENV, check_service))
+    return f'{base}/sub/singbox/{username}/{ip_version}#{username}' if base else None
+
+
+def normalsub_sublink(username: str, check_service: bool = True) -> str | None:
+    base = (_service_base('normalsub.service', paths.NORMALSUB_ENV, check_service)
+            or _service_base('subscription.service', paths.SUBSCRIPTION_ENV, check_service))
+    return f'{base}/sub/normal/{username}#Hysteria2' if base else None
+
+
+def qr_png(data: str) -> io.BytesIO:
+    '''PNG of a QR code, ready to be sent by the bot.'''
+    import qrcode
+
+    bio = io.BytesIO()
+    qrcode.make(data).save(bio, 'PNG')
+    bio.seek(0)
+    return bio
+
+
+def qr_terminal(data: str) -> str:
+    '''QR code drawn with UTF-8 blocks, as shown by show-user-uri -qr.'''
+    return subprocess.check_output(['qrencode', '-t', 'UTF8', '-s', '3', '-m', '2', data]).decode()
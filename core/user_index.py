@@ -0,0 +1,170 @@
+'''
+In-memory view of the user store for long-running services.
+
+The snapshot is rebuilt only when the store reports a change (users.json
+mtime/size, or the SQLite data_version), so lookups cost a stat() or a pragma
+plus a dict access instead of spawning jq for every field.
+
+The configs sold by the Telegram bot are named {telegram id}d{YYYYmmddHHMMSS};
+each snapshot also maps the Telegram IDs to their configs, so a customer's
+configs and the broadcast audiences are found without scanning every user.
+'''
+import re
+import time
+import bisect
+import threading
+from collections import OrderedDict
+
+import storage
+from storage import record_expiry
+
+CONFIG_NAME = re.compile(r'^(\d+)d\d{14}$')
+GRAM = 3
+SEARCH_CACHE_SIZE = 256
+SEARCH_CACHE_SECONDS = 30
+
+
+def config_owner(username: str) -> int | None:
+    '''Telegram ID of the customer a bot config belongs to, None for other users.'''
+    match = CONFIG_NAME.match(username)
+    return int(match.group(1)) if match else None
+
+
+def is_expired(record: dict, now: float | None = None) -> bool:
+    if record.get('blocked') is True:
+        return True
+    expires_at = record_expiry(record)
+    return expires_at is not None and expires_at <= (time.time() if now is None else now)
+
+
+class UserIndex:
+    def __init__(self, store=None):
+        self._store = store
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._users = {}
+        # telegram id -> config usernames, in store order
+        self._owners = {}
+        self.version = 0
+
+    @property
+    def store(self):
+        return self._store or storage.get_store()
+
+    def _refresh(self):
+        with self._lock:
+            store = self.store
+            stamp = (store.engine, store.stamp())
+            if stamp == self._stamp:
+                return
+            try:
+                users = store.load()
+            except (OSError, ValueError):
+                # A writer may be halfway through replacing the file; keep
+                # serving the previous snapshot and retry on the next call.
+                return
+            owners = {}
+            for username, record in users.items():
+                owner = config_owner(username)
+                # Entries without a password only hold traffic counters
+                if owner is not None and 'password' in record:
+                    owners.setdefault(owner, []).append(username)
+            self._users = users
+            self._owners = owners
+            self._stamp = stamp
+            self.version += 1
+
+    def get(self, username: str) -> dict | None:
+        self._refresh()
+        return self._users.get(username)
+
+    def expires_at(self, username: str) -> int | None:
+        record = self.get(username)
+        return record_expiry(record) if record else None
+
+    def users(self) -> dict:
+        self._refresh()
+        return self._users
+
+    def owned_by(self, telegram_id: int) -> dict:
+        '''{username: record} of the configs of a Telegram user.'''
+        self._refresh()
+        users = self._users
+        return {name: users[name] for name in self._owners.get(int(telegram_id), ()) if name in users}
+
+    def owners(self, state: str | None = None) -> list[int]:
+        '''
+        Telegram IDs owning a config; with state "active" or "expired" only
+        those owning at least one config in that state (blocked counts as expired).
+        '''
+        self._refresh()
+        if state is None:
+            return list(self._owners)
+        users, now = self._users, time.time()
+        want_expired = state == 'expired'
+        return [
+            owner for owner, names in self._owners.items()
+            if any(name in users and is_expired(users[name], now) == want_expired for name in names)
+        ]
+
+
+class UsernameSearch:
+    '''
+    Case-insensitive substring search over the usernames of a UserIndex,
+    rebuilt when its snapshot changes. Prefix matches come first, from a
+    sorted array, followed by the other matches, found through an index of
+    the 3-grams of every name. Results are cached for SEARCH_CACHE_SECONDS.
+    '''
+
+    def __init__(self, index: UserIndex):
+        self.index = index
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = []  # sorted lower-cased usernames
+        self._names = []  # usernames, in the order of _keys
+        self._grams = {}  # 3-gram -> positions in _keys
+        self._cache = OrderedDict()  # query -> (time, matches)
+
+    def _refresh(self):
+        users = self.index.users()
+        version = self.index.version
+        if version == self._version:
+            return
+        entries = sorted((name.lower(), name) for name, record in users.items() if 'password' in record)
+        grams = {}
+        for position, (key, _) in enumerate(entries):
+            for gram in {key[i:i + GRAM] for i in range(len(key) - GRAM + 1)}:
+                grams.setdefault(gram, []).append(position)
+        self._keys = [key for key, _ in entries]
+        self._names = [name for _, name in entries]
+        self._grams = grams
+        self._cache.clear()
+        self._version = version
+
+    def _match(self, query: str) -> list[str]:
+        keys, names = self._keys, self._names
+        start = bisect.bisect_left(keys, query)
+        end = bisect.bisect_left(keys, query + '\uffff', start)
+        matches = names[start:end]
+        if len(query) < GRAM:
+            positions = range(len(keys))
+        else:
+            # The names holding every 3-gram of the query, rarest first
+            candidates = sorted((self._grams.get(query[i:i + GRAM], []) for i in range(len(query) - GRAM + 1)), key=len)
+            positions = sorted(set(candidates[0]).intersection(*candidates[1:]))
+        matches.extend(names[i] for i in positions if not start <= i < end and query in keys[i])
+        return matches
+
+    def search(self, query: str) -> list[str]:
+        query = query.strip().lower()
+        with self._lock:
+            self._refresh()
+            cached = self._cache.get(query)
+            if cached is not None and time.monotonic() - cached[0] < SEARCH_CACHE_SECONDS:
+                self._cache.move_to_end(query)
+                return cached[1]
+            matches = self._match(query)
+            self._cache[query] = (time.monotonic(), matches)
+            if len(self._cache) > SEARCH_CACHE_SIZE:
+                self._cache.popitem(last=False)
+            return matches
@@ -0,0 +1,347 @@
+'''
+In-process user management API for long-running callers such as the Telegram bot.
+
+The same operations as the user commands of cli.py (list, get, add, edit,
+reset, remove, URIs and server info) run directly against the active storage
+engine and return dataclasses instead of printed text, so a caller neither
+forks `cli.py` -> bash -> jq nor parses output. Failures raise UserError with
+the message the CLI would print.
+'''
+import os
+import re
+import time
+import string
+import secrets
+import subprocess
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import paths
+import storage
+import traffic
+import uris
+from user_index import UsernameSearch
+
+GB = 1073741824
+PASSWORD_LENGTH = 32
+USERNAME_PATTERN = re.compile(r'^[a-zA-Z0-9]+$')
+SEARCH_PAGE_SIZE = 50  # most results Telegram accepts in one inline answer
+RESTART_SCRIPT = os.path.join(paths.SCRIPT_DIR, 'hysteria2', 'restart.sh')
+CPU_SAMPLE_SECONDS = 0.5
+
+
+class UserError(Exception):
+    pass
+
+
+class UserNotFound(UserError):
+    pass
+
+
+@dataclass(frozen=True)
+class User:
+    username: str
+    password: str
+    max_download_bytes: int
+    expiration_days: int
+    account_creation_date: str
+    blocked: bool
+    expires_at: int | None = None
+    upload_bytes: int | None = None
+    download_bytes: int | None = None
+    status: str | None = None
+
+    @classmethod
+    def from_record(cls, username: str, record: dict) -> 'User':
+        return cls(
+            username=username,
+            password=record.get('password', ''),
+            max_download_bytes=int(record.get('max_download_bytes') or 0),
+            expiration_days=int(record.get('expiration_days') or 0),
+            account_creation_date=record.get('account_creation_date', ''),
+            blocked=record.get('blocked') is True,
+            expires_at=storage.record_expiry(record),
+            upload_bytes=record.get('upload_bytes'),
+            download_bytes=record.get('download_bytes'),
+            status=record.get('status'),
+        )
+
+    @property
+    def traffic_limit_gb(self) -> float:
+        return self.max_download_bytes / GB
+
+    @property
+    def used_bytes(self) -> int:
+        return (self.upload_bytes or 0) + (self.download_bytes or 0)
+
+    @property
+    def remaining_days(self) -> int:
+        if self.expires_at is None:
+            return 0
+        return max(0, -(-(self.expires_at - int(time.time())) // 86400))
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= time.time()
+
+
+@dataclass(frozen=True)
+class UserUris:
+    ipv4: str
+    ipv6: str
+    singbox: str | None
+    normalsub: str | None
+    subscription: str | None
+
+
+@dataclass(frozen=True)
+class ServerInfo:
+    cpu_percent: float
+    total_ram_mb: int
+    used_ram_mb: int
+    online_users: int | None  # None when the traffic API is unreachable
+    upload_bytes: int
+    download_bytes: int
+
+
+# region utils
+def generate_password() -> str:
+    '''Same alphabet as `pwgen -s 32 1`.'''
+    alphabet = string.ascii_letters + string.digits
+    return ''.join(secrets.choice(alphabet) for _ in range(PASSWORD_LENGTH))
+
+
+def validate_username(username: str):
+    if not USERNAME_PATTERN.match(username or ''):
+        raise UserError('Error: Username can only contain letters and numbers.')
+
+
+def validate_date(creation_date: str):
+    try:
+        datetime.strptime(creation_date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise UserError('Invalid date. Please provide a valid date in YYYY-MM-DD format.')
+
+
+def restart_hysteria():
+    '''Same as `cli.py restart-hysteria2`; returns its output.'''
+    result = subprocess.run(['bash', RESTART_SCRIPT], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return result.stdout.decode().strip()
+
+# endregion
+
+
+# region users
+def list_users() -> dict[str, User]:
+    # Entries without a password only hold traffic counters of unknown users
+    return {
+        username: User.from_record(username, record)
+        for username, record in storage.get_store().load().items()
+        if 'password' in record
+    }
+
+
+def get_user(username: str) -> User | None:
+    record = storage.get_store().get(username)
+    return User.from_record(username, record) if record and 'password' in record else None
+
+
+def find_user(username: str) -> User | None:
+    '''Case-insensitive get_user(), for names typed by a person.'''
+    found = storage.get_store().find(username)
+    if found is None or 'password' not in found[1]:
+        return None
+    return User.from_record(*found)
+
+
+def _require(username: str) -> User:
+    user = get_user(username)
+    if user is None:
+        raise UserNotFound(f"Error: User '{username}' not found.")
+    return user
+
+
+def add_user(username: str, traffic_limit_gb: int, expiration_days: int, password: str | None = None, creation_date: str | None = None) -> User:
+    validate_username(username)
+    creation_date = creation_date or datetime.now().strftime('%Y-%m-%d')
+    validate_date(creation_date)
+
+    username = username.lower()
+    try:
+        storage.get_store().add(username, {
+            'password': password or generate_password(),
+            'max_download_bytes': int(traffic_limit_gb) * GB,
+            'expiration_days': int(expiration_days),
+            'account_creation_date': creation_date,
+            'blocked': False,
+        })
+    except ValueError:
+        raise UserError('User already exists.')
+    return _require(username)
+
+
+def edit_user(username: str, new_username: str | None = None, traffic_limit_gb: int | None = None,
+              expiration_days: int | None = None, renew_password: bool = False, renew_creation_date: bool = False,
+              blocked: bool | None = None, restart: bool = True) -> User:
+    '''
+    Applies the given changes; arguments left as None keep their value.
+    Restarts hysteria-server afterwards like `cli.py edit-user`, unless restart is False.
+    '''
+    if new_username:
+        validate_username(new_username)
+    if traffic_limit_gb is not None and traffic_limit_gb <= 0:
+        raise UserError('Error: traffic limit must be greater than 0')
+    if expiration_days is not None and expiration_days <= 0:
+        raise UserError('Error: expiration days must be greater than 0')
+
+    changes = {}
+    if traffic_limit_gb is not None:
+        changes['max_download_bytes'] = int(traffic_limit_gb) * GB
+    if expiration_days is not None:
+        changes['expiration_days'] = int(expiration_days)
+    if renew_password:
+        changes['password'] = generate_password()
+    if renew_creation_date:
+        changes['account_creation_date'] = datetime.now().strftime('%Y-%m-%d')
+    if blocked is not None:
+        changes['blocked'] = blocked
+
+    try:
+        storage.get_store().update(username, changes, new_username=new_username)
+    except KeyError:
+        raise UserNotFound(f"Error: User '{username}' not found.")
+    except ValueError:
+        raise UserError(f"Error: User '{new_username}' already exists.")
+
+    if restart:
+        restart_hysteria()
+    return _require(new_username or username)
+
+
+def reset_user(username: str) -> User:
+    '''Clears the traffic counters and restarts the expiration period from today.'''
+    try:
+        storage.get_store().update(username, {
+            'upload_bytes': 0,
+            'download_bytes': 0,
+            'status': 'Offline',
+            'account_creation_date': datetime.now().strftime('%Y-%m-%d'),
+            'blocked': False,
+        })
+    except KeyError:
+        raise UserNotFound(f"Error: User '{username}' not found.")
+    return _require(username)
+
+
+def remove_user(username: str):
+    if not storage.get_store().remove(username):
+        raise UserNotFound(f'Error: User {username} not found.')
+
+
+def config_username(telegram_id: int, taken=()) -> str:
+    '''
+    Name of a new config sold to a Telegram user, see user_index.config_owner().
+    Skips the names of existing users and `taken`, one second at a time.
+    '''
+    moment = datetime.now()
+    while True:
+        username = f"{telegram_id}d{moment.strftime('%Y%m%d%H%M%S')}"
+        if username not in taken and get_user(username) is None:
+            return username
+        moment += timedelta(seconds=1)
+
+
+def user_configs(telegram_id: int) -> list[User]:
+    '''Configs of a Telegram user, from the user index.'''
+    return [User.from_record(username, record) for username, record in uris.user_index().owned_by(telegram_id).items()]
+
+
+def config_owners(state: str | None = None) -> list[int]:
+    '''Telegram IDs owning a config, optionally only with an "active" or "expired" one.'''
+    return uris.user_index().owners(state)
+
+
+_search = None
+
+
+def search_users(query: str, offset: int = 0, limit: int = SEARCH_PAGE_SIZE) -> tuple[list[User], int | None]:
+    '''
+    One page of the users whose name contains `query`, prefix matches first,
+    and the offset of the next page (None on the last one).
+    '''
+    global _search
+    index = uris.user_index()
+    if _search is None or _search.index is not index:
+        _search = UsernameSearch(index)
+    matches = _search.search(query)
+    page = [User.from_record(name, record) for name in matches[offset:offset + limit] if (record := index.get(name))]
+    return page, offset + limit if offset + limit < len(matches) else None
+
+
+def user_uris(username: str) -> UserUris | None:
+    '''hy2:// URIs and the sublinks of the running subscription services, or None for an unknown user.'''
+    links = uris.user_uris(username)
+    if links is None:
+        return None
+    return UserUris(
+        ipv4=links[4],
+        ipv6=links[6],
+        singbox=uris.singbox_sublink(username, 4),
+        normalsub=uris.normalsub_sublink(username),
+        subscription=uris.subscription_sublink(username),
+    )
+
+# endregion
+
+
+# region server
+def _cpu_times() -> tuple[int, int]:
+    with open('/proc/stat', 'r') as f:
+        fields = [int(value) for value in f.readline().split()[1:]]
+    # idle + iowait
+    return sum(fields), fields[3] + fields[4]
+
+
+def cpu_percent(interval: float = CPU_SAMPLE_SECONDS) -> float:
+    total_before, idle_before = _cpu_times()
+    time.sleep(interval)
+    total_after, idle_after = _cpu_times()
+    total = total_after - total_before
+    return round(100 * (1 - (idle_after - idle_before) / total), 1) if total else 0.0
+
+
+def memory_mb() -> tuple[int, int]:
+    '''(total, used) like `free -m`.'''
+    meminfo = {}
+    with open('/proc/meminfo', 'r') as f:
+        for line in f:
+            key, value = line.split(':', 1)
+            meminfo[key] = int(value.split()[0])
+    total = meminfo['MemTotal']
+    available = meminfo.get('MemAvailable', meminfo['MemFree'])
+    return total // 1024, (total - available) // 1024
+
+
+def online_users() -> int | None:
+    client = traffic.TrafficClient()
+    try:
+        return sum(client.online().values())
+    except traffic.TrafficApiError:
+        return None
+    finally:
+        client.close()
+
+
+def server_info() -> ServerInfo:
+    total_ram, used_ram = memory_mb()
+    records = storage.get_store().load().values()
+    return ServerInfo(
+        cpu_percent=cpu_percent(),
+        total_ram_mb=total_ram,
+        used_ram_mb=used_ram,
+        online_users=online_users(),
+        upload_bytes=sum(record.get('upload_bytes') or 0 for record in records),
+        download_bytes=sum(record.get('download_bytes') or 0 for record in records),
+    )
+
+# endregion
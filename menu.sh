@@ -258,14 +258,18 @@ hysteria2_show_user_uri_handler() {
 
     flags=""
     
-    if check_service_active "singbox.service"; then
+    if check_service_active "singbox.service" || check_service_active "subscription.service"; then
         flags+=" -s"
     fi
 
-    if check_service_active "normalsub.service"; then
+    if check_service_active "normalsub.service" || check_service_active "subscription.service"; then
         flags+=" -n"
     fi
 
+    if check_service_active "subscription.service"; then
+        flags+=" -sub"
+    fi
+
     if [[ -n "$flags" ]]; then
         python3 $CLI_PATH show-user-uri -u "$username" -a -qr $flags
     else
@@ -302,6 +306,10 @@ hysteria2_change_sni_handler() {
     if systemctl is-active --quiet singbox.service; then
         systemctl restart singbox.service
     fi
+
+    if systemctl is-active --quiet subscription.service; then
+        systemctl restart subscription.service
+    fi
 }
 
 edit_ips() {
@@ -7,11 +7,16 @@ FILES=(
     "/etc/hysteria/ca.key"
     "/etc/hysteria/ca.crt"
     "/etc/hysteria/users.json"
+    "/etc/hysteria/users.db"
     "/etc/hysteria/config.json"
     "/etc/hysteria/.configs.env"
     "/etc/hysteria/core/scripts/telegrambot/.env"
     "/etc/hysteria/core/scripts/singbox/.env"
     "/etc/hysteria/core/scripts/normalsub/.env"
+    "/etc/hysteria/core/scripts/subscription/.env"
+    "/etc/hysteria/core/scripts/auth/.env"
+    "/etc/hysteria/core/scripts/traffic/.env"
+    "/etc/hysteria/core/scripts/traffic/pending.json"
     "/etc/hysteria/core/scripts/telegrambot/payments.json"
     "/etc/hysteria/core/scripts/telegrambot/plans.json"
     "/etc/hysteria/test_mode.json"
@@ -21,12 +26,22 @@ FILES=(
     "/etc/hysteria/core/scripts/telegrambot/test_configs.json"
 )
 
+if systemctl is-active --quiet hysteria-traffic.service; then
+    # Stopping flushes the collected traffic and leaves pending.json only if that failed
+    systemctl stop hysteria-traffic.service
+fi
+
 echo "Backing up and Stopping all cron jobs"
 crontab -l > /tmp/crontab_backup
 crontab -r
 
+if [ -f /etc/hysteria/users.db ]; then
+    sqlite3 /etc/hysteria/users.db "PRAGMA wal_checkpoint(TRUNCATE);" > /dev/null
+fi
+
 echo "Backing up files to $TEMP_DIR"
 for FILE in "${FILES[@]}"; do
+    [ -f "$FILE" ] || continue
     mkdir -p "$TEMP_DIR/$(dirname "$FILE")"
     cp "$FILE" "$TEMP_DIR/$FILE"
 done
@@ -43,6 +58,7 @@ wget -O /etc/hysteria/geoip.dat https://raw.githubusercontent.com/Chocolate4U/Ir
 
 echo "Restoring backup files"
 for FILE in "${FILES[@]}"; do
+    [ -f "$TEMP_DIR/$FILE" ] || continue
     cp "$TEMP_DIR/$FILE" "$FILE"
 done
 
@@ -72,6 +88,9 @@ echo "Setting ownership and permissions"
 chown hysteria:hysteria /etc/hysteria/ca.key /etc/hysteria/ca.crt
 chmod 640 /etc/hysteria/ca.key /etc/hysteria/ca.crt
 chown -R hysteria:hysteria /etc/hysteria/core/scripts/singbox
+if [ -d /etc/hysteria/core/scripts/subscription ]; then
+    chown -R hysteria:hysteria /etc/hysteria/core/scripts/subscription
+fi
 chown -R hysteria:hysteria /etc/hysteria/core/scripts/telegrambot
 
 echo "Setting execute permissions for user.sh and kick.sh"
@@ -84,9 +103,18 @@ source /etc/hysteria/hysteria2_venv/bin/activate
 pip install -r requirements.txt
 
 echo "Restarting hysteria services"
+if [ -f /etc/hysteria/core/scripts/auth/.env ]; then
+    systemctl restart hysteria-auth.service
+fi
+if [ -f /etc/hysteria/core/scripts/traffic/.env ]; then
+    systemctl restart hysteria-traffic.service
+fi
 systemctl restart hysteria-server.service
 systemctl restart hysteria-bot.service
 systemctl restart singbox.service
+if [ -f /etc/hysteria/core/scripts/subscription/.env ]; then
+    systemctl restart subscription.service
+fi
 
 echo "Checking hysteria-server.service status"
 if systemctl is-active --quiet hysteria-server.service; then